@@ -0,0 +1,108 @@
+import os
+import sys
+
+# add parent dir to path to access webrecorder package
+wr_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, wr_path)
+
+from argparse import ArgumentParser
+from redis import StrictRedis
+
+from webrecorder.models.cdxjcodec import CDXJCodec
+from webrecorder.utils import redis_pipeline
+
+
+# ============================================================================
+# Convert existing recording and collection cdxj indexes to the compact
+# encoding (or back to plain cdxj with --decode).
+# Members are replaced in chunks, lines added while converting are not changed.
+# Set cdxj_compact in wr.yaml first, or new lines will be added uncompacted.
+class CDXJMigrator(object):
+    def __init__(self, redis, decode=False, dry_run=False, chunk_size=1000):
+        self.redis = redis
+        self.codec = CDXJCodec(redis)
+        self.decode = decode
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size
+
+    def migrate_all(self, coll=None):
+        total_before = 0
+        total_after = 0
+
+        for key, coll_id in self.iter_keys(coll):
+            before, after = self.migrate_key(key, coll_id)
+            total_before += before
+            total_after += after
+
+        print('Total: {0} -> {1} bytes'.format(total_before, total_after))
+        return total_before, total_after
+
+    def iter_keys(self, coll=None):
+        colls = [coll] if coll else self.iter_colls()
+
+        for coll_id in colls:
+            yield 'c:{0}:cdxj'.format(coll_id), coll_id
+
+            for rec in self.redis.smembers('c:{0}:recs'.format(coll_id)):
+                yield 'r:{0}:cdxj'.format(rec), coll_id
+
+    def iter_colls(self):
+        for key in self.redis.scan_iter('c:*:info', count=1000):
+            yield key.split(':')[1]
+
+    def migrate_key(self, key, coll):
+        if not self.redis.exists(key):
+            return 0, 0
+
+        members = self.redis.zrange(key, 0, -1)
+
+        before = 0
+        after = 0
+        count = 0
+
+        for i in range(0, len(members), self.chunk_size):
+            old_members = []
+            new_members = []
+
+            for member in members[i:i + self.chunk_size]:
+                line = self.codec.decode(coll, member)
+                if not self.decode:
+                    line = self.codec.encode(coll, line)
+
+                before += len(member.encode('utf-8'))
+                after += len(line.encode('utf-8'))
+
+                if line != member:
+                    old_members.append(member)
+                    new_members.append(line)
+
+            if not old_members or self.dry_run:
+                continue
+
+            with redis_pipeline(self.redis) as pi:
+                pi.zrem(key, *old_members)
+                pi.zadd(key, *[val for member in new_members for val in (0, member)])
+
+            count += len(new_members)
+
+        print('{0}: {1} of {2} lines converted, {3} -> {4} bytes'.format(key, count, len(members), before, after))
+        return before, after
+
+
+# ============================================================================
+def main(args=None):
+    parser = ArgumentParser(description='Convert cdxj indexes in redis to or from the compact encoding')
+    parser.add_argument('--coll', help='collection id, all collections if not set')
+    parser.add_argument('--decode', action='store_true', help='convert back to plain cdxj')
+    parser.add_argument('--dry-run', action='store_true', help='only report size change')
+
+    r = parser.parse_args(args=args)
+
+    redis = StrictRedis.from_url(os.environ['REDIS_BASE_URL'], decode_responses=True)
+
+    migrator = CDXJMigrator(redis, decode=r.decode, dry_run=r.dry_run)
+    migrator.migrate_all(r.coll)
+
+
+if __name__ == '__main__':
+    main()
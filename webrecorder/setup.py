@@ -110,6 +110,7 @@ setup(
         'WebTest',
         'pytest-cov',
         'fakeredis',
+        'lupa',
         'mock',
         'responses',
         'httpbin==0.5.0',
@@ -0,0 +1,111 @@
+from gevent import monkey; monkey.patch_all()
+
+# Benchmark: replay index lookup latency with and without the lookup cache,
+# for a skewed (zipf) mix of urls from a collection replayed over and over
+#
+# usage: python test/bench_cdx_cache.py [num urls] [num lookups]
+#
+# uses redis at REDIS_BASE_URL if set, otherwise fakeredis
+# (round trips are much more expensive with a real redis)
+
+from fakeredis import FakeStrictRedis
+
+from pywb.warcserver.index.aggregator import SimpleAggregator
+
+from webrecorder.load.cdxcache import CachingIndexSource
+from webrecorder.load.cdxjsource import CommittedCDXJIndexSource, MergedCollIndexSource
+from webrecorder.models.cdxjcodec import CompactRedisIndexSource
+from webrecorder.models.collection import Collection
+from webrecorder.models.recording import Recording
+from webrecorder.utils import load_wr_config
+
+import redis
+import random
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+
+# ============================================================================
+def get_redis():
+    if os.environ.get('REDIS_BASE_URL'):
+        return redis.StrictRedis.from_url(os.environ['REDIS_BASE_URL'], decode_responses=True)
+
+    return FakeStrictRedis(decode_responses=True)
+
+
+def add_index(redis_obj, num_urls):
+    # each url captured a few times
+    for i in range(0, num_urls, 1000):
+        lines = []
+        for x in range(i, min(i + 1000, num_urls)):
+            for ts in range(3):
+                lines.append('com,example)/bench/{0} 2018010100000{1} {{"url": "http://example.com/bench/{0}", "mime": "text/html", "status": "200", "digest": "A6DESOVDZ3WLYF57CS5E4RIC4ARPWRK7", "length": "1214", "offset": "{2}", "filename": "bench.warc.gz"}}'.format(x, ts, x * 1214))
+
+        redis_obj.zadd('c:bench-coll:cdxj', *[val for line in lines for val in (0, line)])
+
+    redis_obj.set('c:bench-coll:cdxj:ready', 1)
+
+
+def run(name, source, urls, num_lookups):
+    aggregator = SimpleAggregator({'local': source})
+
+    times = []
+
+    for url in urls[:num_lookups]:
+        params = {'url': url,
+                  'closest': '20180101000001',
+                  'matchType': 'exact',
+                  'param.coll': 'bench-coll'}
+
+        start = time.time()
+        cdx_iter, errs = aggregator(params)
+        cdx_list = list(cdx_iter)
+        times.append(time.time() - start)
+
+        assert cdx_list
+
+    times.sort()
+    mean = sum(times) / len(times)
+
+    print('{0}: mean {1:.3f}ms, p50 {2:.3f}ms, p99 {3:.3f}ms'.format(name,
+                                                                    mean * 1000,
+                                                                    times[len(times) // 2] * 1000,
+                                                                    times[int(len(times) * 0.99)] * 1000))
+
+
+if __name__ == '__main__':
+    num_urls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    num_lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+
+    config = load_wr_config()
+
+    redis_obj = get_redis()
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        add_index(redis_obj, num_urls)
+
+        # a few hundred urls requested most of the time
+        rand = random.Random(42)
+        urls = ['http://example.com/bench/{0}'.format(min(int(rand.paretovariate(1.2)) - 1, num_urls - 1))
+                for x in range(num_lookups)]
+
+        rec_source = CommittedCDXJIndexSource(CompactRedisIndexSource(redis=redis_obj, key_template=Recording.CDXJ_KEY),
+                                              temp_dir, config)
+
+        coll_source = MergedCollIndexSource(rec_source,
+                                            CompactRedisIndexSource(redis=redis_obj, key_template=Collection.COLL_CDXJ_KEY))
+
+        cached_source = CachingIndexSource(coll_source, Collection.COLL_CDXJ_KEY, redis_obj, config)
+
+        run('no cache', coll_source, urls, num_lookups)
+        run('cache', cached_source, urls, num_lookups)
+
+        print('hit ratio: {0:.1%}'.format(cached_source.hit_ratio()))
+
+    finally:
+        shutil.rmtree(temp_dir)
+        redis_obj.delete('c:bench-coll:cdxj', 'c:bench-coll:cdxj:ready')
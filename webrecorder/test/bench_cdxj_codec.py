@@ -0,0 +1,107 @@
+# Benchmark: redis memory used by plain vs. compact cdxj indexes,
+# and time to decode compact members
+#
+# usage: python test/bench_cdxj_codec.py [cdxj or warc files]
+#
+# with no files, indexes the warcs in test/warcs. For a real collection,
+# pass its committed index files (or its exported cdxj)
+#
+# uses redis at REDIS_BASE_URL if set, with MEMORY USAGE for zset size,
+# otherwise fakeredis, with the total size of the members
+
+from fakeredis import FakeStrictRedis
+
+from pywb.indexer.cdxindexer import write_cdx_index
+
+from webrecorder.models.cdxjcodec import CDXJCodec
+
+from io import BytesIO
+
+import redis
+import glob
+import time
+import sys
+import os
+
+
+# ============================================================================
+def get_redis():
+    if os.environ.get('REDIS_BASE_URL'):
+        return redis.StrictRedis.from_url(os.environ['REDIS_BASE_URL'], decode_responses=True)
+
+    return FakeStrictRedis(decode_responses=True)
+
+
+def load_lines(filenames):
+    lines = []
+
+    for filename in filenames:
+        with open(filename, 'rb') as fh:
+            if filename.endswith('.cdxj'):
+                buff = fh.read()
+            else:
+                out = BytesIO()
+                write_cdx_index(out, fh, os.path.basename(filename), cdxj=True, append_post=True)
+                buff = out.getvalue()
+
+        lines.extend(line.decode('utf-8') for line in buff.splitlines() if line)
+
+    return lines
+
+
+def get_size(redis_obj, key):
+    try:
+        return redis_obj.execute_command('MEMORY USAGE', key, 'SAMPLES', 0)
+    except Exception:
+        return sum(len(member.encode('utf-8')) for member in redis_obj.zrange(key, 0, -1))
+
+
+def add_lines(redis_obj, key, members):
+    redis_obj.delete(key)
+    for i in range(0, len(members), 1000):
+        redis_obj.zadd(key, *[val for member in members[i:i + 1000] for val in (0, member)])
+
+
+if __name__ == '__main__':
+    filenames = sys.argv[1:] or glob.glob(os.path.join(os.path.dirname(__file__), 'warcs', '*.warc*'))
+
+    lines = load_lines(filenames)
+    if not lines:
+        print('No lines')
+        sys.exit(1)
+
+    redis_obj = get_redis()
+    codec = CDXJCodec(redis_obj)
+
+    plain_key = 'c:bench-codec:plain'
+    compact_key = 'c:bench-codec:cdxj'
+
+    try:
+        start = time.time()
+        members = codec.encode_lines('bench-codec', lines, force=True)
+        encode_elapsed = time.time() - start
+
+        num_compact = sum(1 for member in members if CDXJCodec.is_compact(member))
+
+        add_lines(redis_obj, plain_key, lines)
+        add_lines(redis_obj, compact_key, members)
+
+        plain_size = get_size(redis_obj, plain_key)
+        compact_size = get_size(redis_obj, compact_key)
+
+        # per process cache, as in warcserver
+        start = time.time()
+        decoded = list(codec.decode_lines('bench-codec', redis_obj.zrange(compact_key, 0, -1)))
+        decode_elapsed = time.time() - start
+
+        assert sorted(decoded) == sorted(set(lines))
+
+        print('{0} lines, {1} compact'.format(len(lines), num_compact))
+        print('plain:   {0} bytes, {1:.1f} per line'.format(plain_size, plain_size / len(lines)))
+        print('compact: {0} bytes, {1:.1f} per line ({2:.0%} of plain)'.format(compact_size, compact_size / len(lines),
+                                                                             compact_size / plain_size))
+        print('encode: {0:.0f} lines/sec, decode: {1:.0f} lines/sec'.format(len(lines) / encode_elapsed,
+                                                                          len(lines) / decode_elapsed))
+
+    finally:
+        redis_obj.delete(plain_key, compact_key, CDXJCodec.FILES_KEY.format(coll='bench-codec'))
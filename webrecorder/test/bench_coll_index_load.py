@@ -0,0 +1,103 @@
+from gevent import monkey; monkey.patch_all()
+
+# Benchmark: lines per second loading committed recording indexes
+# into a collection index, one ZADD per line vs. chunked ZADDs in pipelines
+#
+# usage: python test/bench_coll_index_load.py [lines per index] [num indexes]
+#
+# uses redis at REDIS_BASE_URL if set, otherwise fakeredis
+# (round trips are much more expensive with a real redis)
+
+from fakeredis import FakeStrictRedis
+
+from webrecorder.models.collection import Collection
+from webrecorder.models.base import BaseAccess
+from webrecorder.utils import load_wr_config
+
+from pywb.utils.loaders import load
+
+import redis
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+
+# ============================================================================
+def get_redis():
+    if os.environ.get('REDIS_BASE_URL'):
+        return redis.StrictRedis.from_url(os.environ['REDIS_BASE_URL'], decode_responses=True)
+
+    return FakeStrictRedis(decode_responses=True)
+
+
+def write_indexes(temp_dir, redis_obj, num_lines, num_recs):
+    recs = []
+
+    for x in range(num_recs):
+        rec = 'bench-rec-{0}'.format(x)
+        filename = os.path.join(temp_dir, rec + '.cdxj')
+
+        with open(filename, 'wt') as fh:
+            for i in range(num_lines):
+                fh.write('com,example)/{0}/{1:08d} 20180101000000 {{"url": "http://example.com/{1}", "mime": "text/html", "status": "200", "digest": "A6DESOVDZ3WLYF57CS5E4RIC4ARPWRK7", "length": "1214", "offset": "{2}", "filename": "{0}.warc.gz"}}\n'.format(rec, i, i * 1214))
+
+        redis_obj.hset('r:{0}:info'.format(rec), Collection.INDEX_FILE_KEY, filename)
+        redis_obj.sadd('c:bench-coll:recs', rec)
+        recs.append(rec)
+
+    return recs
+
+
+def load_per_line(redis_obj, recs):
+    # previous approach: full read, one ZADD per line
+    for rec in recs:
+        filename = redis_obj.hget('r:{0}:info'.format(rec), Collection.INDEX_FILE_KEY)
+        buff = load(filename).read()
+
+        for cdxj_line in buff.splitlines():
+            redis_obj.zadd('c:bench-coll:cdxj', 0, cdxj_line)
+
+
+def load_pipelined(redis_obj, recs):
+    collection = Collection(my_id='bench-coll', redis=redis_obj, access=BaseAccess())
+    collection.sync_coll_index(do_async=False)
+
+
+def run(name, func, redis_obj, recs, total):
+    redis_obj.delete('c:bench-coll:cdxj', 'c:bench-coll:cdxj:ready')
+    Collection.coll_index_ready.clear()
+
+    start = time.time()
+    func(redis_obj, recs)
+    elapsed = time.time() - start
+
+    assert redis_obj.zcard('c:bench-coll:cdxj') == total
+
+    print('{0}: {1} lines in {2:.2f}s, {3:.0f} lines/sec'.format(name, total, elapsed, total / elapsed))
+
+
+if __name__ == '__main__':
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    num_recs = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    config = load_wr_config()
+    config['coll_cdxj_build'] = True
+    Collection.init_props(config)
+
+    redis_obj = get_redis()
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        recs = write_indexes(temp_dir, redis_obj, num_lines, num_recs)
+        total = num_lines * num_recs
+
+        run('per line zadd', load_per_line, redis_obj, recs, total)
+        run('pipelined chunks, {0} at a time'.format(Collection.COLL_CDXJ_LOAD_GREENLETS),
+            load_pipelined, redis_obj, recs, total)
+
+    finally:
+        shutil.rmtree(temp_dir)
+        redis_obj.delete('c:bench-coll:cdxj', 'c:bench-coll:cdxj:ready', 'c:bench-coll:recs',
+                         *['r:bench-rec-{0}:info'.format(x) for x in range(num_recs)])
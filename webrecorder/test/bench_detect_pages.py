@@ -0,0 +1,137 @@
+# Benchmark: page detection on a large recording index, reading the whole
+# index at once (as before) vs. in chunks with prefilter
+#
+# usage: python test/bench_detect_pages.py [num lines] [chunk size]
+#
+# reports lines per second and peak RSS above RSS at start of each run
+# (peak reset with /proc/self/clear_refs, on Linux)
+#
+# uses redis at REDIS_BASE_URL if set, otherwise fakeredis
+# (fakeredis sorts the whole zset on each range, so chunked reads are slow there)
+
+from fakeredis import FakeStrictRedis
+
+from pywb.warcserver.index.cdxobject import CDXObject
+
+from webrecorder.models.importer import BaseImporter
+from webrecorder.models.cdxjcodec import CDXJCodec
+from webrecorder.utils import load_wr_config
+
+import resource
+import redis
+import time
+import gc
+import sys
+import os
+
+
+# ============================================================================
+MIMES = ['text/html', 'image/png', 'image/jpeg', 'application/javascript', 'text/css',
+         'text/html', 'image/gif', 'application/json', 'text/plain', 'font/woff2']
+
+STATUS = ['200', '200', '200', '200', '304', '404', '302', '200', '-', '200']
+
+
+def get_redis():
+    if os.environ.get('REDIS_BASE_URL'):
+        return redis.StrictRedis.from_url(os.environ['REDIS_BASE_URL'], decode_responses=True)
+
+    return FakeStrictRedis(decode_responses=True)
+
+
+def add_index(redis_obj, key, num_lines):
+    for i in range(0, num_lines, 10000):
+        lines = []
+        for x in range(i, min(i + 10000, num_lines)):
+            lines.append('com,example)/bench/{0} 20180101000000 {{"url": "http://example.com/bench/{0}", "mime": "{1}", "status": "{2}", "digest": "A6DESOVDZ3WLYF57CS5E4RIC4ARPWRK7", "length": "1214", "offset": "{3}", "filename": "bench.warc.gz"}}'.format(x, MIMES[x % 10], STATUS[(x // 10) % 10], x * 1214))
+
+        redis_obj.zadd(key, *[val for line in lines for val in (0, line)])
+
+
+def detect_pages_all(importer, coll, rec):
+    # previous implementation: whole index in memory, every line parsed
+    key = importer.cdxj_key.format(coll=coll, rec=rec)
+
+    pages = []
+
+    codec = CDXJCodec(importer.redis)
+
+    for member in codec.decode_lines(coll, importer.redis.zrange(key, 0, -1)):
+        cdxj = CDXObject(member.encode('utf-8'))
+
+        if ((not importer.max_detect_pages or len(pages) < importer.max_detect_pages)
+            and importer.is_page(cdxj)):
+            pages.append(dict(url=cdxj['url'],
+                              title=cdxj['url'],
+                              timestamp=cdxj['timestamp']))
+
+    return pages
+
+
+def get_rss_kb(field):
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as fh:
+            fh.write('5')
+    except IOError:
+        pass
+
+
+def run(name, func, num_lines):
+    gc.collect()
+    reset_peak_rss()
+    start_rss = get_rss_kb('VmRSS')
+
+    start = time.time()
+    pages = func()
+    elapsed = time.time() - start
+
+    peak_rss = get_rss_kb('VmHWM')
+
+    print('{0}: {1} pages, {2:.1f}s, {3:.0f} lines/sec, peak RSS +{4:.1f} MB'.format(name,
+                                                                                  len(pages),
+                                                                                  elapsed,
+                                                                                  num_lines / elapsed,
+                                                                                  (peak_rss - start_rss) / 1024))
+
+    return pages
+
+
+if __name__ == '__main__':
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    config = load_wr_config()
+    if len(sys.argv) > 2:
+        config['detect_pages_chunk_size'] = int(sys.argv[2])
+
+    os.environ.setdefault('RECORD_HOST', 'localhost')
+
+    redis_obj = get_redis()
+    importer = BaseImporter(redis_obj, config)
+
+    key = importer.cdxj_key.format(coll='bench-coll', rec='bench-rec')
+
+    try:
+        add_index(redis_obj, key, num_lines)
+
+        all_pages = run('whole index', lambda: detect_pages_all(importer, 'bench-coll', 'bench-rec'), num_lines)
+        pages = run('chunked', lambda: importer.detect_pages('bench-coll', 'bench-rec'), num_lines)
+
+        assert pages == all_pages
+
+        importer.max_detect_pages = 1000
+        run('chunked, max 1000 pages', lambda: importer.detect_pages('bench-coll', 'bench-rec'), num_lines)
+
+    finally:
+        redis_obj.delete(key)
@@ -0,0 +1,107 @@
+# Benchmark: WAMLoader.find_archive_for_url vs. a linear startswith scan,
+# over a list of public web archive replay urls
+#
+# usage: python test/bench_wamloader.py
+
+from webrecorder.load.wamloader import WAMLoader
+
+import timeit
+
+
+REPLAY_URLS = [
+    'https://web.archive.org/web/{timestamp}id_/{url}',
+    'https://perma-archives.org/warc/{timestamp}id_/{url}',
+    'https://wayback.archive-it.org/{collection}/{timestamp}id_/{url}',
+    'http://webarchive.loc.gov/all/{timestamp}id_/{url}',
+    'http://archive.rhizome.org/website/{timestamp}id_/{url}',
+    'https://www.webarchive.org.uk/wayback/archive/{timestamp}id_/{url}',
+    'http://arquivo.pt/wayback/{timestamp}id_/{url}',
+    'http://wayback.vefsafn.is/wayback/{timestamp}id_/{url}',
+    'http://eresources.nlb.gov.sg/webarchives/wayback/{timestamp}id_/{url}',
+    'http://veebiarhiiv.digar.ee/a/{timestamp}id_/{url}',
+    'https://webarchive.nationalarchives.gov.uk/{timestamp}id_/{url}',
+    'http://webarchive.parliament.uk/{timestamp}id_/{url}',
+    'http://webarchive.proni.gov.uk/{timestamp}id_/{url}',
+    'http://collection.europarchive.org/{collection}/{timestamp}id_/{url}',
+    'https://webharvest.gov/{collection}/{timestamp}id_/{url}',
+    'http://padi.cat:8080/wayback/{timestamp}id_/{url}',
+    'http://wayback.webarchiv.cz/wayback/{timestamp}id_/{url}',
+    'http://webarchive.bac-lac.gc.ca:8080/wayback/{timestamp}id_/{url}',
+    'http://archive.is/{timestamp}id_/{url}',
+    'https://swap.stanford.edu/{timestamp}id_/{url}',
+    'http://webarchive.nrscotland.gov.uk/{timestamp}id_/{url}',
+    'http://nukrobi2.nuk.uni-lj.si:8080/wayback/{timestamp}id_/{url}',
+    'http://haw.nsk.hr/wayback/{timestamp}id_/{url}',
+    'http://archive.aueb.gr/wayback/{timestamp}id_/{url}',
+    'http://wayback.library.yorku.ca/{timestamp}id_/{url}',
+    'https://digital.library.yorku.ca/wayback/{timestamp}id_/{url}',
+    'http://webarchive.lib.uci.edu/{timestamp}id_/{url}',
+    'http://archive.library.nd.edu/wayback/{timestamp}id_/{url}',
+    'http://webarchives.cdlib.org/wayback.public/{collection}/{timestamp}id_/{url}',
+    'http://webarchives.bl.uk/wayback/{timestamp}id_/{url}',
+    'http://webarchive.nla.gov.au/gov/{timestamp}id_/{url}',
+    'https://webarchive.natlib.govt.nz/wayback/{timestamp}id_/{url}',
+    'http://archive.kb.dk/wayback/{timestamp}id_/{url}',
+    'http://webarchive.kb.se/wayback/{timestamp}id_/{url}',
+    'http://nettarkivet.nb.no/wayback/{timestamp}id_/{url}',
+    'http://webarchive.onb.ac.at/wayback/{timestamp}id_/{url}',
+    'http://archive.webarchiv.de/wayback/{timestamp}id_/{url}',
+    'http://webarchief.kb.nl/wayback/{timestamp}id_/{url}',
+    'http://archive.bnf.fr/wayback/{timestamp}id_/{url}',
+    'http://webarchiv.bnpt.sk/wayback/{timestamp}id_/{url}',
+]
+
+URLS = [
+    'http://example.com/',
+    'https://www.iana.org/domains/reserved',
+    'http://web.archive.org/web/20180101000000id_/http://example.com/',
+    'https://wayback.archive-it.org/1234/20180101000000id_/http://example.com/',
+    'http://archive.bnf.fr/wayback/20180101000000id_/http://example.com/',
+    'https://cdn.example.com/static/js/bundle.js?v=123',
+]
+
+
+# ============================================================================
+def scan_find_archive_for_url(wam_loader, url):
+    schemeless_url = wam_loader.STRIP_SCHEME.sub('', url)
+    for pk, info in wam_loader.replay_info.items():
+        if schemeless_url.startswith(info['replay_prefix']):
+            orig_url = schemeless_url[len(info['replay_prefix']):]
+            if info.get('parse_collection'):
+                coll, orig_url = orig_url.split('/', 1)
+                id_ = pk + ':' + coll
+            else:
+                id_ = pk
+
+            return pk, orig_url, id_
+
+
+def main():
+    wam_loader = WAMLoader()
+    wam_loader.replay_info = {}
+
+    for i, replay_url in enumerate(REPLAY_URLS):
+        webarchive = {'name': 'Archive {0}'.format(i),
+                      'apis': {'wayback': {'replay': {'raw': replay_url}}}}
+
+        if '{collection}' in replay_url:
+            webarchive['collections'] = '.*'
+
+        wam_loader.load_archive('wa{0}'.format(i), webarchive)
+
+    for url in URLS:
+        assert wam_loader.find_archive_for_url(url) == scan_find_archive_for_url(wam_loader, url)
+
+    number = 20000
+
+    scan = timeit.timeit(lambda: [scan_find_archive_for_url(wam_loader, url) for url in URLS], number=number)
+    compiled = timeit.timeit(lambda: [wam_loader.find_archive_for_url(url) for url in URLS], number=number)
+
+    total = number * len(URLS)
+    print('{0} archives, {1} lookups'.format(len(wam_loader.replay_info), total))
+    print('scan:     {0:.2f} us/lookup'.format(scan * 1000000 / total))
+    print('compiled: {0:.2f} us/lookup'.format(compiled * 1000000 / total))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+from gevent import monkey; monkey.patch_all()
+
+# Benchmark: latency of small requests in the recorder gevent loop
+# while a large capture is digested and compressed,
+# with records written in the write_pool vs. in the gevent loop
+#
+# usage: python test/bench_write_pool.py [large capture size in MB]
+
+from fakeredis import FakeStrictRedis
+
+from warcio.statusandheaders import StatusAndHeaders
+
+from webrecorder.utils import load_wr_config
+from webrecorder.rec.webrecrecorder import SkipCheckingMultiFileWARCWriter
+
+from io import BytesIO
+
+import gevent
+import tempfile
+import time
+import sys
+import os
+
+
+# ============================================================================
+def make_writer(config, write_threads):
+    config = dict(config, write_pool_threads=write_threads)
+
+    return SkipCheckingMultiFileWARCWriter(dir_template=tempfile.mkdtemp() + '/',
+                                           redis=FakeStrictRedis(decode_responses=True),
+                                           key_template='r:{rec}:info',
+                                           config=config)
+
+
+def make_record(writer, size):
+    payload = BytesIO(os.urandom(size))
+    http_headers = StatusAndHeaders('200 OK', [('Content-Type', 'video/mp4'),
+                                               ('Content-Length', str(size))],
+                                    protocol='HTTP/1.1')
+
+    return writer.create_warc_record('http://example.com/video.mp4', 'response',
+                                     payload=payload,
+                                     length=size,
+                                     http_headers=http_headers)
+
+
+def small_requests(latencies, done):
+    # each small request expects to be scheduled again within 5ms
+    while not done:
+        start = time.time()
+        gevent.sleep(0.005)
+        latencies.append(time.time() - start - 0.005)
+
+
+def run(config, write_threads, size):
+    writer = make_writer(config, write_threads)
+    record = make_record(writer, size)
+
+    latencies = []
+    done = []
+    ge = gevent.spawn(small_requests, latencies, done)
+    gevent.sleep(0.05)
+
+    out = tempfile.TemporaryFile()
+
+    start = time.time()
+    writer.run_for_record(record, writer._write_records, out, record, None)
+    elapsed = time.time() - start
+
+    done.append(True)
+    ge.join()
+    out.close()
+    writer.close()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99)]
+
+    print('write_pool_threads={0}: capture {1:.2f}s, small requests: {2}, p50 {3:.1f}ms, p99 {4:.1f}ms'.format(
+          write_threads, elapsed, len(latencies), p50 * 1000, p99 * 1000))
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    config = load_wr_config()
+
+    run(config, 0, size * 1000000)
+    run(config, 2, size * 1000000)
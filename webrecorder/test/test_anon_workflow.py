@@ -28,17 +28,22 @@ from webrecorder.session import Session
 class TestTempContent(FullStackTests):
     REDIS_KEYS = [
         'r:{rec}:cdxj',
+        'r:{rec}:_bf',
         'r:{rec}:open',
         'r:{rec}:info',
         'r:{rec}:wk',
         'r:{rec}:_ps',
         'r:{rec}:_pc',
+        'r:{rec}:p',
         'c:{coll}:warc',
         'c:{coll}:p',
+        'c:{coll}:p_ts',
         'c:{coll}:info',
         'c:{coll}:recs',
         'u:{user}:info',
         'u:{user}:colls',
+        'u:{user}:_qr',
+        'q:commit',
         'h:defaults',
         'h:roles',
         Stats.ALL_CAPTURE_TEMP_KEY,
@@ -54,6 +59,11 @@ class TestTempContent(FullStackTests):
         Stats.DOWNLOADS_TEMP_COUNT_KEY,
      ]
 
+    # only set if a recording was due for commit while running
+    POST_DEL_OPT_KEYS = [
+        Stats.COMMIT_QUEUE_KEY,
+    ]
+
     PAGE_STATS = {'rec': 'r:{rec}:<sesh_id>:stats:{url}',
                   'coll': 'c:{coll}:<sesh_id>:stats:{url}'
                  }
@@ -122,8 +132,9 @@ class TestTempContent(FullStackTests):
             assert self.redis.sismember(actual_rec_list, rec)
             exp_keys.extend(self._get_redis_keys(self.REDIS_KEYS, user, coll, rec))
 
+        exp_keys.append('c:{coll}:cdxj:gen'.format(user=user, coll=coll))
+
         if replay_coll:
-            exp_keys.append('c:{coll}:cdxj'.format(user=user, coll=coll))
             exp_keys.append(Stats.REPLAY_TEMP_KEY)
 
         if self.downloaded:
@@ -242,7 +253,8 @@ class TestTempContent(FullStackTests):
         self._assert_rec_keys(self.anon_user, 'temp', ['my-recording'])
         assert '"food": "bar"' in res.text, res.text
 
-        assert int(self.redis.ttl('c:{coll}:cdxj'.format(coll=coll)) > 0)
+        # replayed from recording indexes, collection index not built
+        assert not self.redis.exists('c:{coll}:cdxj'.format(coll=coll))
 
     def test_anon_record_sanitize_redir(self):
         self.set_uuids('Recording', ['my-rec2'])
@@ -688,7 +700,7 @@ class TestTempContent(FullStackTests):
         sesh_redis.flushdb()
 
         def assert_empty_keys():
-            assert set(self.redis.keys()) == set(self.POST_DEL_KEYS)
+            assert set(self.redis.keys()) - set(self.POST_DEL_OPT_KEYS) == set(self.POST_DEL_KEYS)
             assert glob.glob(os.path.join(self.warcs_dir, 'temp$*')) == []
 
         self.sleep_try(0.1, 10.0, assert_empty_keys)
@@ -0,0 +1,136 @@
+from .testutils import FakeStrictRedis
+
+from webrecorder.models.base import BaseAccess
+from webrecorder.models.user import User
+from webrecorder.models.collection import Collection
+from webrecorder.models.recording import Recording
+from webrecorder.models.list_bookmarks import BookmarkList
+
+
+# ============================================================================
+class CountingRedis(object):
+    def __init__(self, redis):
+        self.redis = redis
+        self.round_trips = 0
+
+    def pipeline(self, *args, **kwargs):
+        pi = self.redis.pipeline(*args, **kwargs)
+        execute = pi.execute
+
+        def counted_execute(*args, **kwargs):
+            self.round_trips += 1
+            return execute(*args, **kwargs)
+
+        pi.execute = counted_execute
+        return pi
+
+    def __getattr__(self, name):
+        func = getattr(self.redis, name)
+
+        def counted(*args, **kwargs):
+            self.round_trips += 1
+            return func(*args, **kwargs)
+
+        return counted
+
+
+# ============================================================================
+class OwnerAccess(BaseAccess):
+    def is_coll_owner(self, collection):
+        return True
+
+    def can_read_list(self, blist):
+        return True
+
+
+# ============================================================================
+class TestBulkLoad(object):
+    NUM_RECS = 1000
+
+    @classmethod
+    def setup_class(cls):
+        cls.base_redis = FakeStrictRedis(decode_responses=True)
+        cls.base_redis.flushdb()
+
+        cls.redis = CountingRedis(cls.base_redis)
+
+        with cls.base_redis.pipeline(transaction=False) as pi:
+            pi.hmset('u:user-a:info', {'max_size': '1000', 'size': '0'})
+            pi.hset('u:user-a:colls', 'my-coll', 'coll-a')
+            pi.hset('u:user-a:colls', 'other-coll', 'coll-b')
+
+            for coll in ('coll-a', 'coll-b'):
+                pi.hmset('c:{0}:info'.format(coll), {'owner': 'user-a', 'slug': coll, 'title': coll,
+                                                     'created_at': '1500000000', 'updated_at': '1500000000'})
+
+            for x in range(cls.NUM_RECS):
+                rec = 'rec-{0}'.format(x)
+                pi.sadd('c:coll-a:recs', rec)
+                pi.hmset('r:{0}:info'.format(rec), {'owner': 'coll-a', 'title': 'Rec ' + str(x),
+                                                    'size': '10',
+                                                    'created_at': '1500000000',
+                                                    'updated_at': '1500000100',
+                                                    'recorded_at': '1500000060'})
+                if x % 10 == 0:
+                    pi.sadd('r:{0}:ra'.format(rec), 'ia')
+
+            for x in range(3):
+                pi.zadd('c:coll-a:lists', 1024 * (x + 1), 'blist-' + str(x))
+                pi.hmset('l:blist-{0}:info'.format(x), {'owner': 'coll-a', 'title': 'List ' + str(x)})
+
+            pi.execute()
+
+    def setup_method(self):
+        self.redis.round_trips = 0
+
+    def get_collection(self):
+        return Collection(my_id='coll-a', redis=self.redis, access=OwnerAccess())
+
+    def test_get_recordings(self):
+        recordings = self.get_collection().get_recordings()
+
+        assert len(recordings) == self.NUM_RECS
+        assert all(recording.loaded for recording in recordings)
+        assert recordings[0].get_prop('size') == 10
+
+        # smembers + info pipeline
+        assert self.redis.round_trips == 2
+
+    def test_get_recordings_fields(self):
+        recordings = self.get_collection().get_recordings(fields=['title', 'size', 'missing'])
+
+        recording = recordings[0]
+        assert recording.loaded == False
+        assert recording.data['size'] == 10
+        assert recording.get_prop('title').startswith('Rec ')
+        assert self.redis.round_trips == 2
+
+        # not loaded fields read as needed
+        assert recording.get_prop('recorded_at') == '1500000060'
+        assert self.redis.round_trips == 3
+
+    def test_get_lists(self):
+        lists = self.get_collection().get_lists()
+
+        assert [blist['title'] for blist in lists] == ['List 0', 'List 1', 'List 2']
+        assert self.redis.round_trips == 2
+
+    def test_get_collections(self):
+        user = User(my_id='user-a', redis=self.redis, access=BaseAccess())
+        collections = user.get_collections()
+
+        assert sorted(coll['title'] for coll in collections) == ['coll-a', 'coll-b']
+        assert all(coll.loaded for coll in collections)
+        assert self.redis.round_trips == 2
+
+    def test_serialize_collection(self):
+        data = self.get_collection().serialize()
+
+        assert len(data['recordings']) == self.NUM_RECS
+        assert len(data['lists']) == 3
+        assert data['duration'] == 60 * self.NUM_RECS
+
+        assert sum(1 for rec in data['recordings'] if rec['ra_sources'] == ['ia']) == self.NUM_RECS / 10
+
+        # round trips independent of number of recordings
+        assert self.redis.round_trips <= 20
@@ -0,0 +1,101 @@
+from .testutils import FakeStrictRedis
+
+from pywb.warcserver.index.indexsource import BaseIndexSource
+from pywb.warcserver.index.cdxobject import CDXObject
+
+from webrecorder.load.cdxcache import CachingIndexSource
+from webrecorder.models.collection import Collection
+
+
+# ============================================================================
+class CountingSource(BaseIndexSource):
+    def __init__(self, lines):
+        self.lines = lines
+        self.loads = 0
+
+    def load_index(self, params):
+        self.loads += 1
+        return (CDXObject(line) for line in self.lines
+                if params['key'] <= line < params['end_key'])
+
+
+# ============================================================================
+class TestCDXCache(object):
+    @classmethod
+    def setup_class(cls):
+        cls.redis = FakeStrictRedis(decode_responses=True)
+
+        cls.lines = [('com,example)/{0} 2018010100000{1} {{"url": "http://example.com/{0}", "filename": "rec.warc.gz"}}'.format(x, y)).encode('utf-8')
+                     for x in range(5) for y in range(3)]
+
+    def get_source(self, max_entries=3, max_lines=5):
+        source = CountingSource(self.lines)
+        config = {'cdx_cache_max_entries': max_entries,
+                  'cdx_cache_max_lines': max_lines}
+
+        return source, CachingIndexSource(source, Collection.COLL_CDXJ_KEY, self.redis, config)
+
+    def lookup(self, cached, path, coll='coll-a'):
+        params = {'param.coll': coll,
+                  'key': 'com,example)/{0} '.format(path).encode('utf-8'),
+                  'end_key': 'com,example)/{0}!'.format(path).encode('utf-8')}
+
+        return [cdx.to_text() for cdx in cached.load_index(params)]
+
+    def test_hit_and_invalidate(self):
+        source, cached = self.get_source()
+
+        res = self.lookup(cached, 1)
+        assert len(res) == 3
+
+        assert self.lookup(cached, 1) == res
+        assert self.lookup(cached, 1, coll='coll-b') == res
+        assert source.loads == 2
+
+        # new cdx objects for each lookup
+        cdx = next(cached.load_index({'param.coll': 'coll-a', 'key': b'com,example)/1 ', 'end_key': b'com,example)/1!'}))
+        cdx['source'] = 'local'
+        assert 'source' not in self.lookup(cached, 1)[0]
+
+        # index changed
+        Collection(my_id='coll-a', redis=self.redis, access=None).incr_cdxj_gen()
+
+        assert self.lookup(cached, 1) == res
+        assert source.loads == 3
+
+        assert self.lookup(cached, 1, coll='coll-b') == res
+        assert source.loads == 3
+
+        assert cached.hits == 4
+        assert cached.misses == 3
+        assert cached.hit_ratio() == 4 / 7
+
+    def test_lru_evict(self):
+        source, cached = self.get_source()
+
+        for path in [0, 1, 2, 0, 3]:
+            self.lookup(cached, path)
+
+        assert source.loads == 4
+
+        # least recently used evicted
+        self.lookup(cached, 1)
+        assert source.loads == 5
+
+        self.lookup(cached, 0)
+        assert source.loads == 5
+
+    def test_max_lines(self):
+        source, cached = self.get_source(max_lines=2)
+
+        assert len(self.lookup(cached, 1)) == 3
+        assert len(self.lookup(cached, 1)) == 3
+        assert source.loads == 2
+        assert len(cached.cache) == 0
+
+    def test_disabled(self):
+        source, cached = self.get_source(max_entries=0)
+
+        assert len(self.lookup(cached, 1)) == 3
+        assert len(self.lookup(cached, 1)) == 3
+        assert source.loads == 2
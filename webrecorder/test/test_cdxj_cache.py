@@ -28,6 +28,7 @@ REC_INFO = 'r:500:info'
 REC_CDXJ_T = REC_CDXJ + ':_'
 
 COLL_CDXJ = 'c:100:cdxj'
+COLL_CDXJ_READY = 'c:100:cdxj:ready'
 
 
 # ============================================================================
@@ -93,24 +94,48 @@ class BaseCDXJCache(FullStackTests):
 
         assert res.headers['Content-Disposition'].startswith("attachment; filename*=UTF-8''temp-")
 
+    def test_replay_committed_rec(self):
+        # loaded from committed index file
+        assert not self.redis.exists(REC_CDXJ)
+
+        res = self.testapp.get('/{user}/temp/500/replay/mp_/http://httpbin.org/get?bood=far'.format(user=self.anon_user))
+        res.charset = 'utf-8'
+
+        assert '"bood": "far"' in res.text, res.text
+
+        assert not self.redis.exists(REC_CDXJ)
+
     def test_record_2_closed_not_found(self):
         res = self.testapp.get('/' + self.anon_user + '/temp/rec/record/mp_/http://httpbin.org/get?food=bar', status=404)
 
     def test_replay_load_cdxj(self):
+        # not built while recording
         assert not self.redis.exists(COLL_CDXJ)
+        assert not self.redis.exists(COLL_CDXJ_READY)
 
         res = self.testapp.get('/{user}/temp/mp_/http://httpbin.org/get?food=bar'.format(user=self.anon_user))
 
         res.charset = 'utf-8'
 
         assert '"food": "bar"' in res.text, res.text
-        self.sleep_try(0.1, 0.5, self.assert_exists(COLL_CDXJ, True))
+
+        if not Collection.COLL_CDXJ_BUILD:
+            # replayed from recording indexes
+            assert not self.redis.exists(COLL_CDXJ)
+            return
+
+        self.sleep_try(0.1, 0.5, self.assert_exists(COLL_CDXJ_READY, True))
 
         assert len(self.redis.zrange(COLL_CDXJ, 0, -1)) == 2
 
-        self.do_expire_coll_cdxj()
+        assert self.redis.ttl(COLL_CDXJ) > 0
+
+        # reset to load from committed index
+        self.redis.delete(COLL_CDXJ, COLL_CDXJ_READY)
+        Collection.coll_index_ready.clear()
 
     @patch('webrecorder.models.collection.load', slow_load)
+    @patch.object(Collection, 'COLL_CDXJ_BUILD', True)
     def test_sync_avoid_double_load(self):
         self.assert_exists(COLL_CDXJ, False)()
         self.assert_exists(REC_CDXJ, False)()
@@ -119,13 +144,13 @@ class BaseCDXJCache(FullStackTests):
                           my_id=self.anon_user,
                           access=BaseAccess()).get_collection_by_name('temp')
 
-        collection.sync_coll_index(exists=False, do_async=True)
+        collection.sync_coll_index(do_async=True)
 
         time.sleep(0.1)
 
         self.assert_exists(REC_CDXJ_T, True)()
 
-        collection.sync_coll_index(exists=True, do_async=True)
+        collection.sync_coll_index(do_async=True)
 
         time.sleep(0.1)
 
@@ -135,6 +160,9 @@ class BaseCDXJCache(FullStackTests):
 
         assert load_counter == 1
 
+        self.sleep_try(0.1, 0.5, self.assert_exists(COLL_CDXJ_READY, True))
+        assert len(self.redis.zrange(COLL_CDXJ, 0, -1)) == 2
+
     def test_check_duration(self):
         res = self.testapp.get('/api/v1/collection/temp?user={user}'.format(user=self.anon_user))
 
@@ -154,6 +182,9 @@ class BaseCDXJCache(FullStackTests):
 
         assert res.json == {'deleted_id': '500'}
 
+        # removed from collection index
+        assert not self.redis.exists(COLL_CDXJ)
+
         def assert_deleted():
             assert len(os.listdir(user_dir)) == 0
 
@@ -180,9 +211,6 @@ class TestCDXJCache(BaseCDXJCache):
 
         self.sleep_try(0.1, 5.0, self.assert_exists(REC_CDXJ, False))
 
-    def do_expire_coll_cdxj(self):
-        self.sleep_try(1.0, 1.0, self.assert_exists(COLL_CDXJ, False))
-
 
 # ============================================================================
 class TestCDXJCacheCommit(BaseCDXJCache):
@@ -204,7 +232,4 @@ class TestCDXJCacheCommit(BaseCDXJCache):
         assert self.redis.exists(REC_OPEN) == False
         assert self.redis.exists(REC_CDXJ) == False
 
-    def do_expire_coll_cdxj(self):
-        self.redis.delete(COLL_CDXJ)
-
 
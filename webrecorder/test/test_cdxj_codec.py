@@ -0,0 +1,150 @@
+from .testutils import FakeStrictRedis
+
+from pywb.indexer.cdxindexer import write_cdx_index
+
+from webrecorder.models.cdxjcodec import CDXJCodec, CompactRedisIndexSource
+from webrecorder.models.recording import Recording
+from webrecorder.models.base import BaseAccess
+
+from mock import patch
+from io import BytesIO
+
+import glob
+import os
+
+
+# ============================================================================
+class TestCDXJCodec(object):
+    @classmethod
+    def setup_class(cls):
+        cls.redis = FakeStrictRedis(decode_responses=True)
+        cls.redis.flushdb()
+
+        cls.lines = []
+        for filename in sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'warcs', '*.warc*'))):
+            out = BytesIO()
+            with open(filename, 'rb') as fh:
+                write_cdx_index(out, fh, os.path.basename(filename), cdxj=True, append_post=True)
+
+            cls.lines.extend(line.decode('utf-8') for line in out.getvalue().splitlines() if line)
+
+    def setup_method(self):
+        CDXJCodec.file_names.clear()
+        CDXJCodec.file_ids.clear()
+
+    def test_round_trip(self):
+        codec = CDXJCodec(self.redis)
+
+        members = codec.encode_lines('coll-a', self.lines, force=True)
+
+        assert any(CDXJCodec.is_compact(member) for member in members)
+
+        for line, member in zip(self.lines, members):
+            assert codec.decode('coll-a', member) == line
+
+            # same prefix, sorted as before
+            assert member.split(' ', 2)[:2] == line.split(' ', 2)[:2]
+
+            if CDXJCodec.is_compact(member):
+                assert len(member) < len(line)
+
+        # decoded in another process
+        self.setup_method()
+        assert list(codec.decode_lines('coll-a', members)) == self.lines
+
+    def test_encode_line(self):
+        codec = CDXJCodec(self.redis)
+
+        line = 'com,example)/ 20180306181354 {"url": "http://example.com/", "mime": "text/html", "status": "200", "digest": "A6DESOVDZ3WLYF57CS5E4RIC4ARPWRK7", "length": "1214", "offset": "773", "filename": "test.warc.gz"}'
+
+        member = codec.encode('coll-b', line)
+        assert member.startswith('com,example)/ 20180306181354 ~')
+        assert member.endswith(' text/html http://example.com/')
+
+        assert codec.decode('coll-b', member) == line
+
+        # filename ids per collection
+        codec.encode('coll-b', line.replace('test.warc.gz', 'other.warc.gz'))
+        codec.encode('coll-b', line)
+
+        assert self.redis.hgetall('c:coll-b:cdxj:files') == {'next': '2', '1': 'test.warc.gz', '2': 'other.warc.gz'}
+
+    def test_file_id_assigned_once(self):
+        codec = CDXJCodec(self.redis)
+
+        file_id = codec.get_file_id('coll-f', 'test.warc.gz')
+
+        # added concurrently by another process, before it is seen here
+        self.setup_method()
+        with patch.object(CDXJCodec, 'load_files'):
+            CDXJCodec.file_ids['coll-f'] = {}
+            CDXJCodec.file_names['coll-f'] = {}
+            assert codec.get_file_id('coll-f', 'test.warc.gz') == file_id
+
+        assert self.redis.hget('c:coll-f:cdxj:files', 'next') == '1'
+        assert codec.get_filename('coll-f', file_id) == 'test.warc.gz'
+
+    def test_not_encoded(self):
+        codec = CDXJCodec(self.redis)
+
+        lines = ['com,example)/ 20180306181354 {"url": "http://example.com/", "mime": "text/html", "method": "POST", "filename": "test.warc.gz"}',
+                 'com,example)/ 20180306181354 {"url": "http://example.com/", "status": "0200", "filename": "test.warc.gz"}',
+                 'com,example)/ 20180306181354 {"url": "http://example.com/", "digest": "sha1:A6DESOVDZ3WLYF57CS5E4RIC4ARPWRK7"}',
+                 'com,example)/ 20180306181354 {"filename": "test.warc.gz", "url": "http://example.com/"}',
+                 'com,example)/ 20180306181354 {"url":"http://example.com/"}',
+                 'com,example)/ 20180306181354 http://example.com/ text/html 200 A6DESOVDZ3WLYF57CS5E4RIC4ARPWRK7 - - 1214 773 test.warc.gz']
+
+        assert codec.encode_lines('coll-c', lines, force=True) == lines
+
+        # only encoded if enabled
+        line = 'com,example)/ 20180306181354 {"url": "http://example.com/"}'
+        assert codec.encode_lines('coll-c', [line]) == [line]
+
+        with patch.object(CDXJCodec, 'ENABLED', True):
+            assert CDXJCodec.is_compact(codec.encode_lines('coll-c', [line])[0])
+
+    def test_init_props(self):
+        with patch.object(CDXJCodec, 'ENABLED', False):
+            # env var values are strings
+            CDXJCodec.init_props({'cdxj_compact': 'true'})
+            assert CDXJCodec.ENABLED == True
+
+            CDXJCodec.init_props({'cdxj_compact': 'false'})
+            assert CDXJCodec.ENABLED == False
+
+            CDXJCodec.init_props({'cdxj_compact': 0})
+            assert CDXJCodec.ENABLED == False
+
+    def test_compact_index_source(self):
+        codec = CDXJCodec(self.redis)
+
+        lines = sorted(set(self.lines))
+        members = codec.encode_lines('coll-d', lines, force=True)
+
+        # mixed compact and plain members
+        self.redis.zadd('c:coll-d:cdxj', *[val for member in members[::2] for val in (0, member)])
+        self.redis.zadd('c:coll-d:cdxj', *[val for line in lines[1::2] for val in (0, line)])
+
+        source = CompactRedisIndexSource(redis_url='redis://localhost:6379/2/c:{coll}:cdxj',
+                                         redis=self.redis)
+
+        params = {'param.coll': 'coll-d', 'key': b'com,example)/', 'end_key': b'com,example)0'}
+
+        res = [cdx.to_text().rstrip('\n') for cdx in source.load_index(params)]
+        assert sorted(res) == [line for line in lines if 'com,example)/' <= line < 'com,example)0']
+        assert len(res) > 0
+
+    def test_recode_copied_rec(self):
+        codec = CDXJCodec(self.redis)
+
+        # other filename ids in target collection
+        codec.encode('coll-f', self.lines[0].replace('"filename": "', '"filename": "other-'))
+
+        members = codec.encode_lines('coll-e', self.lines, force=True)
+        self.redis.zadd('r:rec-e:cdxj', *[val for member in members for val in (0, member)])
+
+        recording = Recording(my_id='rec-e', redis=self.redis, access=BaseAccess())
+        recording.recode_cdxj('r:rec-e:cdxj', 'coll-e', 'coll-f')
+
+        res = list(codec.decode_lines('coll-f', self.redis.zrange('r:rec-e:cdxj', 0, -1)))
+        assert sorted(res) == sorted(set(self.lines))
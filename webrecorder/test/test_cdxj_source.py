@@ -0,0 +1,199 @@
+from .testutils import FakeStrictRedis
+
+from pywb.warcserver.index.indexsource import RedisIndexSource
+
+from webrecorder.load.cdxjsource import MmapCDXJIndex, CommittedCDXJIndexSource, MergedCollIndexSource
+from webrecorder.models.recording import Recording
+from webrecorder.rec.storage.storagepaths import add_local_store_prefix
+
+from io import BytesIO
+
+import tempfile
+import shutil
+import os
+
+
+# ============================================================================
+class FakeLoader(object):
+    def __init__(self, data):
+        self.data = data
+        self.loads = []
+
+    def load(self, url):
+        self.loads.append(url)
+        return BytesIO(self.data)
+
+
+# ============================================================================
+class TestCDXJSource(object):
+    @classmethod
+    def setup_class(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.redis = FakeStrictRedis(decode_responses=True)
+
+        cls.lines = sorted('com,example)/{0}/{1} 2018010100000{2} {{"filename": "rec.warc.gz"}}'.format(x % 7, x, x % 3)
+                           for x in range(500))
+
+        cls.index_file = os.path.join(cls.temp_dir, 'index.cdxj')
+        with open(cls.index_file, 'wt') as fh:
+            fh.write('\n'.join(cls.lines) + '\n')
+
+        redis_source = RedisIndexSource(redis_url='redis://localhost:6379/2/' + Recording.CDXJ_KEY,
+                                        redis=cls.redis)
+
+        config = {'cdxj_max_open': 2,
+                  'cdxj_cache_max_size': 100000}
+
+        cls.source = CommittedCDXJIndexSource(redis_source, os.path.join(cls.temp_dir, 'cache'), config)
+
+        coll_redis_source = RedisIndexSource(redis_url='redis://localhost:6379/2/c:{coll}:cdxj',
+                                             redis=cls.redis)
+
+        cls.merged_source = MergedCollIndexSource(cls.source, coll_redis_source)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.temp_dir)
+
+    def expected(self, key, end_key):
+        return [line for line in self.lines if key <= line < end_key]
+
+    def lookup(self, rec, key, end_key):
+        params = {'param.rec': rec, 'key': key.encode('utf-8'), 'end_key': end_key.encode('utf-8')}
+        return [cdx.to_text().rstrip('\n') for cdx in self.source.load_index(params)]
+
+    def test_mmap_iter_range(self):
+        index = MmapCDXJIndex(self.index_file)
+
+        for key, end_key in [('com,example)/3/', 'com,example)/3/1'),
+                             ('com,example)/3/', 'com,example)/30'),
+                             ('a', 'com,example)/0/100'),
+                             ('com,example)/6/99', 'z'),
+                             ('com,example)/7', 'z'),
+                             ('a', 'b')]:
+
+            res = [line.decode('utf-8') for line in index.iter_range(key.encode('utf-8'), end_key.encode('utf-8'))]
+            assert res == self.expected(key, end_key)
+
+        assert len(list(index.iter_range(b'', b'z'))) == 500
+
+    def test_mmap_empty(self):
+        empty = os.path.join(self.temp_dir, 'empty.cdxj')
+        open(empty, 'wb').close()
+
+        assert list(MmapCDXJIndex(empty).iter_range(b'a', b'z')) == []
+
+    def test_open_rec_from_redis(self):
+        self.redis.zadd('r:open:cdxj', 0, 'com,example)/ 20180101000000 {"filename": "open.warc.gz"}')
+        self.redis.hset('r:open:info', Recording.INDEX_FILE_KEY, add_local_store_prefix(self.index_file))
+
+        assert self.lookup('open', 'com,example)/', 'com,example)0') == [
+            'com,example)/ 20180101000000 {"filename": "open.warc.gz"}']
+
+    def test_committed_local(self):
+        self.redis.hset('r:local:info', Recording.INDEX_FILE_KEY, add_local_store_prefix(self.index_file))
+
+        assert self.lookup('local', 'com,example)/5/', 'com,example)/50') == self.expected('com,example)/5/', 'com,example)/50')
+
+        # index still mapped
+        assert list(self.source.indexes.keys()) == [add_local_store_prefix(self.index_file)]
+
+    def test_committed_remote_cached(self):
+        with open(self.index_file, 'rb') as fh:
+            loader = FakeLoader(fh.read())
+
+        self.source.loader = loader
+
+        for rec in ('remote-1', 'remote-2'):
+            self.redis.hset('r:{0}:info'.format(rec), Recording.INDEX_FILE_KEY, 's3://bucket/{0}/index.cdxj'.format(rec))
+
+        for x in range(3):
+            assert self.lookup('remote-1', 'com,example)/2/', 'com,example)/20') == self.expected('com,example)/2/', 'com,example)/20')
+
+        assert self.lookup('remote-2', 'com,example)/1/', 'com,example)/10') == self.expected('com,example)/1/', 'com,example)/10')
+
+        # downloaded once each
+        assert loader.loads == ['s3://bucket/remote-1/index.cdxj', 's3://bucket/remote-2/index.cdxj']
+        assert len(os.listdir(self.source.cache_dir)) == 2
+
+        # least recently used unmapped
+        assert list(self.source.indexes.keys()) == ['s3://bucket/remote-1/index.cdxj', 's3://bucket/remote-2/index.cdxj']
+
+        # cache dir evicted over max size, still readable from loaded index
+        self.source.CACHE_MAX_SIZE = 0
+        self.source.evict()
+        assert os.listdir(self.source.cache_dir) == []
+
+        assert self.lookup('remote-1', 'com,example)/2/', 'com,example)/20') == self.expected('com,example)/2/', 'com,example)/20')
+
+    def test_cache_evict_least_recently_used(self):
+        with open(self.index_file, 'rb') as fh:
+            data = fh.read()
+
+        config = {'cdxj_max_open': 2,
+                  'cdxj_cache_max_size': len(data) * 2}
+
+        source = CommittedCDXJIndexSource(self.source.redis_source, os.path.join(self.temp_dir, 'cache-lru'), config)
+        source.loader = FakeLoader(data)
+
+        urls = ['s3://bucket/lru-1/index.cdxj', 's3://bucket/lru-2/index.cdxj']
+
+        paths = []
+        for url in urls:
+            source.get_index(url)
+            paths.append(source.get_local_path(url))
+
+        # lru-1 downloaded first, but used most recently
+        os.utime(paths[0], (1000, 1000))
+        os.utime(paths[1], (2000, 2000))
+        source.get_index(urls[0])
+
+        source.CACHE_MAX_SIZE = len(data)
+        source.evict()
+        assert os.listdir(source.cache_dir) == [os.path.basename(paths[0])]
+
+    def write_rec_index(self, rec, lines):
+        filename = os.path.join(self.temp_dir, rec + '.cdxj')
+        with open(filename, 'wt') as fh:
+            fh.write('\n'.join(sorted(lines)) + '\n')
+
+        self.redis.hset('r:{0}:info'.format(rec), Recording.INDEX_FILE_KEY, add_local_store_prefix(filename))
+
+    def test_merged_coll(self):
+        all_lines = []
+        for x, rec in enumerate(['m-1', 'm-2', 'm-3']):
+            lines = ['com,example)/{0}/{1} 2018010100000{2} {{"filename": "{3}.warc.gz"}}'.format(i % 10, i, x, rec)
+                     for i in range(20 + x)]
+
+            all_lines.extend(lines)
+            self.redis.sadd('c:merged:recs', rec)
+
+            # m-3 still open
+            if rec == 'm-3':
+                self.redis.zadd('r:m-3:cdxj', *[val for line in lines for val in (0, line)])
+            else:
+                self.write_rec_index(rec, lines)
+
+        all_lines.sort()
+
+        params = {'param.coll': 'merged', 'key': b'com,example)/3', 'end_key': b'com,example)/5'}
+        res = [cdx.to_text().rstrip('\n') for cdx in self.merged_source.load_index(params)]
+
+        assert res == [line for line in all_lines if 'com,example)/3' <= line < 'com,example)/5']
+        assert len(res) == 12
+
+        # collection index used once built
+        self.redis.zadd('c:merged:cdxj', 0, 'com,example)/3 20180101000000 {"filename": "built.warc.gz"}')
+        self.redis.set('c:merged:cdxj:ready', 1)
+
+        res = [cdx.to_text().rstrip('\n') for cdx in self.merged_source.load_index(params)]
+        assert res == ['com,example)/3 20180101000000 {"filename": "built.warc.gz"}']
+
+    def test_merged_coll_no_recs(self):
+        # external collection, only collection index
+        self.redis.zadd('c:ext:cdxj', 0, 'com,example)/ 20180101000000 {"filename": "ext.warc.gz"}')
+
+        params = {'param.coll': 'ext', 'key': b'com,example)/', 'end_key': b'com,example)0'}
+        res = [cdx.to_text().rstrip('\n') for cdx in self.merged_source.load_index(params)]
+
+        assert res == ['com,example)/ 20180101000000 {"filename": "ext.warc.gz"}']
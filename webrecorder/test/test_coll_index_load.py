@@ -0,0 +1,168 @@
+from .testutils import BaseWRTests
+
+from webrecorder.models.collection import Collection
+from webrecorder.models.recording import Recording
+from webrecorder.models.base import BaseAccess
+from webrecorder.utils import iter_lines
+
+from pywb.utils.loaders import load as load_test
+
+from mock import patch
+from io import BytesIO
+
+import gevent
+import os
+
+
+# ============================================================================
+@patch.object(Collection, 'COLL_CDXJ_BUILD', True)
+class TestCollIndexLoad(BaseWRTests):
+    @classmethod
+    def setup_class(cls):
+        super(TestCollIndexLoad, cls).setup_class(no_app=True)
+
+    def get_collection(self, coll):
+        return Collection(my_id=coll, redis=self.redis, access=BaseAccess())
+
+    def write_index(self, rec, num_lines):
+        filename = os.path.join(self.warcs_dir, rec + '.cdxj')
+        with open(filename, 'wt') as fh:
+            for i in range(num_lines):
+                fh.write('com,example)/{0}/{1:06d} 20180101000000 {{"filename": "{0}.warc.gz"}}\n'.format(rec, i))
+
+        self.redis.hset('r:{0}:info'.format(rec), Collection.INDEX_FILE_KEY, filename)
+
+    def test_iter_lines(self):
+        stream = BytesIO(b'abc\ndef\n\nghijkl\nmn')
+        assert list(iter_lines(stream, block_size=4)) == [b'abc', b'def', b'ghijkl', b'mn']
+
+    def test_download_cdxj_chunked(self):
+        self.write_index('rec-a', 2500)
+
+        collection = self.get_collection('coll-a')
+
+        with patch.object(Collection, 'INDEX_CHUNK_SIZE', 1000):
+            assert collection._do_download_cdxj('r:rec-a:cdxj', 'c:coll-a:cdxj')
+
+        assert self.redis.zcard('c:coll-a:cdxj') == 2500
+        assert not self.redis.exists('r:rec-a:cdxj:_')
+
+    def test_add_cdxj(self):
+        collection = self.get_collection('coll-ext')
+        collection.set_external(True)
+
+        cdx = b"""\
+com,example)/ 20180306181354 {"url": "http://example.com/", "filename": "test.warc.gz"}
+com,example)/fake 20180306181354 http://example.com/fake text/html 200 A6DESOVDZ3WLYF57CS5E4RIC4ARPWRK7 - - 1214 773 test.warc.gz
+
+invalid
+com,example)/bad 20180306181354 {not json}
+"""
+        assert collection.add_cdxj(cdx) == 2
+
+        lines = self.redis.zrange('c:coll-ext:cdxj', 0, -1)
+        assert lines[0] == 'com,example)/ 20180306181354 {"url": "http://example.com/", "filename": "test.warc.gz"}'
+        assert lines[1].startswith('com,example)/fake 20180306181354 ')
+
+    def test_build_coll_index_concurrent(self):
+        active = [0, 0]
+
+        def slow_load(filename):
+            active[0] += 1
+            active[1] = max(active)
+            gevent.sleep(0.05)
+            active[0] -= 1
+            return load_test(filename)
+
+        recs = ['rec-b-{0}'.format(x) for x in range(6)]
+        for rec in recs:
+            self.write_index(rec, 100)
+            self.redis.sadd('c:coll-b:recs', rec)
+
+        collection = self.get_collection('coll-b')
+
+        with patch('webrecorder.models.collection.load', slow_load):
+            with patch.object(Collection, 'COLL_CDXJ_LOAD_GREENLETS', 2):
+                collection.sync_coll_index(do_async=False)
+
+        assert active[1] == 2
+
+        assert self.redis.zcard('c:coll-b:cdxj') == 600
+        assert self.redis.exists('c:coll-b:cdxj:ready')
+
+        # index expires after ready key
+        assert 0 < self.redis.ttl('c:coll-b:cdxj:ready') <= Collection.COLL_CDXJ_TTL
+        assert self.redis.ttl('c:coll-b:cdxj') > Collection.COLL_CDXJ_TTL
+
+    def test_add_coll_index_lines(self):
+        lines = ['com,example)/{0} 20180101000000 {{}}'.format(x) for x in range(5)]
+
+        def add_lines(lines):
+            with self.redis.pipeline(transaction=False) as pi:
+                Collection.add_coll_index_lines(pi, 'coll-e', lines + [''], 2)
+                pi.execute()
+
+        # not built, not added
+        add_lines(lines[:2])
+        assert not self.redis.exists('c:coll-e:cdxj')
+
+        # being built
+        self.redis.set('c:coll-e:cdxj:_', 1)
+        add_lines(lines[2:4])
+        self.redis.delete('c:coll-e:cdxj:_')
+
+        # built
+        self.redis.set('c:coll-e:cdxj:ready', 1)
+        add_lines(lines[4:])
+
+        assert self.redis.zrange('c:coll-e:cdxj', 0, -1) == lines[2:]
+
+    def test_sync_extends_ttl(self):
+        self.redis.zadd('c:coll-f:cdxj', 0, 'com,example)/ 20180101000000 {}')
+        self.redis.set('c:coll-f:cdxj:ready', 1, ex=5)
+        self.redis.expire('c:coll-f:cdxj', 5)
+
+        collection = self.get_collection('coll-f')
+        collection.sync_coll_index(do_async=False)
+
+        assert self.redis.ttl('c:coll-f:cdxj:ready') > 5
+        assert self.redis.ttl('c:coll-f:cdxj') > Collection.COLL_CDXJ_TTL
+
+    def test_remove_rec_index_not_ready(self):
+        # lines added while recording, before index is built
+        for rec in ('rec-c-0', 'rec-c-1'):
+            self.redis.sadd('c:coll-c:recs', rec)
+            self.redis.zadd('r:{0}:cdxj'.format(rec), 0, 'com,example)/{0} 20180101000000 {{}}'.format(rec))
+            self.redis.zadd('c:coll-c:cdxj', 0, 'com,example)/{0} 20180101000000 {{}}'.format(rec))
+
+        collection = self.get_collection('coll-c')
+        assert not collection.is_coll_index_ready()
+
+        recording = Recording(my_id='rec-c-0', redis=self.redis, access=BaseAccess())
+        collection.remove_rec_index(recording)
+
+        self.redis.srem('c:coll-c:recs', 'rec-c-0')
+        self.redis.delete('r:rec-c-0:cdxj')
+
+        # not added back when built
+        collection.sync_coll_index(do_async=False)
+
+        assert self.redis.zrange('c:coll-c:cdxj', 0, -1) == ['com,example)/rec-c-1 20180101000000 {}']
+
+    def test_build_coll_index_download_skipped(self):
+        self.write_index('rec-d', 10)
+        self.redis.sadd('c:coll-d:recs', 'rec-d')
+
+        # index being loaded elsewhere
+        self.redis.set('r:rec-d:cdxj:_', 1)
+
+        collection = self.get_collection('coll-d')
+        collection.sync_coll_index(do_async=False)
+
+        assert not self.redis.exists('c:coll-d:cdxj:ready')
+
+        self.redis.delete('r:rec-d:cdxj:_')
+        collection.sync_coll_index(do_async=False)
+
+        assert self.redis.exists('c:coll-d:cdxj:ready')
+        assert self.redis.zcard('c:coll-d:cdxj') == 10
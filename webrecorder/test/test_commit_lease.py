@@ -0,0 +1,127 @@
+from .testutils import BaseWRTests
+
+from webrecorder.models.recording import Recording
+from webrecorder.models.stats import Stats
+from webrecorder.models.base import BaseAccess
+from webrecorder.rec.storagecommitter import StorageCommitter
+from webrecorder.utils import load_wr_config, today_str
+
+from mock import patch
+
+import gevent
+import time
+
+
+# ============================================================================
+class TestCommitLease(BaseWRTests):
+    @classmethod
+    def setup_class(cls):
+        super(TestCommitLease, cls).setup_class(no_app=True)
+
+        cls.config = load_wr_config()
+
+    def get_recording(self, rec):
+        return Recording(my_id=rec, redis=self.redis, access=BaseAccess())
+
+    def test_commit_lease(self):
+        rec_1 = self.get_recording('lease')
+        rec_2 = self.get_recording('lease')
+
+        assert rec_1.acquire_commit_lock()
+        assert not rec_2.acquire_commit_lock()
+
+        assert rec_1.renew_commit_lock()
+        assert not rec_2.renew_commit_lock()
+
+        # only released by holder
+        rec_2.release_commit_lock()
+        assert self.redis.exists('r:lease:lock')
+
+        rec_1.release_commit_lock()
+        assert not self.redis.exists('r:lease:lock')
+
+    def test_commit_lease_expired(self):
+        rec_1 = self.get_recording('expire')
+        rec_2 = self.get_recording('expire')
+
+        with patch.object(Recording, 'COMMIT_LOCK_SECS', 1):
+            assert rec_1.acquire_commit_lock()
+            time.sleep(1.2)
+
+            assert rec_2.acquire_commit_lock()
+
+        # lease lost, can't renew or release
+        assert not rec_1.renew_commit_lock()
+        rec_1.release_commit_lock()
+        assert self.redis.get('r:expire:lock') == rec_2.commit_token
+
+        rec_2.release_commit_lock()
+
+    def test_concurrent_committers(self):
+        committed = []
+        active = [0, 0]
+
+        def mock_commit(recording, storage):
+            active[0] += 1
+            active[1] = max(active)
+            gevent.sleep(0.05)
+            active[0] -= 1
+
+            committed.append(recording.my_id)
+            self.redis.delete(recording.CDXJ_KEY.format(rec=recording.my_id))
+            return True
+
+        recs = ['rec-{0}'.format(x) for x in range(20)]
+        for rec in recs:
+            self.redis.zadd(Recording.COMMIT_QUEUE, time.time() - 1, rec)
+            self.redis.zadd(Recording.CDXJ_KEY.format(rec=rec), 0, 'com,example)/ 20180101000000 {}')
+
+        committers = [StorageCommitter(self.config) for x in range(3)]
+
+        with patch.object(Recording, '_commit_to_storage', mock_commit):
+            for committer in committers:
+                committer.last_sweep = time.time()
+
+            gevent.joinall([gevent.spawn(committer) for committer in committers])
+
+        # each committed once
+        assert sorted(committed) == sorted(recs)
+        assert active[1] > 1
+
+        assert self.redis.zcard(Recording.COMMIT_QUEUE) == 0
+        assert self.redis.keys('r:*:lock') == []
+
+        today = today_str()
+        assert self.redis.hget(Stats.COMMIT_COUNT_KEY, today) == '20'
+        assert self.redis.hget(Stats.COMMIT_QUEUE_KEY, today) == '20'
+
+    def test_commit_queue_depth_max(self):
+        stats = Stats(self.redis)
+        today = today_str()
+
+        for depth in (5, 30, 0, 12):
+            stats.set_commit_queue_depth(depth)
+
+        assert self.redis.hget(Stats.COMMIT_QUEUE_KEY, today) == '30'
+
+    def test_renew_while_pool_full(self):
+        renewed = []
+
+        def mock_process(recording):
+            gevent.sleep(0.2)
+
+        def mock_renew(recording):
+            renewed.append(recording.my_id)
+            return True
+
+        committer = StorageCommitter(dict(self.config, commit_greenlets=1))
+        committer.renew_secs = 0.05
+
+        with patch.object(Recording, 'renew_commit_lock', mock_renew):
+            committer.run_commits(iter(['rec-a', 'rec-b']), mock_process)
+
+        # first commit renewed while second waits for the pool,
+        # only renewed while in progress
+        assert renewed[:2] == ['rec-a', 'rec-a']
+        assert 'rec-b' in renewed
+        assert 'rec-a' not in renewed[renewed.index('rec-b'):]
@@ -0,0 +1,159 @@
+from .testutils import BaseWRTests
+
+from webrecorder.models.recording import Recording
+from webrecorder.rec.deleteretry import DeleteRetryProcessor
+from webrecorder.rec.storage.s3 import S3Storage
+from webrecorder.utils import load_wr_config
+
+from mock import patch
+
+import json
+import time
+import os
+
+
+# ============================================================================
+class FakeS3Delete(object):
+    def __init__(self, fail_keys=None):
+        self.deleted = []
+        self.requests = []
+        self.fail_keys = fail_keys or set()
+
+    def delete_objects(self, Bucket, Delete):
+        keys = [obj['Key'] for obj in Delete['Objects']]
+        self.requests.append(keys)
+
+        errors = [{'Key': key, 'Code': 'AccessDenied', 'Message': 'Access Denied'}
+                  for key in keys if key in self.fail_keys]
+
+        self.deleted.extend(key for key in keys if key not in self.fail_keys)
+        return {'Errors': errors}
+
+
+# ============================================================================
+class TestDeleteRetry(BaseWRTests):
+    @classmethod
+    def setup_class(cls):
+        super(TestDeleteRetry, cls).setup_class(no_app=True)
+
+        os.environ['S3_ROOT'] = 's3://bucket/path/'
+
+        cls.config = load_wr_config()
+
+    @classmethod
+    def teardown_class(cls):
+        del os.environ['S3_ROOT']
+        super(TestDeleteRetry, cls).teardown_class()
+
+    def setup_method(self):
+        self.redis.delete(Recording.DELETE_RETRY, DeleteRetryProcessor.DEAD_LETTER)
+        for key in self.redis.keys('q:delete_retry:*'):
+            self.redis.delete(key)
+
+    def get_processor(self, s3):
+        processor = DeleteRetryProcessor(self.config)
+        processor.storage = S3Storage()
+        processor.storage.s3 = s3
+        return processor
+
+    def test_s3_delete_batches(self):
+        s3 = FakeS3Delete()
+        storage = S3Storage()
+        storage.s3 = s3
+
+        urls = ['s3://bucket/path/coll/warcs/{0}.warc.gz'.format(x) for x in range(2500)]
+
+        assert storage.delete_files(urls + ['s3://other/a.warc.gz']) == ['s3://other/a.warc.gz']
+
+        assert [len(keys) for keys in s3.requests] == [1000, 1000, 500]
+        assert len(s3.deleted) == 2500
+
+    def test_retry_local_and_remote(self):
+        local_dir = os.path.join(self.warcs_dir, 'retry')
+        os.makedirs(local_dir, exist_ok=True)
+
+        local_files = [os.path.join(local_dir, 'file-{0}.warc.gz'.format(x)) for x in range(3)]
+        for filename in local_files:
+            with open(filename, 'wb') as fh:
+                fh.write(b'WARC')
+
+        remote = ['s3://bucket/path/coll/warcs/{0}.warc.gz'.format(x) for x in range(5)]
+
+        # already deleted local file is not retried
+        self.redis.rpush(Recording.DELETE_RETRY, *(local_files + remote + [local_dir + '/missing.warc.gz']))
+
+        s3 = FakeS3Delete()
+        self.get_processor(s3)()
+
+        assert not any(os.path.isfile(filename) for filename in local_files)
+        assert len(s3.requests) == 1
+        assert len(s3.deleted) == 5
+
+        assert self.redis.llen(Recording.DELETE_RETRY) == 0
+
+    def test_retry_backoff_dead_letter(self):
+        failing = 's3://bucket/path/coll/warcs/fail.warc.gz'
+
+        self.redis.rpush(Recording.DELETE_RETRY, failing, 's3://bucket/path/coll/warcs/ok.warc.gz')
+
+        s3 = FakeS3Delete(fail_keys={'path/coll/warcs/fail.warc.gz'})
+        processor = self.get_processor(s3)
+        processor.max_attempts = 3
+
+        processor()
+
+        entries = [json.loads(entry) for entry in self.redis.lrange(Recording.DELETE_RETRY, 0, -1)]
+        assert len(entries) == 1
+        assert entries[0]['url'] == failing
+        assert entries[0]['attempts'] == 1
+        assert entries[0]['retry_at'] > time.time()
+
+        # not due yet, not retried
+        processor()
+        assert len(s3.requests) == 1
+        assert self.redis.llen(Recording.DELETE_RETRY) == 1
+
+        # backoff doubles with each attempt
+        now = time.time()
+        with patch('time.time', lambda: now + 10000):
+            processor()
+
+        entry = json.loads(self.redis.lindex(Recording.DELETE_RETRY, 0))
+        assert entry['attempts'] == 2
+        assert entry['retry_at'] == now + 10000 + processor.backoff_secs * 2
+
+        with patch('time.time', lambda: now + 20000):
+            processor()
+
+        assert self.redis.llen(Recording.DELETE_RETRY) == 0
+
+        dead = json.loads(self.redis.lindex(DeleteRetryProcessor.DEAD_LETTER, 0))
+        assert dead['url'] == failing
+        assert dead['attempts'] == 3
+
+    def test_batch_resumed_after_exit(self):
+        urls = ['s3://bucket/path/coll/warcs/{0}.warc.gz'.format(x) for x in range(5)]
+        self.redis.rpush(Recording.DELETE_RETRY, *urls)
+
+        s3 = FakeS3Delete()
+        processor = self.get_processor(s3)
+        processor.batch_size = 3
+
+        # exits while deleting first batch
+        with patch.object(DeleteRetryProcessor, 'delete_batch', side_effect=SystemExit):
+            try:
+                processor()
+            except SystemExit:
+                pass
+
+        assert self.redis.lrange(processor.processing_key, 0, -1) == urls[:3]
+        assert self.redis.lrange(Recording.DELETE_RETRY, 0, -1) == urls[3:]
+
+        # same batch processed again, then removed from processing list
+        processor()
+        assert s3.deleted == ['path/coll/warcs/{0}.warc.gz'.format(x) for x in range(3)]
+        assert not self.redis.exists(processor.processing_key)
+
+        processor()
+        assert len(s3.deleted) == 5
+        assert self.redis.llen(Recording.DELETE_RETRY) == 0
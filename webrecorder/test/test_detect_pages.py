@@ -0,0 +1,117 @@
+from .testutils import FakeStrictRedis
+
+from pywb.warcserver.index.cdxobject import CDXObject
+
+from webrecorder.models.importer import BaseImporter
+from webrecorder.models.cdxjcodec import CDXJCodec
+from webrecorder.utils import load_wr_config
+
+from mock import patch
+import os
+
+
+# ============================================================================
+class CountingRedis(FakeStrictRedis):
+    def __init__(self, *args, **kwargs):
+        super(CountingRedis, self).__init__(*args, **kwargs)
+        self.zranges = 0
+
+    def zrange(self, *args, **kwargs):
+        self.zranges += 1
+        return super(CountingRedis, self).zrange(*args, **kwargs)
+
+
+# ============================================================================
+class TestDetectPages(object):
+    LINE = 'com,example)/{path} 2018010100000{ts} {{"url": "{scheme}://example.com/{path}", "mime": "{mime}", "status": "{status}", "digest": "{digest}", "length": "1214", "offset": "773", "filename": "test.warc.gz"}}'
+
+    @classmethod
+    def setup_class(cls):
+        cls.redis = CountingRedis(decode_responses=True)
+        cls.redis.flushdb()
+
+        cls.lines = []
+        for x in range(50):
+            for mime, status in (('text/html', '200'), ('image/png', '200'), ('text/html', '404'),
+                                 ('text/plain', '-'), ('text/html', '302')):
+                cls.lines.append(cls.LINE.format(path='{0}/{1}'.format(x, mime.replace('/', '-') + status),
+                                                 ts=x % 10,
+                                                 scheme='http' if x % 2 else 'https',
+                                                 mime=mime,
+                                                 status=status,
+                                                 digest='A6DESOVDZ3WLYF57CS5E4RIC4ARPWRK7'))
+
+        # not pages
+        cls.lines.append(cls.LINE.format(path='robots.txt', ts=0, scheme='http', mime='text/plain',
+                                         status='200', digest='A6DESOVDZ3WLYF57CS5E4RIC4ARPWRK7'))
+
+        cls.lines.append(cls.LINE.format(path='empty', ts=0, scheme='http', mime='text/html',
+                                         status='200', digest='3I42H3S6NNFQ2MSVX7XZKYAYSCX5QBYJ'))
+
+        cls.lines.append(cls.LINE.format(path='ftp', ts=0, scheme='ftp', mime='text/html',
+                                         status='200', digest='A6DESOVDZ3WLYF57CS5E4RIC4ARPWRK7'))
+
+        cls.lines.sort()
+
+        cls.redis.zadd('r:rec-a:cdxj', *[val for line in cls.lines for val in (0, line)])
+
+        codec = CDXJCodec(cls.redis)
+        members = codec.encode_lines('coll-b', cls.lines, force=True)
+        cls.redis.zadd('r:rec-b:cdxj', *[val for member in members for val in (0, member)])
+
+    def setup_method(self):
+        self.redis.zranges = 0
+
+    def get_importer(self, **kwargs):
+        config = load_wr_config()
+        config['detect_pages_chunk_size'] = 40
+        config.update(kwargs)
+
+        with patch.dict(os.environ, {'RECORD_HOST': 'localhost'}):
+            return BaseImporter(self.redis, config)
+
+    def expected_pages(self, importer):
+        pages = []
+        for line in self.lines:
+            cdxj = CDXObject(line.encode('utf-8'))
+            if importer.is_page(cdxj):
+                pages.append(dict(url=cdxj['url'], title=cdxj['url'], timestamp=cdxj['timestamp']))
+
+        return pages
+
+    def test_detect_pages(self):
+        importer = self.get_importer()
+        pages = importer.detect_pages('coll-a', 'rec-a')
+
+        assert pages == self.expected_pages(importer)
+        assert len(pages) == 100
+
+        # read in chunks
+        assert self.redis.zranges == len(self.lines) // 40 + 1
+
+    def test_detect_pages_compact(self):
+        importer = self.get_importer()
+
+        assert importer.detect_pages('coll-b', 'rec-b') == self.expected_pages(importer)
+
+    def test_max_detect_pages(self):
+        importer = self.get_importer(max_detect_pages=5)
+        pages = importer.detect_pages('coll-a', 'rec-a')
+
+        assert pages == self.expected_pages(importer)[:5]
+
+        # stopped early
+        assert self.redis.zranges == 1
+
+    def test_may_be_page(self):
+        importer = self.get_importer()
+
+        for line in self.lines:
+            if importer.is_page(CDXObject(line.encode('utf-8'))):
+                assert importer.may_be_page(line)
+
+        assert not importer.may_be_page(self.LINE.format(path='a', ts=0, scheme='http', mime='image/png',
+                                                         status='200', digest='A'))
+
+        assert not importer.may_be_page(self.LINE.format(path='a', ts=0, scheme='http', mime='text/html',
+                                                         status='404', digest='A'))
@@ -0,0 +1,131 @@
+from .testutils import FakeStrictRedis
+
+from webrecorder.models.access import SessionAccessCache
+from webrecorder.models.base import BaseAccess
+from webrecorder.models.user import User
+from webrecorder.models.collection import Collection
+from webrecorder.models.recording import Recording
+from webrecorder.models.list_bookmarks import BookmarkList
+
+
+# ============================================================================
+class CountingRedis(FakeStrictRedis):
+    def __init__(self, *args, **kwargs):
+        super(CountingRedis, self).__init__(*args, **kwargs)
+        self.hgets = 0
+        self.pipelines = 0
+
+    def hget(self, *args, **kwargs):
+        self.hgets += 1
+        return super(CountingRedis, self).hget(*args, **kwargs)
+
+    def pipeline(self, *args, **kwargs):
+        self.pipelines += 1
+        return super(CountingRedis, self).pipeline(*args, **kwargs)
+
+
+# ============================================================================
+class TestIdentityMap(object):
+    @classmethod
+    def setup_class(cls):
+        cls.redis = CountingRedis(decode_responses=True)
+        cls.redis.flushdb()
+
+        cls.redis.hmset('u:user-a:info', {'max_size': '1000', 'size': '10', 'desc': 'User'})
+
+        cls.redis.hset('u:user-a:colls', 'my-coll', 'coll-a')
+        cls.redis.hmset('c:coll-a:info', {'owner': 'user-a', 'slug': 'my-coll', 'title': 'My Coll', 'public': '1'})
+
+        cls.redis.sadd('c:coll-a:recs', 'rec-a')
+        cls.redis.hmset('r:rec-a:info', {'owner': 'coll-a', 'title': 'Rec', 'size': '10'})
+
+        cls.redis.zadd('c:coll-a:lists', 1024, 'blist-a')
+        cls.redis.hmset('l:blist-a:info', {'owner': 'coll-a', 'title': 'List'})
+
+    def setup_method(self):
+        self.redis.hgets = 0
+        self.redis.pipelines = 0
+
+    def test_same_instance(self):
+        access = SessionAccessCache(None, self.redis)
+
+        user = User.get_instance(my_id='user-a', redis=self.redis, access=access)
+        assert User.get_instance(my_id='user-a', redis=self.redis, access=access) is user
+
+        collection = user.get_collection_by_name('my-coll')
+        assert user.get_collection_by_id('coll-a', 'my-coll') is collection
+        assert user.colls.get_objects(Collection) == [collection]
+        assert user.colls.get_objects(Collection)[0] is collection
+
+        recording = collection.get_recording('rec-a')
+        assert collection.get_recording('rec-a') is recording
+        assert collection.recs.get_objects(Recording)[0] is recording
+        assert recording.get_owner() is collection
+
+        blist = collection.lists.get_ordered_objects(BookmarkList)[0]
+        assert blist.owner is collection
+        assert BookmarkList.get_instance(my_id='blist-a', redis=self.redis, access=access) is blist
+
+        # owner loaded once per request
+        recording.owner = None
+        assert recording.get_owner() is collection
+        assert collection.get_owner() is user
+
+        # other request
+        other = SessionAccessCache(None, self.redis)
+        assert User.get_instance(my_id='user-a', redis=self.redis, access=other) is not user
+
+    def test_prefetch(self):
+        access = SessionAccessCache(None, self.redis)
+
+        user = User.get_instance(my_id='user-a', redis=self.redis, access=access)
+        collection = Collection.get_instance(my_id='coll-a', redis=self.redis, access=access)
+        recording = Recording.get_instance(my_id='rec-a', redis=self.redis, access=access)
+
+        assert collection['title'] == 'My Coll'
+        assert collection.is_public()
+        assert recording['title'] == 'Rec'
+        assert user['desc'] == 'User'
+        assert recording.get_owner() is collection
+        assert collection.get_owner() is user
+
+        # all info hashes in one round trip
+        assert self.redis.pipelines == 1
+        assert self.redis.hgets == 0
+
+        # not in info hash
+        assert collection.get_prop('missing', default_val='x') == 'x'
+        assert self.redis.hgets == 0
+
+        # size still read from redis
+        assert recording.size == 10
+        assert self.redis.hgets == 1
+
+        # objects added later are fetched in next round trip
+        blist = BookmarkList.get_instance(my_id='blist-a', redis=self.redis, access=access)
+        assert blist['title'] == 'List'
+        assert self.redis.pipelines == 2
+
+    def test_prefetch_set_prop(self):
+        access = SessionAccessCache(None, self.redis)
+
+        collection = Collection.get_instance(my_id='coll-a', redis=self.redis, access=access)
+        collection.set_prop('desc', 'Desc')
+
+        assert collection['desc'] == 'Desc'
+        assert collection['title'] == 'My Coll'
+        assert self.redis.pipelines == 1
+
+        self.redis.hdel('c:coll-a:info', 'desc')
+
+    def test_no_identity_map(self):
+        access = BaseAccess()
+
+        collection = Collection.get_instance(my_id='coll-a', redis=self.redis, access=access)
+        assert Collection.get_instance(my_id='coll-a', redis=self.redis, access=access) is not collection
+
+        assert collection['title'] == 'My Coll'
+        assert collection['slug'] == 'my-coll'
+
+        assert self.redis.pipelines == 0
+        assert self.redis.hgets == 2
@@ -0,0 +1,78 @@
+from .testutils import TempDirTests, BaseTestClass
+
+from webrecorder.rec.storage.local import DirectLocalFileStorage
+
+import os
+import errno
+
+
+# ============================================================================
+class TestLocalStorageUpload(TempDirTests, BaseTestClass):
+    @classmethod
+    def setup_class(cls):
+        super(TestLocalStorageUpload, cls).setup_class()
+        os.environ['STORAGE_ROOT'] = os.path.join(cls.root_dir, 'storage') + os.path.sep
+
+        cls.record_dir = os.path.join(cls.root_dir, 'record')
+        os.makedirs(cls.record_dir)
+
+        cls.storage = DirectLocalFileStorage()
+
+    @classmethod
+    def teardown_class(cls):
+        del os.environ['STORAGE_ROOT']
+        super(TestLocalStorageUpload, cls).teardown_class()
+
+    def write_file(self, name, data):
+        full_filename = os.path.join(self.record_dir, name)
+        with open(full_filename, 'wb') as fh:
+            fh.write(data)
+
+        return full_filename
+
+    def test_upload_hardlink(self):
+        full_filename = self.write_file('rec-1.warc.gz', b'WARC DATA')
+        target_url = os.path.join(self.storage.storage_root, 'coll', 'warcs', 'rec-1.warc.gz')
+
+        assert self.storage.do_upload(target_url, full_filename)
+
+        assert os.path.samefile(full_filename, target_url)
+
+        # uploading again is a no-op
+        assert self.storage.do_upload(target_url, full_filename)
+        assert os.path.samefile(full_filename, target_url)
+
+        # original deleted once committed
+        os.remove(full_filename)
+        with open(target_url, 'rb') as fh:
+            assert fh.read() == b'WARC DATA'
+
+    def test_upload_replace_existing(self):
+        full_filename = self.write_file('rec-2.warc.gz', b'NEW DATA')
+        target_url = os.path.join(self.storage.storage_root, 'coll', 'warcs', 'rec-2.warc.gz')
+
+        os.makedirs(os.path.dirname(target_url), exist_ok=True)
+        with open(target_url, 'wb') as fh:
+            fh.write(b'PARTIAL')
+
+        assert self.storage.do_upload(target_url, full_filename)
+        assert os.path.samefile(full_filename, target_url)
+
+    def test_upload_copy_other_device(self):
+        full_filename = self.write_file('rec-3.warc.gz', b'WARC DATA')
+        target_url = os.path.join(self.storage.storage_root, 'coll', 'warcs', 'rec-3.warc.gz')
+
+        def link(src, dst):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+        orig_link = os.link
+        os.link = link
+
+        try:
+            assert self.storage.do_upload(target_url, full_filename)
+        finally:
+            os.link = orig_link
+
+        assert not os.path.samefile(full_filename, target_url)
+        with open(target_url, 'rb') as fh:
+            assert fh.read() == b'WARC DATA'
@@ -3,13 +3,28 @@ from fakeredis import FakeStrictRedis
 #from .testutils import BaseWRTests
 from .testutils import FullStackTests
 
+from webrecorder.rec.quota import QuotaLeases
+from webrecorder.rec.pending import PendingCounter
+from webrecorder.rec.skipcache import SkipUrlCache
+from webrecorder.rec.dedupbloom import DedupBloomFilter
+from webrecorder.utils import get_record_host, zadd_lines
+from webrecorder.models.recording import Recording
+from webrecorder.models.base import BaseAccess
+from webrecorder.models.cdxjcodec import CDXJCodec
+
+from mock import patch
+
 from pywb.warcserver.test.testutils import LiveServerTests
 
+from warcio.timeutils import timestamp_to_iso_date
+
+import json
 import os
 
 import webtest
 
 from six.moves.urllib.parse import quote, urlsplit
+import gevent
 import time
 
 general_req_data = "\
@@ -70,13 +85,16 @@ class TestWebRecRecorder(FullStackTests):
         assert set(keys) == set([
             'r:REC:wk',
             'r:REC:cdxj',
+            'r:REC:_bf',
             'r:REC:info',
             'r:REC:open',
             'r:REC:_ps',
             'r:REC:_pc',
             'c:COLL:info',
             'c:COLL:warc',
-            'u:USER:info'
+            'c:COLL:cdxj:gen',
+            'u:USER:info',
+            'u:USER:_qr'
         ])
 
         resp.charset = 'utf-8'
@@ -97,21 +115,294 @@ class TestWebRecRecorder(FullStackTests):
         assert set(keys) == set([
             'r:REC:wk',
             'r:REC:cdxj',
+            'r:REC:_bf',
             'r:REC:info',
             'r:REC:open',
             'r:REC:_ps',
             'r:REC:_pc',
             'r:REC2:wk',
             'r:REC2:cdxj',
+            'r:REC2:_bf',
             'r:REC2:info',
             'r:REC2:open',
             'r:REC2:_ps',
             'r:REC2:_pc',
             'c:COLL:info',
             'c:COLL:warc',
-            'u:USER:info'
+            'c:COLL:cdxj:gen',
+            'u:USER:info',
+            'u:USER:_qr'
         ])
 
         resp.charset = 'utf-8'
         assert '"boo": "far"' in resp.text
 
+
+    def test_rec_index_with_coll_index(self):
+        # collection index not built, not updated
+        assert not self.redis.exists('c:COLL:cdxj')
+
+        # collection index should be updated once built
+        self.redis.set('c:COLL:cdxj:ready', 1)
+        coll_count = self.redis.zcard('c:COLL:cdxj')
+
+        resp = self._test_warc_write('http://httpbin.org/get?coll=1', user='USER', coll='COLL', rec='REC3')
+
+        rec_cdxj = self.redis.zrange('r:REC3:cdxj', 0, -1)
+        assert len(rec_cdxj) == 1
+        assert rec_cdxj[0].startswith('org,httpbin)/get?coll=1 ')
+
+        coll_cdxj = self.redis.zrange('c:COLL:cdxj', 0, -1)
+        assert len(coll_cdxj) == coll_count + 1
+        assert rec_cdxj[0] in coll_cdxj
+
+    def test_zadd_lines_chunked(self):
+        cdx_list = ['com,example)/{0} 20180101000000 {{}}'.format(i).encode('utf-8') for i in range(5)]
+
+        with self.redis.pipeline(transaction=False) as pi:
+            assert zadd_lines(pi, ['r:REC4:cdxj', 'c:COLL4:cdxj'], cdx_list + [b''], 2) == 5
+            pi.execute()
+
+        assert self.redis.zcard('r:REC4:cdxj') == 5
+        assert self.redis.zrange('c:COLL4:cdxj', 0, -1) == self.redis.zrange('r:REC4:cdxj', 0, -1)
+
+    def test_quota_lease_reserved(self):
+        resp = self._test_warc_write('http://httpbin.org/get?quota=1', user='USER', coll='COLL', rec='REC5')
+
+        # remaining local lease matches the user's reserved quota
+        remaining, _ = self.wr_rec.writer.quota.leases['u:USER:_qr']
+        assert remaining > 0
+        assert int(self.redis.get('u:USER:_qr')) == remaining
+
+    def test_quota_leases_not_over_max_size(self):
+        config = dict(self.wr_rec.config, quota_lease_size=1000)
+
+        quota_1 = QuotaLeases(self.redis, config)
+        quota_2 = QuotaLeases(self.redis, config)
+
+        params = {'param.user': 'QUSER'}
+        self.redis.hmset('u:QUSER:info', {'size': 0, 'max_size': 1500})
+
+        assert quota_1.reserve(params, 100)
+        assert self.redis.get('u:QUSER:_qr') == '1000'
+
+        # only 500 available to other process
+        assert not quota_2.reserve(params, 600)
+        assert quota_2.reserve(params, 400)
+        assert self.redis.get('u:QUSER:_qr') == '1500'
+
+        # written records released from reserved
+        with self.redis.pipeline(transaction=False) as pi:
+            quota_1.release_written(pi, params, 100)
+            pi.execute()
+
+        self.redis.hincrby('u:QUSER:info', 'size', 100)
+        assert self.redis.get('u:QUSER:_qr') == '1400'
+
+        # unused lease returned
+        quota_1.release('u:QUSER:_qr')
+        assert self.redis.get('u:QUSER:_qr') == '500'
+
+        assert quota_2.reserve(params, 100)
+        assert not quota_1.reserve(params, 901)
+        assert quota_1.reserve(params, 900)
+        assert self.redis.get('u:QUSER:_qr') == '1400'
+
+    def test_pending_counter_coalesced(self):
+        pending = PendingCounter(self.redis, dict(self.wr_rec.config, pending_flush_size=100))
+
+        self.redis.hset('r:REC6:info', 'size', 0)
+        recording = Recording(my_id='REC6', redis=self.redis, access=BaseAccess())
+
+        pending.incr(recording, count=1)
+        assert self.redis.get('r:REC6:_pc') == '1'
+
+        # size deltas buffered until threshold
+        for x in range(9):
+            pending.incr(recording, size=10)
+
+        assert self.redis.get('r:REC6:_ps') == '0'
+
+        pending.incr(recording, size=10)
+        assert self.redis.get('r:REC6:_ps') == '100'
+
+        pending.incr(recording, size=10)
+        timer = pending.flush_timer
+        assert timer
+
+        pending.incr(recording, count=-1, size=-110)
+        assert self.redis.get('r:REC6:_pc') == '0'
+        assert self.redis.get('r:REC6:_ps') == '0'
+
+        # timer cancelled by direct flush
+        assert pending.flush_timer is None
+        gevent.sleep(0)
+        assert timer.dead
+
+    def test_skip_url_cache(self):
+        skip_cache = SkipUrlCache(self.redis, dict(self.wr_rec.config, skip_cache_size=2))
+
+        skip_key = 'us:USER:s:http://example.com/'
+        assert not skip_cache.is_skipped(skip_key)
+
+        # not skipped is cached until invalidated
+        self.redis.setex(skip_key, 30, 1)
+        assert not skip_cache.is_skipped(skip_key)
+
+        skip_cache.invalidate(skip_key)
+        assert skip_cache.is_skipped(skip_key)
+        assert skip_cache.cache[skip_key][1] <= time.time() + 30
+
+        skip_cache.is_skipped('us:USER:s:http://example.com/2')
+        skip_cache.is_skipped('us:USER:s:http://example.com/3')
+        assert len(skip_cache.cache) == 2
+        assert skip_key not in skip_cache.cache
+
+    def test_record_host_shards(self):
+        hosts = ['http://recorder-0:8010', 'http://recorder-1:8010', 'http://recorder-2:8010']
+
+        assert get_record_host(hosts[:1], 'REC') == hosts[0]
+
+        # same rec always routed to same shard
+        shards = [get_record_host(hosts, 'rec-{0}'.format(x)) for x in range(30)]
+        assert shards == [get_record_host(hosts, 'rec-{0}'.format(x)) for x in range(30)]
+        assert set(shards) == set(hosts)
+
+        # extract with patch routed with patch requests for the patch recording
+        patch_host = get_record_host(hosts, 'rec-patch')
+        assert [get_record_host(hosts, 'rec-{0}'.format(x), 'rec-patch') for x in range(30)] == [patch_host] * 30
+        assert get_record_host(hosts, 'rec-1', None) == shards[1]
+
+    def test_write_pool_record(self):
+        writer = self.wr_rec.writer
+        writer.write_pool_min_size = 0
+
+        try:
+            resp = self._test_warc_write('http://httpbin.org/get?pool=1', user='USER', coll='COLL', rec='REC7')
+        finally:
+            writer.write_pool_min_size = 262144
+
+        rec_cdxj = self.redis.zrange('r:REC7:cdxj', 0, -1)
+        assert len(rec_cdxj) == 1
+        assert rec_cdxj[0].startswith('org,httpbin)/get?pool=1 ')
+
+    def test_close_key_waits_for_write(self):
+        writer = self.wr_rec.writer
+        dir_key = 'r:REC_LOCK:info'
+        closed = []
+
+        with writer.get_write_lock(dir_key):
+            ge = gevent.spawn(lambda: closed.append(writer.close_key(dir_key)))
+            gevent.sleep(0)
+            assert closed == []
+
+        ge.join()
+        assert closed == [None]
+
+    def test_dedup_bloom_revisit(self):
+        self._test_warc_write('http://httpbin.org/get?dedup=1', user='USER', coll='COLL', rec='REC8')
+        assert self.redis.exists('r:REC8:_bf')
+
+        self._test_warc_write('http://httpbin.org/get?dedup=1', user='USER', coll='COLL', rec='REC8')
+
+        rec_cdxj = self.redis.zrange('r:REC8:cdxj', 0, -1)
+        assert len(rec_cdxj) == 2
+        assert len([cdxj for cdxj in rec_cdxj if '"mime": "warc/revisit"' in cdxj]) == 1
+
+    def test_dedup_bloom_extract_patch(self):
+        self._test_warc_write('http://httpbin.org/get?extract=1', user='USER', coll='COLL', rec='REC_EXT')
+        self._test_warc_write('http://httpbin.org/get?patch=1', user='USER', coll='COLL', rec='REC_PATCH')
+
+        cdxj = self.redis.zrange('r:REC_PATCH:cdxj', 0, -1)[0].split(' ', 2)
+        data = json.loads(cdxj[2])
+
+        # extract with patch, writing to the patch recording
+        params = {'param.user': 'USER',
+                  'param.coll': 'COLL',
+                  'param.rec': 'REC_EXT',
+                  'param.recorder.rec': 'REC_PATCH',
+                  'param.recorder.patch_rec': 'REC_PATCH'}
+
+        res = self.wr_rec.dedup_index.lookup_revisit(params, 'sha1:' + data['digest'], data['url'],
+                                                     timestamp_to_iso_date(cdxj[1]))
+
+        assert res[0] == 'revisit'
+        assert res[1] == data['url']
+
+    def test_compact_index_revisit(self):
+        # collection index built
+        self.redis.set('c:COLL:cdxj:ready', 1)
+
+        with patch.object(CDXJCodec, 'ENABLED', True):
+            self._test_warc_write('http://httpbin.org/get?compact=1', user='USER', coll='COLL', rec='REC11')
+            self._test_warc_write('http://httpbin.org/get?compact=1', user='USER', coll='COLL', rec='REC11')
+
+        rec_cdxj = self.redis.zrange('r:REC11:cdxj', 0, -1)
+        assert len(rec_cdxj) == 2
+        assert all(CDXJCodec.is_compact(cdxj) for cdxj in rec_cdxj)
+        assert set(rec_cdxj) <= set(self.redis.zrange('c:COLL:cdxj', 0, -1))
+
+        # dedup lookup decodes compact lines
+        rec_cdxj = list(CDXJCodec(self.redis).decode_lines('COLL', rec_cdxj))
+        assert len([cdxj for cdxj in rec_cdxj if '"mime": "warc/revisit"' in cdxj]) == 1
+        assert all('"filename": "rec-' in cdxj for cdxj in rec_cdxj)
+
+    def get_bloom_filter(self, redis):
+        config = {'dedup_bloom_bits': 1024, 'dedup_bloom_hashes': 4,
+                  'dedup_bloom_max_local': 2, 'dedup_bloom_sync_secs': 30}
+
+        return DedupBloomFilter(redis, 'r:{rec}:_bf', config)
+
+    def test_dedup_bloom_filter(self):
+        bloom = self.get_bloom_filter(self.redis)
+        params = {'param.rec': 'REC9'}
+
+        # no filter, always check
+        assert bloom.might_contain(params, 'r:REC9:cdxj', 'sha1:ABCD')
+
+        with self.redis.pipeline(transaction=False) as pi:
+            bloom.add_digests(pi, params, 'r:REC9:cdxj', ['ABCD'])
+            pi.execute()
+
+        assert bloom.might_contain(params, 'r:REC9:cdxj', 'sha1:ABCD')
+        assert not bloom.might_contain(params, 'r:REC9:cdxj', 'sha1:EFGH')
+
+        # filter loaded from redis
+        other = self.get_bloom_filter(self.redis)
+        assert other.might_contain(params, 'r:REC9:cdxj', 'sha1:ABCD')
+        assert not other.might_contain(params, 'r:REC9:cdxj', 'sha1:EFGH')
+
+        # existing index without filter, not added
+        self.redis.zadd('r:REC10:cdxj', 0, 'com,example)/ 20180101000000 {}')
+
+        with self.redis.pipeline(transaction=False) as pi:
+            bloom.add_digests(pi, {'param.rec': 'REC10'}, 'r:REC10:cdxj', ['ABCD'])
+            pi.execute()
+
+        assert not self.redis.exists('r:REC10:_bf')
+        assert bloom.might_contain({'param.rec': 'REC10'}, 'r:REC10:cdxj', 'sha1:EFGH')
+        assert other.might_contain({'param.rec': 'REC10'}, 'r:REC10:cdxj', 'sha1:EFGH')
+
+        # least recently used dropped
+        assert list(other.filters.keys()) == ['r:REC9:_bf', 'r:REC10:_bf']
+
+    def test_dedup_bloom_miss_no_redis_call(self):
+        with patch.object(self.wr_rec.dedup_index.dedup_bloom, 'redis', wraps=self.redis) as mock_redis:
+            self._test_warc_write('http://httpbin.org/get?bloom=1', user='USER', coll='COLL', rec='REC12')
+            self._test_warc_write('http://httpbin.org/get?bloom=1', user='USER', coll='COLL', rec='REC12')
+
+            # filter synced once started
+            assert len(mock_redis.method_calls) == 2
+            mock_redis.reset_mock()
+
+            # miss answered locally, without index lookup
+            dedup_index = self.wr_rec.dedup_index
+            with patch.object(dedup_index, 'cdx_lookup', wraps=dedup_index.cdx_lookup) as mock_lookup:
+                self._test_warc_write('http://httpbin.org/get?bloom=2', user='USER', coll='COLL', rec='REC12')
+
+            assert mock_redis.method_calls == []
+            assert not mock_lookup.called
+
+        rec_cdxj = self.redis.zrange('r:REC12:cdxj', 0, -1)
+        assert len(rec_cdxj) == 3
+        assert len([cdxj for cdxj in rec_cdxj if '"mime": "warc/revisit"' in cdxj]) == 1
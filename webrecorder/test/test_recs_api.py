@@ -155,6 +155,66 @@ class TestWebRecRecAPI(FullStackTests):
         assert {'id': self.ID_1, 'rec': 'rec-a', 'title': 'Example', 'url': 'http://example.com/', 'timestamp': '2016010203000000'} in res.json['collection']['pages']
         assert {'id': self.ID_2, 'rec': 'rec-a', 'title': 'Example', 'url': 'http://example.com/foo/bar', 'timestamp': '2015010203000000'} in res.json['collection']['pages']
 
+    def test_page_list_paginated(self):
+        res = self._anon_get('/api/v1/recording/{rec_id_0}/pages?user={user}&coll=temp&limit=2')
+
+        # timestamp order
+        assert [page['id'] for page in res.json['pages']] == [self.ID_3, self.ID_2]
+        assert res.json['next_cursor']
+
+        res = self._anon_get('/api/v1/recording/{rec_id_0}/pages?user={user}&coll=temp&limit=2&cursor=' + res.json['next_cursor'])
+
+        assert [page['id'] for page in res.json['pages']] == [self.ID_1]
+        assert res.json['next_cursor'] == None
+
+        res = self._anon_get('/api/v1/recording/{rec_id_1}/pages?user={user}&coll=temp&limit=2')
+        assert res.json == {'pages': [], 'next_cursor': None}
+
+    def test_page_list_reindex(self):
+        coll, rec = self.get_coll_rec(self.anon_user, 'temp', self.rec_ids[0])
+
+        # pages added before indexes, indexed on first lookup
+        self.redis.delete('c:{0}:p_ts'.format(coll), 'r:{0}:p'.format(rec))
+
+        res = self._anon_get('/api/v1/recording/{rec_id_0}/pages?user={user}&coll=temp&limit=2')
+        assert [page['id'] for page in res.json['pages']] == [self.ID_3, self.ID_2]
+
+        assert self.redis.zcard('c:{0}:p_ts'.format(coll)) == 3
+        assert self.redis.zcard('r:{0}:p'.format(rec)) == 3
+
+    def test_page_list_invalid_limit(self):
+        res = self._anon_get('/api/v1/recording/{rec_id_0}/pages?user={user}&coll=temp&limit=abc', status=400)
+        assert res.json == {'error': 'invalid_limit'}
+
+        res = self._anon_get('/api/v1/collection/temp/pages?user={user}&limit=0', status=400)
+        assert res.json == {'error': 'invalid_limit'}
+
+    def test_num_pages(self):
+        res = self._anon_get('/api/v1/recording/{rec_id_0}/num_pages?user={user}&coll=temp')
+        assert res.json == {'count': 3}
+
+        res = self._anon_get('/api/v1/recording/{rec_id_1}/num_pages?user={user}&coll=temp')
+        assert res.json == {'count': 0}
+
+    def test_coll_page_list_paginated(self):
+        res = self._anon_get('/api/v1/collection/temp/pages?user={user}&limit=1')
+
+        assert [page['id'] for page in res.json['pages']] == [self.ID_3]
+
+        res = self._anon_get('/api/v1/collection/temp/pages?user={user}&limit=5&cursor=' + res.json['next_cursor'])
+
+        assert [page['id'] for page in res.json['pages']] == [self.ID_2, self.ID_1]
+        assert res.json['next_cursor'] == None
+
+        res = self._anon_get('/api/v1/collection/temp/pages?user={user}')
+        assert len(res.json['pages']) == 3
+
+    def test_coll_no_pages(self):
+        res = self._anon_get('/api/v1/collection/temp?user={user}&include_pages=0')
+
+        assert 'pages' not in res.json['collection']
+        assert len(res.json['collection']['recordings']) == 3
+
     def _test_page_delete(self):
         params = {'url': 'http://example.com/foo/bar', 'timestamp': '2015010203000000'}
         res = self._anon_delete('/api/v1/recording/{rec_id_0}/pages?user={user}&coll=temp', params=params)
@@ -203,4 +263,9 @@ class TestWebRecRecAPI(FullStackTests):
 
         assert len(res.json['collection']['pages']) == 0
 
+        res = self._anon_get('/api/v1/collection/temp/pages?user={user}&limit=10')
+        assert res.json == {'pages': [], 'next_cursor': None}
+
+        assert not self.redis.exists('r:rec-a:p')
+
 
@@ -0,0 +1,235 @@
+from .testutils import BaseWRTests
+
+from webrecorder.rec.storage.s3 import S3Storage, S3StreamingUpload
+
+import os
+import time
+import base64
+import hashlib
+import tempfile
+import threading
+
+
+# ============================================================================
+class FakeS3(object):
+    def __init__(self, fail_parts=None, part_delay=0):
+        self.objects = {}
+        self.etags = {}
+        self.uploads = {}
+        self.aborted = []
+
+        # part number -> number of times to fail
+        self.fail_parts = fail_parts or {}
+        self.part_delay = part_delay
+
+        self.active = 0
+        self.max_active = 0
+
+        self.lock = threading.Lock()
+
+    def _check_md5(self, data, content_md5):
+        md5 = hashlib.md5(data)
+        assert base64.b64encode(md5.digest()).decode('utf-8') == content_md5
+        return '"' + md5.hexdigest() + '"'
+
+    def put_object(self, Bucket, Key, Body, ContentMD5):
+        self.objects[Key] = Body
+        self.etags[Key] = self._check_md5(Body, ContentMD5)
+        return {'ETag': self.etags[Key]}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise Exception('Not Found')
+
+        return {'ContentLength': len(self.objects[Key]), 'ETag': self.etags[Key]}
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = 'upload-' + str(len(self.uploads))
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, ContentMD5):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.active, self.max_active)
+
+        time.sleep(self.part_delay)
+
+        with self.lock:
+            self.active -= 1
+
+            if self.fail_parts.get(PartNumber):
+                self.fail_parts[PartNumber] -= 1
+                raise Exception('Part Failed')
+
+            self.uploads[UploadId][PartNumber] = Body
+
+        return {'ETag': self._check_md5(Body, ContentMD5)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+
+        assert [part['PartNumber'] for part in MultipartUpload['Parts']] == sorted(parts.keys())
+
+        data = [parts[part['PartNumber']] for part in MultipartUpload['Parts']]
+
+        self.objects[Key] = b''.join(data)
+        self.etags[Key] = '"{0}-{1}"'.format(hashlib.md5(b''.join(hashlib.md5(part).digest() for part in data)).hexdigest(),
+                                             len(data))
+        return {'ETag': self.etags[Key]}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.aborted.append(UploadId)
+
+
+# ============================================================================
+class TestS3Upload(object):
+    PART_SIZE = 5242880
+
+    @classmethod
+    def setup_class(cls):
+        os.environ['S3_ROOT'] = 's3://bucket/path/'
+
+        cls.data = os.urandom(cls.PART_SIZE * 7 + 1000)
+
+        with tempfile.NamedTemporaryFile(suffix='.warc.gz', delete=False) as fh:
+            fh.write(cls.data)
+            cls.filename = fh.name
+
+    @classmethod
+    def teardown_class(cls):
+        os.remove(cls.filename)
+        del os.environ['S3_ROOT']
+
+    def get_storage(self, s3):
+        storage = S3Storage()
+        storage.s3 = s3
+        storage.UPLOAD_PART_SIZE = self.PART_SIZE
+        storage.UPLOAD_THREADS = 4
+        storage.UPLOAD_PART_RETRIES = 2
+        return storage
+
+    def test_small_upload(self):
+        s3 = FakeS3()
+        storage = self.get_storage(s3)
+
+        with tempfile.NamedTemporaryFile() as fh:
+            fh.write(b'small')
+            fh.flush()
+            assert storage.do_upload('path/small.cdxj', fh.name)
+
+        assert s3.objects['path/small.cdxj'] == b'small'
+        assert s3.uploads == {}
+
+    def test_multipart_upload(self):
+        s3 = FakeS3(part_delay=0.1)
+        storage = self.get_storage(s3)
+
+        assert storage.do_upload('path/test.warc.gz', self.filename)
+
+        assert s3.objects['path/test.warc.gz'] == self.data
+
+        # 8 parts, up to 4 at a time
+        assert s3.max_active > 1
+        assert s3.max_active <= 4
+
+    def test_multipart_upload_retry_part(self):
+        s3 = FakeS3(fail_parts={3: 2, 8: 1})
+        storage = self.get_storage(s3)
+
+        assert storage.do_upload('path/test.warc.gz', self.filename)
+
+        assert s3.objects['path/test.warc.gz'] == self.data
+        assert s3.aborted == []
+
+    def test_multipart_upload_failed_abort(self):
+        s3 = FakeS3(fail_parts={2: 3})
+        storage = self.get_storage(s3)
+
+        assert not storage.do_upload('path/test.warc.gz', self.filename)
+
+        assert 'path/test.warc.gz' not in s3.objects
+        assert s3.aborted == ['upload-0']
+        assert s3.uploads == {}
+
+    def test_streaming_upload(self):
+        s3 = FakeS3()
+        storage = self.get_storage(s3)
+
+        with tempfile.NamedTemporaryFile() as fh:
+            upload = S3StreamingUpload(storage, 'path/stream.warc.gz', fh.name)
+
+            # write in chunks smaller than a part
+            chunk_size = 1000000
+            for offset in range(0, len(self.data), chunk_size):
+                fh.write(self.data[offset:offset + chunk_size])
+                fh.flush()
+                upload.add_data(offset + len(self.data[offset:offset + chunk_size]))
+
+            # full parts uploaded while writing
+            assert len(upload.parts) == 7
+
+            assert upload.finish(len(self.data)) == 's3://bucket/path/stream.warc.gz'
+
+            assert s3.objects['path/stream.warc.gz'] == self.data
+
+            storage.get_target_url = lambda collection, obj_type, filename: 'path/' + filename
+
+            # already uploaded, not uploaded again on commit
+            s3.create_multipart_upload = None
+            assert storage.upload_file(None, None, None, 'stream.warc.gz', fh.name, None,
+                                       streamed_url='s3://bucket/path/stream.warc.gz')
+            del s3.create_multipart_upload
+
+            # same size, but not same data
+            s3.objects['path/stream.warc.gz'] = b'x' * len(self.data)
+            s3.etags['path/stream.warc.gz'] = '"other"'
+            assert not storage.is_uploaded('path/stream.warc.gz', fh.name)
+
+            # uploaded again if not streamed to same target
+            assert storage.upload_file(None, None, None, 'stream.warc.gz', fh.name, None,
+                                       streamed_url='s3://bucket/other/stream.warc.gz')
+
+        assert s3.objects['path/stream.warc.gz'] == self.data
+
+    def test_streaming_upload_small(self):
+        s3 = FakeS3()
+        storage = self.get_storage(s3)
+
+        with tempfile.NamedTemporaryFile() as fh:
+            fh.write(b'small')
+            fh.flush()
+
+            upload = S3StreamingUpload(storage, 'path/stream-small.warc.gz', fh.name)
+            assert upload.finish(5) == 's3://bucket/path/stream-small.warc.gz'
+
+            assert storage.is_uploaded('path/stream-small.warc.gz', fh.name)
+
+    def test_streaming_upload_bounded(self):
+        s3 = FakeS3(part_delay=0.1)
+        storage = self.get_storage(s3)
+        storage.UPLOAD_THREADS = 2
+
+        upload = S3StreamingUpload(storage, 'path/stream-bounded.warc.gz', self.filename)
+        upload.add_data(len(self.data))
+
+        assert upload.finish(len(self.data)) == 's3://bucket/path/stream-bounded.warc.gz'
+        assert s3.objects['path/stream-bounded.warc.gz'] == self.data
+
+        # parts uploaded at most 2 at a time
+        assert s3.max_active == 2
+
+    def test_streaming_upload_failed_abort(self):
+        s3 = FakeS3(fail_parts={1: 3})
+        storage = self.get_storage(s3)
+
+        upload = S3StreamingUpload(storage, 'path/stream-fail.warc.gz', self.filename)
+        upload.add_data(len(self.data))
+
+        assert upload.finish(len(self.data)) is None
+        assert s3.aborted == ['upload-0']
+
+        # uploaded on commit instead
+        assert storage.do_upload('path/stream-fail.warc.gz', self.filename)
+        assert s3.objects['path/stream-fail.warc.gz'] == self.data
@@ -13,6 +13,7 @@ from itertools import count
 REC_CDXJ = 'r:500:cdxj'
 REC_WARC = 'r:500:warc'
 REC_INFO = 'r:500:info'
+COMMIT_QUEUE = 'q:commit'
 COLL_ID = '100'
 
 
@@ -57,6 +58,9 @@ class BaseStorageCommit(FullStackTests):
 
         self.sleep_try(0.3, 10.0, self.assert_exists(REC_CDXJ, True))
 
+        # scheduled for commit when open rec expires
+        assert self.redis.zscore(COMMIT_QUEUE, '500') > 0
+
     def test_record_2_temp(self):
         res = self.testapp.get('/_new/default-collection/rec/record/mp_/http://httpbin.org/get?food=bar')
         assert res.status_code == 302
@@ -102,6 +106,11 @@ class BaseStorageCommit(FullStackTests):
         for key in result:
             self.assert_warc_key(result[key])
 
+        def assert_not_scheduled():
+            assert self.redis.zscore(COMMIT_QUEUE, '500') is None
+
+        self.sleep_try(0.1, 5.0, assert_not_scheduled)
+
     def test_replay_1(self):
         def assert_replay():
             res = self.testapp.get('/test/default-collection/mp_/http://httpbin.org/get?food=bar')
@@ -0,0 +1,66 @@
+from .testutils import BaseWRTests
+
+from webrecorder.load.wamloader import WAMLoader
+
+
+# ============================================================================
+class TestWAMLoader(object):
+    def get_loader(self, archives):
+        loader = WAMLoader()
+        loader.replay_info = {}
+
+        for pk, replay_url, collections in archives:
+            webarchive = {'name': pk,
+                          'apis': {'wayback': {'replay': {'raw': replay_url}}}}
+
+            if collections:
+                webarchive['collections'] = collections
+
+            assert loader.load_archive(pk, webarchive)
+
+        return loader
+
+    def test_find_archive(self):
+        loader = self.get_loader([('ia', 'https://web.archive.org/web/{timestamp}id_/{url}', None),
+                                  ('ait', 'https://wayback.archive-it.org/{collection}/{timestamp}id_/{url}', '.*')])
+
+        assert loader.find_archive_for_url('https://web.archive.org/web/2018id_/http://example.com/') == \
+               ('ia', '2018id_/example.com/', 'ia')
+
+        # scheme ignored
+        assert loader.find_archive_for_url('http://web.archive.org/web/2018/http://example.com/') == \
+               ('ia', '2018/example.com/', 'ia')
+
+        # collection captured from url
+        assert loader.find_archive_for_url('https://wayback.archive-it.org/1234/2018id_/http://example.com/') == \
+               ('ait', '2018id_/example.com/', 'ait:1234')
+
+    def test_no_match(self):
+        loader = self.get_loader([('ia', 'https://web.archive.org/web/{timestamp}id_/{url}', None)])
+
+        assert loader.find_archive_for_url('https://example.com/web.archive.org/web/') is None
+        assert loader.find_archive_for_url('https://web.archive.org/other/') is None
+
+        loader.replay_info = {}
+        assert loader.find_archive_for_url('https://web.archive.org/web/2018/http://example.com/') is None
+
+    def test_overlapping_prefixes_first_match(self):
+        loader = self.get_loader([('long', 'http://archive.example.com/wayback/{timestamp}id_/{url}', None),
+                                  ('short', 'http://archive.example.com/{timestamp}id_/{url}', None)])
+
+        assert loader.find_archive_for_url('http://archive.example.com/wayback/2018/http://example.com/')[0] == 'long'
+        assert loader.find_archive_for_url('http://archive.example.com/2018/http://example.com/')[0] == 'short'
+
+        # first listed prefix matches, even if shorter
+        loader = self.get_loader([('short', 'http://archive.example.com/{timestamp}id_/{url}', None),
+                                  ('long', 'http://archive.example.com/wayback/{timestamp}id_/{url}', None)])
+
+        assert loader.find_archive_for_url('http://archive.example.com/wayback/2018/http://example.com/') == \
+               ('short', 'wayback/2018/example.com/', 'short')
+
+    def test_recompiled_on_load(self):
+        loader = self.get_loader([('ia', 'https://web.archive.org/web/{timestamp}id_/{url}', None)])
+        assert loader.find_archive_for_url('https://example.com/wayback/2018/http://example.com/') is None
+
+        loader.load_archive('ex', {'apis': {'wayback': {'replay': {'raw': 'https://example.com/wayback/{timestamp}id_/{url}'}}}})
+        assert loader.find_archive_for_url('https://example.com/wayback/2018/http://example.com/')[0] == 'ex'
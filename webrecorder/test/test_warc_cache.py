@@ -0,0 +1,131 @@
+from .testutils import FakeStrictRedis
+
+from webrecorder.load.warccache import CachingS3Loader
+from webrecorder.models.stats import Stats
+from webrecorder.utils import today_str
+
+from io import BytesIO
+
+import gevent
+import tempfile
+import shutil
+import os
+
+
+# ============================================================================
+class MockS3Loader(CachingS3Loader):
+    def __init__(self, data):
+        super(MockS3Loader, self).__init__()
+        self.data = data
+        self.fetches = []
+
+    def fetch(self, url, offset, length):
+        self.fetches.append((url, offset, length))
+        gevent.sleep(0.05)
+        return BytesIO(self.data[offset:offset + length])
+
+
+# ============================================================================
+class TestWarcCache(object):
+    @classmethod
+    def setup_class(cls):
+        cls.cache_dir = tempfile.mkdtemp()
+        cls.redis = FakeStrictRedis(decode_responses=True)
+
+        config = {'warc_cache_max_size': 10000,
+                  'warc_cache_max_item_size': 2000,
+                  'warc_cache_lock_secs': 30,
+                  'warc_cache_stats_secs': 10}
+
+        CachingS3Loader.init_props(config, cls.redis, cls.cache_dir)
+
+        cls.data = os.urandom(20000)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.cache_dir)
+
+    def test_cache_hit(self):
+        loader = MockS3Loader(self.data)
+
+        assert loader.load('s3://bucket/a.warc.gz', 100, 500).read() == self.data[100:600]
+        assert loader.load('s3://bucket/a.warc.gz', 100, 500).read() == self.data[100:600]
+
+        assert loader.fetches == [('s3://bucket/a.warc.gz', 100, 500)]
+
+        # counted in process until flushed
+        today = today_str()
+        assert self.redis.hget(Stats.WARC_CACHE_HIT_KEY, today) is None
+        assert CachingS3Loader.stats_timer
+
+        CachingS3Loader.flush_stats()
+        assert CachingS3Loader.stats_timer is None
+
+        assert self.redis.hget(Stats.WARC_CACHE_HIT_KEY, today) == '1'
+        assert self.redis.hget(Stats.WARC_CACHE_MISS_KEY, today) == '1'
+
+    def test_not_cached_large_or_unknown_length(self):
+        loader = MockS3Loader(self.data)
+
+        loader.load('s3://bucket/a.warc.gz', 0, 5000)
+        loader.load('s3://bucket/a.warc.gz', 0, 5000)
+
+        assert len(loader.fetches) == 2
+
+    def test_concurrent_miss_single_fetch(self):
+        loader = MockS3Loader(self.data)
+
+        jobs = [gevent.spawn(loader.load, 's3://bucket/b.warc.gz', 1000, 1000) for x in range(5)]
+        gevent.joinall(jobs)
+
+        assert [job.value.read() for job in jobs] == [self.data[1000:2000]] * 5
+        assert len(loader.fetches) == 1
+
+    def test_evict_lru(self):
+        loader = MockS3Loader(self.data)
+
+        # 15 * 1000 bytes, over max size of 10000
+        for offset in range(5000, 20000, 1000):
+            loader.load('s3://bucket/c.warc.gz', offset, 1000)
+
+        loader.evict()
+
+        total_size = sum(entry.stat().st_size for entry in os.scandir(self.cache_dir))
+        assert total_size <= 9000
+
+        # most recent still cached
+        fetches = len(loader.fetches)
+        loader.load('s3://bucket/c.warc.gz', 19000, 1000)
+        assert len(loader.fetches) == fetches
+
+    def test_stale_lock(self):
+        loader = MockS3Loader(self.data)
+
+        path = os.path.join(self.cache_dir, 'stale')
+        lock_path = path + '.lock'
+
+        with open(lock_path, 'w') as fh:
+            fh.write('other')
+
+        os.utime(lock_path, (0, 0))
+
+        loader.fetch_to_cache(path, 's3://bucket/d.warc.gz', 0, 100)
+
+        assert len(loader.fetches) == 1
+        assert not os.path.isfile(lock_path)
+
+        # lock taken over by other process during slow fetch, not removed
+        def fetch(url, offset, length):
+            with open(lock_path, 'w') as fh:
+                fh.write('other')
+
+            return BytesIO(self.data[offset:offset + length])
+
+        os.remove(path)
+        loader.fetch = fetch
+        loader.fetch_to_cache(path, 's3://bucket/d.warc.gz', 0, 100)
+
+        with open(lock_path) as fh:
+            assert fh.read() == 'other'
+
+        os.remove(lock_path)
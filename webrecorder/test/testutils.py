@@ -90,6 +90,9 @@ class BaseWRTests(FakeRedisTests, TempDirTests, BaseTestClass):
         cls.redis = FakeStrictRedis.from_url(os.environ['REDIS_BASE_URL'], decode_responses=True)
         cls.sesh_redis = FakeStrictRedis.from_url(os.environ['REDIS_SESSION_URL'], decode_responses=True)
 
+        # new redis, collection indexes not yet built
+        Collection.coll_index_ready.clear()
+
         cls.custom_init(kwargs)
 
         if kwargs.get('no_app'):
@@ -259,13 +262,15 @@ class FullStackTests(HttpBinLiveTests, BaseWRTests):
         storage_worker = kwargs.get('storage_worker')
         temp_worker = kwargs.get('temp_worker')
 
+        cls.worker_greenlets = []
+
         cls.storage_worker = Worker(StorageCommitter) if storage_worker else None
         if cls.storage_worker:
-            gevent.spawn(cls.storage_worker.run)
+            cls.worker_greenlets.append(gevent.spawn(cls.storage_worker.run))
 
         cls.temp_worker = Worker(TempChecker) if temp_worker else None
         if cls.temp_worker:
-            gevent.spawn(cls.temp_worker.run)
+            cls.worker_greenlets.append(gevent.spawn(cls.temp_worker.run))
 
     @classmethod
     def teardown_class(cls, *args, **kwargs):
@@ -277,6 +282,9 @@ class FullStackTests(HttpBinLiveTests, BaseWRTests):
         if cls.storage_worker:
             cls.storage_worker.stop()
 
+        # no worker runs into the next test class
+        gevent.joinall(cls.worker_greenlets)
+
         cls.runner.close()
         super(FullStackTests, cls).teardown_class(*args, **kwargs)
 
@@ -64,6 +64,13 @@ class AdminController(BaseController):
 
         'Num Temp Collections Added': Stats.TEMP_MOVE_COUNT_KEY,
         'Temp Collection Size Added': Stats.TEMP_MOVE_SIZE_KEY,
+
+        'Num Commits': Stats.COMMIT_COUNT_KEY,
+        'Commit Time (ms)': Stats.COMMIT_TIME_KEY,
+        'Max Commit Queue': Stats.COMMIT_QUEUE_KEY,
+
+        'WARC Cache Hits': Stats.WARC_CACHE_HIT_KEY,
+        'WARC Cache Misses': Stats.WARC_CACHE_MISS_KEY,
     }
 
     CUSTOM_STATS = [
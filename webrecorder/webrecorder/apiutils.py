@@ -87,7 +87,15 @@ class WRAPISpec(object):
         'order': {'type': 'array',
                   'items': {'type': 'string'},
                   'description': 'an array of existing ids in new order'
-                 }
+                 },
+
+        'cursor': {'type': 'string',
+                   'description': 'Return results after this cursor, from next_cursor of previous response',
+                  },
+
+        'limit': {'type': 'integer',
+                  'description': 'Max number of results, returned with next_cursor if more results',
+                 },
     }
 
     all_responses = {}
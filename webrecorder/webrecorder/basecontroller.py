@@ -147,6 +147,27 @@ class BaseController(object):
 
         return user, collection
 
+    def get_pages_range(self, collection, recording=None):
+        cursor = request.query.getunicode('cursor')
+        limit = request.query.get('limit')
+
+        # not paginated
+        if not cursor and not limit:
+            pages, _ = collection.list_pages_range(recording=recording)
+            return {'pages': pages}
+
+        try:
+            limit = int(limit) if limit else None
+            assert limit is None or limit > 0
+        except (ValueError, AssertionError):
+            self._raise_error(400, 'invalid_limit')
+
+        pages, next_cursor = collection.list_pages_range(cursor=cursor,
+                                                         limit=limit,
+                                                         recording=recording)
+
+        return {'pages': pages, 'next_cursor': next_cursor}
+
     def _raise_error(self, code, message='not_found'):
         result = {'error': message}
         #result.update(kwargs)
@@ -101,12 +101,16 @@ class CollsController(BaseController):
             return {'collections': [coll.serialize(**kwargs) for coll in collections]}
 
         @self.app.get('/api/v1/collection/<coll_name>')
-        @self.api(query=['user'],
+        @self.api(query=['user', 'include_pages'],
                   resp='collection')
         def get_collection(coll_name):
             user = self.get_user(api=True, redir_check=False)
 
-            return self.get_collection_info(coll_name, user=user)
+            # for large collections, pages can be loaded separately
+            include_coll_pages = get_bool(request.query.get('include_pages', True))
+
+            return self.get_collection_info(coll_name, user=user,
+                                            include_coll_pages=include_coll_pages)
 
         @self.app.delete('/api/v1/collection/<coll_name>')
         @self.api(query=['user'],
@@ -193,6 +197,19 @@ class CollsController(BaseController):
             collection.mark_updated()
             return {'collection': collection.serialize()}
 
+        @self.app.get('/api/v1/collection/<coll_name>/pages')
+        @self.api(query=['user', 'cursor', 'limit'],
+                  resp='pages')
+        def get_collection_pages(coll_name):
+            user, collection = self.load_user_coll(coll_name=coll_name)
+
+            self.access.assert_can_read_coll(collection)
+
+            if not self.access.is_coll_owner(collection) and not collection.get_bool_prop('public_index'):
+                self._raise_error(404, 'no_such_collection')
+
+            return self.get_pages_range(collection)
+
         @self.app.get('/api/v1/collection/<coll_name>/page_bookmarks')
         @self.api(query=['user'],
                   resp='bookmarks')
@@ -298,13 +315,13 @@ class CollsController(BaseController):
 
         return result
 
-    def get_collection_info(self, coll_name, user=None, include_pages=False):
+    def get_collection_info(self, coll_name, user=None, include_pages=False, include_coll_pages=True):
         user, collection = self.load_user_coll(user=user, coll_name=coll_name)
 
         result = {'collection': collection.serialize(include_rec_pages=include_pages,
                                                      include_lists=True,
                                                      include_recordings=True,
-                                                     include_pages=True,
+                                                     include_pages=include_coll_pages,
                                                      check_slug=coll_name)}
 
         result['user'] = user.my_id
@@ -14,7 +14,7 @@ from pywb.apps.rewriterapp import RewriterApp, UpstreamException
 
 from webrecorder.basecontroller import BaseController, wr_api_spec
 from webrecorder.load.wamloader import WAMLoader
-from webrecorder.utils import get_bool
+from webrecorder.utils import get_bool, get_record_host
 
 from webrecorder.models.dynstats import DynStats
 from webrecorder.models.stats import Stats
@@ -48,7 +48,7 @@ class ContentController(BaseController, RewriterApp):
 
         self.cookie_tracker = CookieTracker(self.redis)
 
-        self.record_host = os.environ['RECORD_HOST']
+        self.record_hosts = os.environ['RECORD_HOST'].split(',')
         self.live_host = os.environ['WARCSERVER_HOST']
         self.replay_host = os.environ.get('WARCSERVER_PROXY_HOST')
         if not self.replay_host:
@@ -456,7 +456,7 @@ class ContentController(BaseController, RewriterApp):
             recording = info['recording']
 
             if kwargs['type'] == 'replay-coll':
-                collection.sync_coll_index(exists=False,  do_async=False)
+                collection.sync_coll_index(do_async=True)
 
             url = self.add_query(url)
 
@@ -688,7 +688,8 @@ class ContentController(BaseController, RewriterApp):
                 return self.redirect(new_url)
 
         elif type == 'replay-coll' and not is_top_frame:
-            collection.sync_coll_index(exists=False, do_async=False)
+            # replayed from recording indexes until built
+            collection.sync_coll_index(do_async=True)
 
         kwargs = dict(user=user,
                       id=sesh.get_id(),
@@ -857,7 +858,9 @@ class ContentController(BaseController, RewriterApp):
 
         type = kwargs['type']
 
-        base_url = self.paths[type].format(record_host=self.record_host,
+        record_host = get_record_host(self.record_hosts, kwargs.get('rec'), kwargs.get('patch_rec'))
+
+        base_url = self.paths[type].format(record_host=record_host,
                                            replay_host=self.replay_host,
                                            live_host=self.live_host,
                                            **kwargs)
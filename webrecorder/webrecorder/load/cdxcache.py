@@ -0,0 +1,75 @@
+from pywb.warcserver.index.indexsource import BaseIndexSource
+from pywb.warcserver.index.cdxobject import CDXObject
+from pywb.utils.format import res_template
+
+from webrecorder.models.collection import Collection
+
+from collections import OrderedDict
+from itertools import chain
+
+
+# ============================================================================
+# In-process LRU cache of index lookups, for urls replayed over and over.
+# Entries hold the cdxj lines found for an index key and search range
+# (the range for the requested url and match type, closest sorting is applied
+# after lookup). An entry is valid while the collection index generation
+# is unchanged: it is incremented after any change to the collection
+# or its recordings' indexes, checked with a single GET per lookup.
+class CachingIndexSource(BaseIndexSource):
+    def __init__(self, source, index_key_templ, redis, config):
+        self.source = source
+        self.index_key_templ = index_key_templ
+        self.redis = redis
+
+        self.max_entries = int(config['cdx_cache_max_entries'])
+        self.max_lines = int(config['cdx_cache_max_lines'])
+
+        # (index key, key, end key) -> (generation, lines), least recently used first
+        self.cache = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def load_index(self, params):
+        if not self.max_entries:
+            return self.source.load_index(params)
+
+        gen = self.redis.get(res_template(Collection.COLL_CDXJ_GEN_KEY, params))
+
+        cache_key = (res_template(self.index_key_templ, params), params['key'], params['end_key'])
+
+        entry = self.cache.get(cache_key)
+        if entry and entry[0] == gen:
+            self.cache.move_to_end(cache_key)
+            self.hits += 1
+            return (CDXObject(line) for line in entry[1])
+
+        self.misses += 1
+
+        cdx_iter = iter(self.source.load_index(params))
+
+        cdx_list = []
+        for cdx in cdx_iter:
+            cdx_list.append(cdx)
+
+            # too many lines to cache, continue lookup
+            if len(cdx_list) > self.max_lines:
+                self.cache.pop(cache_key, None)
+                return chain(cdx_list, cdx_iter)
+
+        if len(self.cache) >= self.max_entries:
+            self.cache.popitem(last=False)
+
+        self.cache[cache_key] = (gen, [cdx.cdxline for cdx in cdx_list])
+
+        return iter(cdx_list)
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(self.__class__.__name__, self.source)
+
+    def __str__(self):
+        return str(self.source)
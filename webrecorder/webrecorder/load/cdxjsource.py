@@ -0,0 +1,315 @@
+from pywb.warcserver.index.indexsource import BaseIndexSource
+from pywb.warcserver.index.cdxobject import CDXObject
+from pywb.utils.format import res_template
+from pywb.utils.loaders import BlockLoader
+from pywb.utils.wbexception import NotFoundException
+
+from webrecorder.models.recording import Recording
+from webrecorder.models.collection import Collection
+from webrecorder.models.cdxjcodec import CDXJCodec
+from webrecorder.rec.storage.storagepaths import strip_prefix
+from webrecorder.utils import redis_pipeline
+
+from gevent.event import AsyncResult
+from collections import OrderedDict
+
+import hashlib
+import heapq
+import shutil
+import mmap
+import os
+
+
+# ============================================================================
+# Sorted cdxj file, memory-mapped and shared by all lookups.
+# Each lookup tracks its own position, so concurrent lookups
+# do not share a file position.
+class MmapCDXJIndex(object):
+    def __init__(self, filename):
+        with open(filename, 'rb') as fh:
+            if os.fstat(fh.fileno()).st_size > 0:
+                self.mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.mm = None
+
+    def find_start(self, key):
+        # binary search for start of first line >= key
+        mm = self.mm
+        lo = 0
+        hi = len(mm)
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            line_start = mm.rfind(b'\n', 0, mid) + 1
+
+            line_end = mm.find(b'\n', line_start)
+            if line_end < 0:
+                line_end = len(mm)
+
+            if mm[line_start:line_end] < key:
+                lo = line_end + 1
+            else:
+                hi = line_start
+
+        return lo
+
+    def iter_range(self, key, end_key):
+        # lines where key <= line < end_key
+        if not self.mm:
+            return
+
+        mm = self.mm
+        size = len(mm)
+        pos = self.find_start(key)
+
+        while pos < size:
+            line_end = mm.find(b'\n', pos)
+            if line_end < 0:
+                line_end = size
+
+            line = mm[pos:line_end]
+            if line >= end_key:
+                break
+
+            if line:
+                yield line
+
+            pos = line_end + 1
+
+
+# ============================================================================
+# Index source for a single recording. While the recording is open or
+# not yet committed, lookups go to the recording's redis index.
+# Once committed, lookups binary search the committed cdxj file,
+# downloading remote index files to a local cache dir first.
+class CommittedCDXJIndexSource(BaseIndexSource):
+    MAX_OPEN = 256
+    CACHE_MAX_SIZE = 0
+
+    def __init__(self, redis_source, cache_dir, config):
+        self.redis_source = redis_source
+        self.redis = redis_source.redis
+
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.MAX_OPEN = int(config['cdxj_max_open'])
+        self.CACHE_MAX_SIZE = int(config['cdxj_cache_max_size'])
+
+        # index url -> MmapCDXJIndex, least recently used first
+        self.indexes = OrderedDict()
+
+        # cache path -> AsyncResult, for downloads in progress
+        self.fetching = {}
+
+        self.loader = BlockLoader()
+
+        self.codec = CDXJCodec(self.redis)
+
+    def load_index(self, params):
+        cdxj_key = res_template(Recording.CDXJ_KEY, params)
+        info_key = res_template(Recording.INFO_KEY, params)
+
+        with redis_pipeline(self.redis) as pi:
+            pi.exists(cdxj_key)
+            pi.hget(info_key, Recording.INDEX_FILE_KEY)
+            res = pi.execute()
+
+        exists, index_url = res
+
+        if exists or not index_url:
+            return self.redis_source.load_index(params)
+
+        try:
+            index = self.get_index(index_url)
+        except IOError:
+            raise NotFoundException(index_url)
+
+        def do_load(index):
+            for line in index.iter_range(params['key'], params['end_key']):
+                yield CDXObject(line)
+
+        return do_load(index)
+
+    def iter_recs_lines(self, coll, recs, key, end_key):
+        # sorted lines for each recording, from redis if open or not yet committed,
+        # otherwise from committed index file. redis lookups pipelined for all recordings
+        with redis_pipeline(self.redis) as pi:
+            for rec in recs:
+                pi.exists(Recording.CDXJ_KEY.format(rec=rec))
+                pi.hget(Recording.INFO_KEY.format(rec=rec), Recording.INDEX_FILE_KEY)
+
+            res = pi.execute()
+
+        redis_recs = []
+        file_iters = []
+
+        for i, rec in enumerate(recs):
+            exists, index_url = res[i * 2], res[i * 2 + 1]
+
+            if exists or not index_url:
+                redis_recs.append(rec)
+                continue
+
+            try:
+                file_iters.append(self.get_index(index_url).iter_range(key, end_key))
+            except IOError:
+                continue
+
+        with redis_pipeline(self.redis) as pi:
+            for rec in redis_recs:
+                pi.zrangebylex(Recording.CDXJ_KEY.format(rec=rec),
+                               b'[' + key, b'(' + end_key)
+
+            res = pi.execute()
+
+        redis_iters = [[line.encode('utf-8') for line in self.codec.decode_lines(coll, lines)]
+                       for lines in res]
+
+        return redis_iters + file_iters
+
+    def get_index(self, index_url):
+        index = self.indexes.pop(index_url, None)
+        if not index:
+            path = self.get_local_path(index_url)
+            index = MmapCDXJIndex(path)
+            index.cache_path = path if path.startswith(self.cache_dir) else None
+
+            # evicted indexes unmapped once no longer in use
+            if len(self.indexes) >= self.MAX_OPEN:
+                self.indexes.popitem(last=False)
+
+        # mark cached file as recently used, for eviction
+        if index.cache_path:
+            try:
+                os.utime(index.cache_path)
+            except OSError:
+                pass
+
+        self.indexes[index_url] = index
+        return index
+
+    def get_local_path(self, index_url):
+        path = strip_prefix(index_url)
+        if '://' not in path:
+            return path
+
+        # committed index files are not modified, cache by url
+        cache_path = os.path.join(self.cache_dir,
+                                  hashlib.sha1(index_url.encode('utf-8')).hexdigest() + '.cdxj')
+
+        if os.path.isfile(cache_path):
+            return cache_path
+
+        # single download for concurrent lookups
+        result = self.fetching.get(cache_path)
+        if result:
+            result.get()
+            return cache_path
+
+        result = self.fetching[cache_path] = AsyncResult()
+        try:
+            self.download(index_url, cache_path)
+            result.set()
+        except Exception as e:
+            result.set_exception(e)
+            raise
+        finally:
+            self.fetching.pop(cache_path, None)
+
+        return cache_path
+
+    def download(self, index_url, cache_path):
+        temp_path = cache_path + '.{0}.tmp'.format(os.getpid())
+
+        fh = self.loader.load(index_url)
+        try:
+            with open(temp_path, 'wb') as out:
+                shutil.copyfileobj(fh, out)
+        finally:
+            fh.close()
+
+        os.rename(temp_path, cache_path)
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total_size = 0
+
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.tmp'):
+                continue
+
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+        if total_size <= self.CACHE_MAX_SIZE:
+            return
+
+        # remove least recently used, already mapped indexes remain readable
+        entries.sort()
+
+        for mtime, size, path in entries:
+            if total_size <= self.CACHE_MAX_SIZE:
+                break
+
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
+
+    def __repr__(self):
+        return '{0}({1})'.format(self.__class__.__name__, self.cache_dir)
+
+    def __str__(self):
+        return 'cdxj'
+
+
+# ============================================================================
+# Collection index source, a lazy k-way merge of the indexes of each
+# recording in the collection, so that replay does not need
+# a merged collection index to be built first.
+# If a collection index is built (only if coll_cdxj_build is set),
+# or for external collections, which have no recordings,
+# the collection index is used instead.
+class MergedCollIndexSource(BaseIndexSource):
+    def __init__(self, rec_source, coll_redis_source):
+        self.rec_source = rec_source
+        self.coll_redis_source = coll_redis_source
+        self.redis = coll_redis_source.redis
+
+    def load_index(self, params):
+        ready_key = res_template(Collection.COLL_CDXJ_READY_KEY, params)
+        recs_key = res_template(Collection.RECS_KEY, params)
+
+        with redis_pipeline(self.redis) as pi:
+            pi.exists(ready_key)
+            pi.smembers(recs_key)
+            res = pi.execute()
+
+        ready, recs = res
+
+        if ready or not recs:
+            return self.coll_redis_source.load_index(params)
+
+        iters = self.rec_source.iter_recs_lines(params['param.coll'], sorted(recs),
+                                                params['key'], params['end_key'])
+
+        def do_load(iters):
+            for line in heapq.merge(*iters):
+                yield CDXObject(line)
+
+        return do_load(iters)
+
+    def __repr__(self):
+        return '{0}()'.format(self.__class__.__name__)
+
+    def __str__(self):
+        return 'merged'
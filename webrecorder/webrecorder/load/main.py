@@ -1,6 +1,6 @@
 from gevent.monkey import patch_all; patch_all()
 
-from pywb.warcserver.index.indexsource import LiveIndexSource, RedisIndexSource
+from pywb.warcserver.index.indexsource import LiveIndexSource
 from pywb.warcserver.index.indexsource import MementoIndexSource, WBMementoIndexSource, RemoteIndexSource
 from pywb.warcserver.index.aggregator import SimpleAggregator, GeventTimeoutAggregator
 
@@ -11,16 +11,21 @@ from pywb.warcserver.handlers import DefaultResourceHandler, HandlerSeq, Resourc
 from pywb.warcserver.warcserver import BaseWarcServer, init_index_source, register_source
 
 from pywb.utils.wbexception import NotFoundException
-from pywb.utils.loaders import load_yaml_config
+from pywb.utils.loaders import load_yaml_config, BlockLoader
 
 from webrecorder.utils import load_wr_config, init_logging
 
 from webrecorder.load.wamsourceloader import WAMSourceLoader
+from webrecorder.load.warccache import CachingS3Loader
+from webrecorder.load.cdxjsource import CommittedCDXJIndexSource, MergedCollIndexSource
+from webrecorder.load.cdxcache import CachingIndexSource
+from webrecorder.models.cdxjcodec import CompactRedisIndexSource
 
 from webrecorder.models import Recording, Collection
 
 import os
 import json
+import tempfile
 
 
 # =============================================================================
@@ -52,19 +57,37 @@ class WRWarcServer(object):
         redis = redis_resolver.redis
         warc_resolvers = [redis_resolver]
 
+        # cache committed warc records loaded from s3 on local disk, if set
+        warc_cache_dir = os.environ.get('WARC_CACHE_DIR')
+        if warc_cache_dir:
+            CachingS3Loader.init_props(config, redis, warc_cache_dir)
+            BlockLoader.loaders['s3'] = CachingS3Loader
+
         cache_proxy_url = os.environ.get('CACHE_PROXY_URL', '')
         global PROXY_PREFIX
         PROXY_PREFIX = cache_proxy_url
 
         timeout = 20.0
 
-        rec_redis_source = RedisIndexSource(timeout=timeout,
-                                            redis_url=rec_url,
-                                            redis=redis)
+        rec_redis_source = CompactRedisIndexSource(timeout=timeout,
+                                                   redis_url=rec_url,
+                                                   redis=redis)
+
+        # committed recordings looked up in their cdxj files, remote files cached locally
+        cdxj_cache_dir = os.environ.get('CDXJ_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'cdxj-cache')
+
+        rec_cdxj_source = CommittedCDXJIndexSource(rec_redis_source, cdxj_cache_dir, config)
+
+        coll_redis_source = CompactRedisIndexSource(timeout=timeout,
+                                                    redis_url=coll_url,
+                                                    redis=redis)
+
+        # merged from recording indexes until collection index is built
+        coll_merged_source = MergedCollIndexSource(rec_cdxj_source, coll_redis_source)
 
-        coll_redis_source = RedisIndexSource(timeout=timeout,
-                                             redis_url=coll_url,
-                                             redis=redis)
+        # cache lookups of frequently replayed urls
+        rec_cached_source = CachingIndexSource(rec_cdxj_source, Recording.CDXJ_KEY, redis, config)
+        coll_cached_source = CachingIndexSource(coll_merged_source, Collection.COLL_CDXJ_KEY, redis, config)
 
         live_rec = DefaultResourceHandler(
                         SimpleAggregator(
@@ -111,12 +134,12 @@ class WRWarcServer(object):
                          cache_proxy_url)
 
         # Single Rec Replay
-        replay_rec = DefaultResourceHandler(SimpleAggregator({'local': rec_redis_source}),
+        replay_rec = DefaultResourceHandler(SimpleAggregator({'local': rec_cached_source}),
                                             warc_resolvers,
                                             cache_proxy_url)
 
         # Coll Replay
-        replay_coll = DefaultResourceHandler(SimpleAggregator({'local': coll_redis_source}),
+        replay_coll = DefaultResourceHandler(SimpleAggregator({'local': coll_cached_source}),
                                              warc_resolvers,
                                              cache_proxy_url)
 
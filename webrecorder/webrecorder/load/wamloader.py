@@ -15,6 +15,10 @@ class WAMLoader(object):
     def __init__(self):
         self.replay_info = {}
 
+        # combined regex of all replay prefixes, compiled on first lookup
+        self.prefix_rx = None
+        self.prefix_pks = {}
+
         webarchives_path = self.merge_webarchives()
 
         try:
@@ -22,18 +26,39 @@ class WAMLoader(object):
         except IOError:
             print('No Archives Loaded')
 
+    def compile_prefixes(self):
+        # alternation matches the first listed prefix, same as a scan in order
+        self.prefix_pks = {}
+        for pk, info in self.replay_info.items():
+            self.prefix_pks.setdefault(info['replay_prefix'], pk)
+
+        prefixes = '|'.join(re.escape(prefix) for prefix in self.prefix_pks)
+        self.prefix_rx = re.compile(prefixes)
+
     def find_archive_for_url(self, url):
+        if not self.replay_info:
+            return
+
+        if self.prefix_rx is None:
+            self.compile_prefixes()
+
         schemeless_url = self.STRIP_SCHEME.sub('', url)
-        for pk, info in self.replay_info.items():
-            if schemeless_url.startswith(info['replay_prefix']):
-                orig_url = schemeless_url[len(info['replay_prefix']):]
-                if info.get('parse_collection'):
-                    coll, orig_url = orig_url.split('/', 1)
-                    id_ = pk + ':' + coll
-                else:
-                    id_ = pk
 
-                return pk, orig_url, id_
+        m = self.prefix_rx.match(schemeless_url)
+        if not m:
+            return
+
+        pk = self.prefix_pks[m.group(0)]
+        info = self.replay_info[pk]
+
+        orig_url = schemeless_url[len(info['replay_prefix']):]
+        if info.get('parse_collection'):
+            coll, orig_url = orig_url.split('/', 1)
+            id_ = pk + ':' + coll
+        else:
+            id_ = pk
+
+        return pk, orig_url, id_
 
     def load_all(self, webarchives_path):
         wa_file = load(webarchives_path)
@@ -68,6 +93,7 @@ class WAMLoader(object):
                                 'name': archive_name,
                                 'about': archive_about}
 
+        self.prefix_rx = None
         return True
 
     @classmethod
@@ -0,0 +1,234 @@
+from pywb.utils.loaders import S3Loader
+
+from webrecorder.models.stats import Stats
+
+from gevent.event import AsyncResult
+
+import gevent
+import binascii
+import hashlib
+import shutil
+import time
+import os
+
+
+# ============================================================================
+# Read-through cache of WARC record ranges loaded from s3, stored in a local
+# directory shared by all warcserver processes.
+# Least recently used ranges are evicted when the cache exceeds max size.
+class CachingS3Loader(S3Loader):
+    CACHE_DIR = None
+    MAX_SIZE = 0
+    MAX_ITEM_SIZE = 0
+    LOCK_SECS = 30
+    STATS_SECS = 10
+
+    # check cache size after this many bytes are added by this process
+    EVICT_CHECK_SIZE = 0
+
+    stats = None
+
+    # cache path -> AsyncResult, for fetches in progress in this process
+    fetching = {}
+    added_size = 0
+
+    # hits and misses in this process, not yet added to stats
+    counts = [0, 0]
+    stats_timer = None
+
+    @classmethod
+    def init_props(cls, config, redis, cache_dir):
+        cls.CACHE_DIR = cache_dir
+        cls.MAX_SIZE = int(config['warc_cache_max_size'])
+        cls.MAX_ITEM_SIZE = int(config['warc_cache_max_item_size'])
+        cls.LOCK_SECS = int(config['warc_cache_lock_secs'])
+        cls.STATS_SECS = float(config['warc_cache_stats_secs'])
+        cls.EVICT_CHECK_SIZE = cls.MAX_SIZE // 10
+
+        cls.stats = Stats(redis)
+
+        os.makedirs(cls.CACHE_DIR, exist_ok=True)
+
+    def load(self, url, offset, length):
+        # only cache ranges of known size
+        if length <= 0 or length > self.MAX_ITEM_SIZE:
+            return self.fetch(url, offset, length)
+
+        key = '{0} {1} {2}'.format(url, offset, length).encode('utf-8')
+        path = os.path.join(self.CACHE_DIR, hashlib.sha1(key).hexdigest())
+
+        fh = self.open_cached(path)
+        if fh:
+            self.incr_stats(hit=True)
+            return fh
+
+        self.incr_stats(hit=False)
+
+        # single fetch for concurrent misses in this process
+        result = self.fetching.get(path)
+        if result:
+            result.get()
+        else:
+            result = self.fetching[path] = AsyncResult()
+            try:
+                self.fetch_to_cache(path, url, offset, length)
+                result.set()
+            except Exception as e:
+                result.set_exception(e)
+                raise
+            finally:
+                self.fetching.pop(path, None)
+
+        fh = self.open_cached(path)
+        if not fh:
+            # evicted already, load directly
+            return self.fetch(url, offset, length)
+
+        return fh
+
+    def incr_stats(self, hit):
+        CachingS3Loader.counts[0 if hit else 1] += 1
+
+        if not CachingS3Loader.stats_timer:
+            CachingS3Loader.stats_timer = gevent.spawn_later(self.STATS_SECS, self.flush_stats)
+
+    @classmethod
+    def flush_stats(cls):
+        hits, misses = CachingS3Loader.counts
+
+        CachingS3Loader.counts = [0, 0]
+        CachingS3Loader.stats_timer = None
+
+        if hits or misses:
+            cls.stats.incr_warc_cache(hits, misses)
+
+    def fetch(self, url, offset, length):
+        return super(CachingS3Loader, self).load(url, offset, length)
+
+    def open_cached(self, path):
+        try:
+            fh = open(path, 'rb')
+        except IOError:
+            return None
+
+        # mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return fh
+
+    def fetch_to_cache(self, path, url, offset, length):
+        lock_path = path + '.lock'
+
+        # single fetch across processes, none if fetched by another process
+        token = self.acquire_lock(path, lock_path)
+        if not token:
+            return
+
+        try:
+            temp_path = path + '.{0}.tmp'.format(os.getpid())
+            body = self.fetch(url, offset, length)
+
+            with open(temp_path, 'wb') as out:
+                shutil.copyfileobj(body, out)
+
+            os.rename(temp_path, path)
+
+        finally:
+            self.release_lock(lock_path, token)
+
+        CachingS3Loader.added_size += length
+        if CachingS3Loader.added_size >= self.EVICT_CHECK_SIZE:
+            CachingS3Loader.added_size = 0
+            self.evict()
+
+    def acquire_lock(self, path, lock_path):
+        token = '{0}-{1}'.format(os.getpid(), binascii.hexlify(os.urandom(8)).decode('utf-8'))
+
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError:
+                if self.wait_for_fetch(path, lock_path):
+                    return None
+
+                # other fetch presumed failed, remove its lock if still stale
+                self.remove_stale_lock(lock_path)
+                continue
+
+            try:
+                os.write(fd, token.encode('utf-8'))
+            finally:
+                os.close(fd)
+
+            return token
+
+    def release_lock(self, lock_path, token):
+        # only remove own lock, may have been taken over if fetch was too slow
+        try:
+            with open(lock_path, 'rb') as fh:
+                if fh.read().decode('utf-8') != token:
+                    return
+
+            os.remove(lock_path)
+        except (IOError, OSError):
+            pass
+
+    def remove_stale_lock(self, lock_path):
+        try:
+            if time.time() - os.path.getmtime(lock_path) > self.LOCK_SECS:
+                os.remove(lock_path)
+        except OSError:
+            pass
+
+    def wait_for_fetch(self, path, lock_path):
+        while True:
+            if os.path.isfile(path):
+                return True
+
+            try:
+                locked_at = os.path.getmtime(lock_path)
+            except OSError:
+                # lock released, fetched or failed
+                return os.path.isfile(path)
+
+            # other fetch presumed failed
+            if time.time() - locked_at > self.LOCK_SECS:
+                return False
+
+            gevent.sleep(0.05)
+
+    def evict(self):
+        entries = []
+        total_size = 0
+
+        for entry in os.scandir(self.CACHE_DIR):
+            if entry.name.endswith(('.lock', '.tmp')):
+                continue
+
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+        if total_size <= self.MAX_SIZE:
+            return
+
+        # remove least recently used, down to 90% of max size
+        entries.sort()
+        target_size = self.MAX_SIZE * 0.9
+
+        for mtime, size, path in entries:
+            if total_size <= target_size:
+                break
+
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
@@ -1,7 +1,7 @@
 from bottle import template, request, HTTPError
 
 from webrecorder.models.user import SessionUser
-from webrecorder.models.base import BaseAccess
+from webrecorder.models.base import BaseAccess, IdentityMap
 
 
 # ============================================================================
@@ -13,6 +13,8 @@ class SessionAccessCache(BaseAccess):
         self.sesh = session
         self.redis = redis
 
+        self.identity_map = IdentityMap(redis)
+
         self._session_user = None
 
     @property
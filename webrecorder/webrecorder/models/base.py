@@ -26,8 +26,15 @@ class RedisUniqueComponent(object):
         self.access = kwargs['access']
         self.owner = None
 
+        # info hash, if fetched along with other objects in the request
+        self.prefetched = None
+
         if self.my_id:
             self.info_key = self.INFO_KEY.format_map({self.MY_TYPE: self.my_id})
+
+            identity_map = self._get_identity_map()
+            if identity_map:
+                identity_map.add(self)
         else:
             self.info_key = None
 
@@ -37,6 +44,23 @@ class RedisUniqueComponent(object):
             self.data = {}
             self.loaded = False
 
+    # the object already created for this id in the current request, if any
+    @classmethod
+    def get_instance(cls, **kwargs):
+        identity_map = getattr(kwargs['access'], 'identity_map', None)
+        obj = identity_map.get(cls, kwargs.get('my_id')) if identity_map else None
+
+        if not obj:
+            return cls(**kwargs)
+
+        if kwargs.get('load'):
+            obj.load()
+
+        return obj
+
+    def _get_identity_map(self):
+        return getattr(self.access, 'identity_map', None)
+
     @property
     def size(self):
         return self.get_prop('size', force_type=int, default_val=0, force_update=True)
@@ -84,6 +108,29 @@ class RedisUniqueComponent(object):
         self._format_keys()
         self.loaded = True
 
+    # load info hashes of all objects in one pipeline, only the given fields if set
+    @classmethod
+    def load_objects(cls, redis, objs, fields=None):
+        if not objs:
+            return
+
+        pi = redis.pipeline(transaction=False)
+        for obj in objs:
+            if fields:
+                pi.hmget(obj.info_key, fields)
+            else:
+                pi.hgetall(obj.info_key)
+
+        for obj, res in zip(objs, pi.execute()):
+            if fields:
+                obj.data.update((field, value) for field, value in zip(fields, res)
+                                if value is not None)
+            else:
+                obj.data = res
+                obj.loaded = True
+
+            obj._format_keys()
+
     def _format_keys(self):
         for key in self.INT_KEYS:
             if key in self.data:
@@ -145,12 +192,27 @@ class RedisUniqueComponent(object):
     def get_prop(self, attr, default_val=None, force_type=None, force_update=False):
         if not self.loaded:
             if force_update or attr not in self.data:
-                self.data[attr] = self.redis.hget(self.info_key, attr) or default_val
+                if not force_update and self._prefetch():
+                    value = self.prefetched.get(attr)
+                else:
+                    value = self.redis.hget(self.info_key, attr)
+
+                self.data[attr] = value or default_val
                 if force_type:
                     self.data[attr] = force_type(self.data[attr])
 
         return self.data.get(attr, default_val)
 
+    def _prefetch(self):
+        if self.prefetched is None:
+            identity_map = self._get_identity_map()
+            if not identity_map:
+                return False
+
+            identity_map.prefetch(self)
+
+        return self.prefetched is not None
+
     def set_prop(self, attr, value, update_ts=True):
         self.data[attr] = value
         self.redis.hset(self.info_key, attr, value)
@@ -190,9 +252,9 @@ class RedisUniqueComponent(object):
         if not owner_id:
             return None
 
-        self.owner = self.OWNER_CLS(my_id=owner_id,
-                                    redis=self.redis,
-                                    access=self.access)
+        self.owner = self.OWNER_CLS.get_instance(my_id=owner_id,
+                                                 redis=self.redis,
+                                                 access=self.access)
 
         return self.owner
 
@@ -331,10 +393,10 @@ class RedisNamedMap(object):
 
     def get_objects(self, cls):
         all_objs = self.redis.hgetall(self.get_comp_map())
-        obj_list = [cls(my_id=val,
-                        name=name,
-                        redis=self.redis,
-                        access=self.comp.access) for name, val in all_objs.items()]
+        obj_list = [cls.get_instance(my_id=val,
+                                     name=name,
+                                     redis=self.redis,
+                                     access=self.comp.access) for name, val in all_objs.items()]
 
         return obj_list
 
@@ -352,21 +414,21 @@ class RedisOrderedList(object):
     def _ordered_list_key(self):
         return self.ordered_list_key_templ.format_map({self.comp.MY_TYPE: self.comp.my_id})
 
-    def get_ordered_objects(self, cls, load=True, start=0, end=-1):
+    def get_ordered_objects(self, cls, load=True, start=0, end=-1, fields=None):
         all_objs = self.get_ordered_keys(start, end)
 
         obj_list = []
         for val in all_objs:
-            obj = cls(my_id=val,
-                      redis=self.redis,
-                      access=self.comp.access)
+            obj = cls.get_instance(my_id=val,
+                                   redis=self.redis,
+                                   access=self.comp.access)
 
             obj.owner = self.comp
-            if load:
-                obj.load()
-
             obj_list.append(obj)
 
+        if load:
+            cls.load_objects(self.redis, obj_list, fields)
+
         return obj_list
 
     def insert_ordered_object(self, obj, before_obj, owner=True):
@@ -458,22 +520,22 @@ class RedisUnorderedList(object):
     def _list_key(self):
         return self.list_key_templ.format_map({self.comp.MY_TYPE: self.comp.my_id})
 
-    def get_objects(self, cls, load=True):
+    def get_objects(self, cls, load=True, fields=None):
         all_objs = self.get_keys()
 
         obj_list = []
 
         for val in all_objs:
-            obj = cls(my_id=val,
-                      redis=self.redis,
-                      access=self.comp.access)
+            obj = cls.get_instance(my_id=val,
+                                   redis=self.redis,
+                                   access=self.comp.access)
 
             obj.owner = self.comp
-            if load:
-                obj.load()
-
             obj_list.append(obj)
 
+        if load:
+            cls.load_objects(self.redis, obj_list, fields)
+
         return obj_list
 
     def add_object(self, obj, owner=True):
@@ -499,8 +561,56 @@ class RedisUnorderedList(object):
         return self.redis.smembers(self._list_key)
 
 
+# ============================================================================
+# Request-scoped map of model objects by type and id, so that the same object
+# is returned for the same id within a request. The info hashes of all objects
+# not yet loaded are fetched in one pipeline when a property of any of them
+# is first read
+class IdentityMap(object):
+    def __init__(self, redis):
+        self.redis = redis
+        self.objects = {}
+        self.pending = []
+
+    def add(self, obj):
+        if self.objects.setdefault((obj.MY_TYPE, obj.my_id), obj) is obj:
+            self.pending.append(obj)
+
+    def get(self, cls, my_id):
+        obj = self.objects.get((cls.MY_TYPE, my_id))
+        return obj if isinstance(obj, cls) else None
+
+    def prefetch(self, obj=None):
+        objs = [pending for pending in self.pending
+                if not pending.loaded and pending.prefetched is None]
+
+        self.pending = []
+
+        # not added to this map, fetched with the pending objects
+        if obj and not any(pending is obj for pending in objs):
+            objs.append(obj)
+
+        if not objs:
+            return
+
+        pi = self.redis.pipeline(transaction=False)
+        for pending in objs:
+            pi.hgetall(pending.info_key)
+
+        results = pi.execute()
+
+        for pending, data in zip(objs, results):
+            pending.prefetched = data
+
+    def clear(self):
+        self.objects = {}
+        self.pending = []
+
+
 # ============================================================================
 class BaseAccess(object):
+    identity_map = None
+
     def can_read_coll(self, collection, allow_superuser=True):
         return True
 
@@ -0,0 +1,325 @@
+from pywb.warcserver.index.indexsource import RedisIndexSource
+from pywb.warcserver.index.cdxobject import CDXObject
+from pywb.utils.format import res_template
+
+from webrecorder.utils import get_bool
+
+from collections import OrderedDict
+
+import base64
+import json
+import logging
+
+
+# ============================================================================
+# Optional compact encoding of cdxj lines stored in redis indexes.
+#
+# A compact member keeps the 'urlkey timestamp ' prefix, so members sort
+# and are looked up with zrangebylex as before, followed by a marker,
+# the packed fields, and the mime (if any) and url as text:
+#
+#   urlkey timestamp ~<packed> [mime] url
+#
+# packed: field bitmask, filename id, status, length and offset as varints,
+# and the sha1 digest as 20 bytes, base85 encoded as members are read
+# as utf-8 strings. WARC filenames are dictionary encoded per collection,
+# so recording and collection indexes of a collection share the same ids.
+#
+# Lines with other fields, or which would not decode to the exact same
+# line, are stored as is. Both forms are decoded, so the encoding
+# can be turned on or off at any time.
+class CDXJCodec(object):
+    FILES_KEY = 'c:{coll}:cdxj:files'
+    FILE_IDS_KEY = 'c:{coll}:cdxj:file_ids'
+    NEXT_ID = 'next'
+
+    # assign next id to filename, unless already assigned by another writer
+    # KEYS: files key (id -> filename), file ids key (filename -> id)
+    # ARGV: filename
+    ADD_FILE_SCRIPT = """
+local file_id = redis.call('hget', KEYS[2], ARGV[1])
+if file_id then
+    return tonumber(file_id)
+end
+
+file_id = redis.call('hincrby', KEYS[1], 'next', 1)
+redis.call('hset', KEYS[1], file_id, ARGV[1])
+redis.call('hset', KEYS[2], ARGV[1], file_id)
+return file_id
+"""
+
+    MARKER = '~'
+
+    FIELDS = ('url', 'mime', 'status', 'digest', 'length', 'offset', 'filename')
+
+    HAS_MIME = 1
+    HAS_STATUS = 2
+    HAS_DIGEST = 4
+    HAS_LENGTH = 8
+    HAS_OFFSET = 16
+    HAS_FILENAME = 32
+
+    INT_FIELDS = (('status', HAS_STATUS), ('length', HAS_LENGTH), ('offset', HAS_OFFSET))
+
+    ENABLED = False
+
+    # coll id -> {filename id -> filename} and {filename -> filename id}, in this process
+    file_names = {}
+    file_ids = {}
+    FILES_CACHE_MAX = 10000
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    @classmethod
+    def init_props(cls, config):
+        cls.ENABLED = get_bool(config['cdxj_compact'])
+
+    @classmethod
+    def is_compact(cls, line):
+        parts = line.split(' ', 3)
+        return len(parts) > 2 and parts[2].startswith(cls.MARKER)
+
+    def encode_lines(self, coll, lines, force=False):
+        # bytes or str lines -> members, as is if not enabled or no collection
+        if not coll or (not self.ENABLED and not force):
+            return lines
+
+        return [self.encode(coll, line) for line in lines]
+
+    def encode(self, coll, line):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+
+        parts = line.split(' ', 2)
+        if len(parts) < 3 or not parts[2].startswith('{'):
+            return line
+
+        try:
+            fields = json.loads(parts[2], object_pairs_hook=OrderedDict)
+        except ValueError:
+            return line
+
+        packed = self._pack(coll, fields)
+
+        # only encode lines decoded exactly as written
+        if not packed or json.dumps(fields) != parts[2]:
+            return line
+
+        return parts[0] + ' ' + parts[1] + ' ' + self.MARKER + packed
+
+    def _pack(self, coll, fields):
+        if list(fields.keys()) != [name for name in self.FIELDS if name in fields]:
+            return None
+
+        if not isinstance(fields.get('url'), str) or not all(isinstance(value, str) for value in fields.values()):
+            return None
+
+        flags = 0
+        buff = bytearray()
+
+        mime = fields.get('mime')
+        if mime is not None:
+            if not mime or ' ' in mime:
+                return None
+
+            flags |= self.HAS_MIME
+
+        filename = fields.get('filename')
+        if filename is not None:
+            flags |= self.HAS_FILENAME
+            self._add_varint(buff, self.get_file_id(coll, filename))
+
+        for name, flag in self.INT_FIELDS:
+            value = fields.get(name)
+            if value is None:
+                continue
+
+            if not value.isdigit() or str(int(value)) != value:
+                return None
+
+            flags |= flag
+            self._add_varint(buff, int(value))
+
+        digest = fields.get('digest')
+        if digest is not None:
+            try:
+                digest_bytes = base64.b32decode(digest)
+            except Exception:
+                return None
+
+            if len(digest_bytes) != 20 or base64.b32encode(digest_bytes).decode('ascii') != digest:
+                return None
+
+            flags |= self.HAS_DIGEST
+            buff.extend(digest_bytes)
+
+        packed = base64.b85encode(bytes([flags]) + bytes(buff)).decode('ascii')
+
+        if mime is not None:
+            packed += ' ' + mime
+
+        return packed + ' ' + fields['url']
+
+    def decode_lines(self, coll, members):
+        for member in members:
+            yield self.decode(coll, member)
+
+    def decode(self, coll, member):
+        # member -> cdxj line, as str
+        if isinstance(member, bytes):
+            member = member.decode('utf-8')
+
+        parts = member.split(' ', 3)
+        if len(parts) < 4 or not parts[2].startswith(self.MARKER):
+            return member
+
+        data = base64.b85decode(parts[2][1:])
+        flags = data[0]
+        pos = 1
+
+        fields = OrderedDict()
+
+        if flags & self.HAS_MIME:
+            mime, url = parts[3].split(' ', 1)
+        else:
+            mime, url = None, parts[3]
+
+        fields['url'] = url
+
+        if mime is not None:
+            fields['mime'] = mime
+
+        filename = None
+        if flags & self.HAS_FILENAME:
+            file_id, pos = self._read_varint(data, pos)
+            filename = self.get_filename(coll, file_id)
+
+        int_values = {}
+        for name, flag in self.INT_FIELDS:
+            if flags & flag:
+                int_values[name], pos = self._read_varint(data, pos)
+
+        if 'status' in int_values:
+            fields['status'] = str(int_values['status'])
+
+        if flags & self.HAS_DIGEST:
+            fields['digest'] = base64.b32encode(data[pos:pos + 20]).decode('ascii')
+
+        for name in ('length', 'offset'):
+            if name in int_values:
+                fields[name] = str(int_values[name])
+
+        if filename is not None:
+            fields['filename'] = filename
+
+        return parts[0] + ' ' + parts[1] + ' ' + json.dumps(fields)
+
+    def get_file_id(self, coll, filename):
+        file_id = self._get_cached(self.file_ids, coll).get(filename)
+        if file_id is not None:
+            return file_id
+
+        self.load_files(coll)
+
+        file_id = self.file_ids[coll].get(filename)
+        if file_id is not None:
+            return file_id
+
+        # recorder and warcserver processes may add the same filename concurrently,
+        # assigned atomically so that each filename has one id
+        file_id = self.redis.eval(self.ADD_FILE_SCRIPT, 2,
+                                  self.FILES_KEY.format(coll=coll),
+                                  self.FILE_IDS_KEY.format(coll=coll),
+                                  filename)
+
+        self.file_ids[coll][filename] = file_id
+        self.file_names[coll][file_id] = filename
+        return file_id
+
+    def get_filename(self, coll, file_id):
+        filename = self._get_cached(self.file_names, coll).get(file_id)
+        if filename is None:
+            self.load_files(coll)
+            filename = self.file_names[coll].get(file_id)
+
+        if filename is None:
+            logging.error('Unknown filename id {0} in collection {1}'.format(file_id, coll))
+            return '-'
+
+        return filename
+
+    def load_files(self, coll):
+        file_names = {}
+        file_ids = {}
+
+        for file_id, filename in self.redis.hgetall(self.FILES_KEY.format(coll=coll)).items():
+            if isinstance(file_id, bytes):
+                file_id = file_id.decode('utf-8')
+                filename = filename.decode('utf-8')
+
+            if file_id == self.NEXT_ID:
+                continue
+
+            file_id = int(file_id)
+            file_names[file_id] = filename
+
+            # lowest id, if added before ids were assigned atomically
+            if filename not in file_ids or file_id < file_ids[filename]:
+                file_ids[filename] = file_id
+
+        self._get_cached(self.file_names, coll).update(file_names)
+        self._get_cached(self.file_ids, coll).update(file_ids)
+
+    def _get_cached(self, cache, coll):
+        files = cache.get(coll)
+        if files is None:
+            if len(cache) >= self.FILES_CACHE_MAX:
+                cache.clear()
+
+            files = cache[coll] = {}
+
+        return files
+
+    @staticmethod
+    def _add_varint(buff, value):
+        while value > 0x7f:
+            buff.append((value & 0x7f) | 0x80)
+            value >>= 7
+
+        buff.append(value)
+
+    @staticmethod
+    def _read_varint(data, pos):
+        value = 0
+        shift = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            value |= (b & 0x7f) << shift
+            if not b & 0x80:
+                return value, pos
+
+            shift += 7
+
+
+# ============================================================================
+# Redis index source decoding compact members, for collection {coll}
+class CompactRedisIndexSource(RedisIndexSource):
+    def __init__(self, *args, **kwargs):
+        super(CompactRedisIndexSource, self).__init__(*args, **kwargs)
+        self.codec = CDXJCodec(self.redis)
+
+    def load_key_index(self, key_template, params):
+        z_key = res_template(key_template, params)
+        index_list = self.redis.zrangebylex(z_key,
+                                            b'[' + params['key'],
+                                            b'(' + params['end_key'])
+
+        coll = res_template('{coll}', params)
+
+        def do_load(index_list):
+            for line in self.codec.decode_lines(coll, index_list):
+                yield CDXObject(line.encode('utf-8'))
+
+        return do_load(index_list)
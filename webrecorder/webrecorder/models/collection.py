@@ -3,17 +3,20 @@ import logging
 import json
 import hashlib
 import os
+import time
 
 from datetime import date
+from gevent.pool import Pool
 
 from pywb.utils.loaders import load
 from warcio.timeutils import timestamp20_now, timestamp_now
 
 from pywb.warcserver.index.cdxobject import CDXObject
 
-from webrecorder.utils import sanitize_title, get_new_id
+from webrecorder.utils import sanitize_title, get_new_id, get_bool, redis_pipeline, iter_lines, zadd_lines
 from webrecorder.models.base import RedisUnorderedList, RedisOrderedList, RedisUniqueComponent, RedisNamedMap
 from webrecorder.models.recording import Recording
+from webrecorder.models.cdxjcodec import CDXJCodec
 from webrecorder.models.pages import PagesMixin
 from webrecorder.models.datshare import DatShare
 from webrecorder.models.list_bookmarks import BookmarkList
@@ -35,6 +38,9 @@ class Collection(PagesMixin, RedisUniqueComponent):
     LIST_REDIR_KEY = 'c:{coll}:lr'
 
     COLL_CDXJ_KEY = 'c:{coll}:cdxj'
+    COLL_CDXJ_READY_KEY = 'c:{coll}:cdxj:ready'
+    COLL_CDXJ_LOCK_KEY = 'c:{coll}:cdxj:_'
+    COLL_CDXJ_GEN_KEY = 'c:{coll}:cdxj:gen'
 
     CLOSE_WAIT_KEY = 'c:{coll}:wait:{id}'
 
@@ -50,6 +56,32 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
     COLL_CDXJ_TTL = 1800
 
+    COLL_CDXJ_BUILD = False
+
+    # lines added only while the collection index is built, or being built
+    # KEYS: coll cdxj key, ready key, lock key
+    # ARGV: cdxj lines
+    ADD_LINES_SCRIPT = """
+if redis.call('exists', KEYS[2]) == 0 and redis.call('exists', KEYS[3]) == 0 then
+    return 0
+end
+
+for i = 1, #ARGV do
+    redis.call('zadd', KEYS[1], 0, ARGV[i])
+end
+return #ARGV
+"""
+
+    COLL_CDXJ_CHECK_SECS = 60
+    COLL_CDXJ_LOCK_SECS = 300
+    COLL_CDXJ_LOAD_GREENLETS = 4
+
+    INDEX_CHUNK_SIZE = 1000
+
+    # coll id -> time collection index last seen ready, in this process
+    coll_index_ready = {}
+    COLL_INDEX_READY_MAX = 10000
+
     def __init__(self, **kwargs):
         super(Collection, self).__init__(**kwargs)
         self.recs = RedisUnorderedList(self.RECS_KEY, self)
@@ -59,7 +91,8 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
     @classmethod
     def init_props(cls, config):
-        cls.COLL_CDXJ_TTL = config['coll_cdxj_ttl']
+        cls.COLL_CDXJ_TTL = int(config['coll_cdxj_ttl'])
+        cls.COLL_CDXJ_BUILD = get_bool(config['coll_cdxj_build'])
 
         cls.DEFAULT_STORE_TYPE = os.environ.get('DEFAULT_STORAGE', 'local')
 
@@ -67,6 +100,12 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
         cls.COMMIT_WAIT_SECS = int(config['commit_wait_secs'])
 
+        cls.COLL_CDXJ_CHECK_SECS = int(config['coll_cdxj_check_secs'])
+        cls.COLL_CDXJ_LOCK_SECS = int(config['coll_cdxj_lock_secs'])
+        cls.COLL_CDXJ_LOAD_GREENLETS = int(config['coll_cdxj_load_greenlets'])
+
+        cls.INDEX_CHUNK_SIZE = int(config['index_chunk_size'])
+
     def create_recording(self, **kwargs):
         self.access.assert_can_admin_coll(self)
 
@@ -105,10 +144,10 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
         return bookmark_list
 
-    def get_lists(self, load=True, public_only=False):
+    def get_lists(self, load=True, public_only=False, fields=None):
         self.access.assert_can_read_coll(self)
 
-        lists = self.lists.get_ordered_objects(BookmarkList, load=load)
+        lists = self.lists.get_ordered_objects(BookmarkList, load=load, fields=fields)
 
         if public_only or not self.access.can_write_coll(self):
             lists = [blist for blist in lists if blist.is_public()]
@@ -138,9 +177,9 @@ class Collection(PagesMixin, RedisUniqueComponent):
         if not self.lists.contains_id(blist_id):
             return None
 
-        bookmark_list = BookmarkList(my_id=blist_id,
-                                     redis=self.redis,
-                                     access=self.access)
+        bookmark_list = BookmarkList.get_instance(my_id=blist_id,
+                                                  redis=self.redis,
+                                                  access=self.access)
 
         bookmark_list.owner = self
 
@@ -198,10 +237,10 @@ class Collection(PagesMixin, RedisUniqueComponent):
         if not self.recs.contains_id(rec):
             return None
 
-        recording = Recording(my_id=rec,
-                              name=rec,
-                              redis=self.redis,
-                              access=self.access)
+        recording = Recording.get_instance(my_id=rec,
+                                           name=rec,
+                                           redis=self.redis,
+                                           access=self.access)
 
         recording.owner = self
         return recording
@@ -209,8 +248,8 @@ class Collection(PagesMixin, RedisUniqueComponent):
     def num_recordings(self):
         return self.recs.num_objects()
 
-    def get_recordings(self, load=True):
-        return self.recs.get_objects(Recording, load=load)
+    def get_recordings(self, load=True, fields=None):
+        return self.recs.get_objects(Recording, load=load, fields=fields)
 
     def _get_rec_keys(self, key_templ):
         self.access.assert_can_read_coll(self)
@@ -350,8 +389,17 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
         is_owner = self.access.is_coll_owner(self)
 
+        all_pages = None
+
         if include_recordings:
             recordings = self.get_recordings(load=True)
+            Recording.load_ra_sources(self.redis, recordings)
+
+            # load all pages once for all recordings
+            if include_rec_pages:
+                all_pages = self.list_pages()
+                self.cache_rec_pages(all_pages)
+
             rec_serialized = []
 
             duration = 0
@@ -361,6 +409,8 @@ class Collection(PagesMixin, RedisUniqueComponent):
                 rec_serialized.append(rec_data)
                 duration += rec_data.get('duration', 0)
 
+            self._pages_cache = None
+
             if is_owner:
                 data['recordings'] = rec_serialized
 
@@ -385,7 +435,7 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
         if include_pages:
             if is_owner or data['public_index']:
-                data['pages'] = self.list_pages()
+                data['pages'] = all_pages if all_pages is not None else self.list_pages()
 
         data.pop('num_downloads', '')
 
@@ -407,11 +457,14 @@ class Collection(PagesMixin, RedisUniqueComponent):
         if user:
             user.incr_size(-recording.size)
 
+        self.remove_rec_index(recording)
+
+        self.incr_cdxj_gen()
+
         if delete:
             storage = self.get_storage()
             return recording.delete_me(storage)
 
-        self.sync_coll_index(exists=True, do_async=True)
         return {}
 
     def delete_me(self):
@@ -421,8 +474,16 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
         errs = {}
 
+        # delete files for all recordings in batches
+        all_files = []
+
         for recording in self.get_recordings(load=False):
-            errs.update(recording.delete_me(storage, pages=False))
+            errs.update(recording.delete_me(storage, pages=False, all_files=all_files))
+
+        if all_files:
+            failed = Recording.delete_file_list(self.redis, storage, all_files)
+            if failed:
+                errs['error_delete_files'] = failed
 
         for blist in self.get_lists(load=False):
             blist.delete_me()
@@ -463,21 +524,30 @@ class Collection(PagesMixin, RedisUniqueComponent):
             return 0
 
         coll_cdxj_key = self.COLL_CDXJ_KEY.format(coll=self.my_id)
-        count = 0
 
-        for line in cdxj_text.split(b'\n'):
+        count = self._zadd_lines(coll_cdxj_key, self._iter_cdx_lines(cdxj_text.split(b'\n')))
+
+        self.incr_cdxj_gen()
+        return count
+
+    def _iter_cdx_lines(self, lines):
+        for line in lines:
+            line = line.rstrip(b'\r')
             if not line:
                 continue
 
             try:
-                cdx = CDXObject(line)
-                self.redis.zadd(coll_cdxj_key, 0, str(cdx))
-                count += 1
+                yield str(CDXObject(line))
             except:
                 pass
 
-        #self.redis.expire(coll_cdxj_key, self.COLL_CDXJ_TTL)
-        return count
+    def _zadd_lines(self, key, lines):
+        if CDXJCodec.ENABLED:
+            codec = CDXJCodec(self.redis)
+            lines = (codec.encode(self.my_id, line) for line in lines)
+
+        with redis_pipeline(self.redis) as pi:
+            return zadd_lines(pi, [key], lines, self.INDEX_CHUNK_SIZE)
 
     def add_warcs(self, warc_map):
         if not self.is_external():
@@ -497,7 +567,8 @@ class Collection(PagesMixin, RedisUniqueComponent):
         self.set_bool_prop('external', external)
 
     def commit_file(self, filename, full_filename, obj_type,
-                    update_key=None, update_prop=None, direct_delete=False):
+                    update_key=None, update_prop=None, direct_delete=False,
+                    streamed_url=None):
 
         user = self.get_owner()
         storage = self.get_storage()
@@ -519,7 +590,8 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
         if self.redis.set(commit_wait, '1', ex=self.COMMIT_WAIT_SECS, nx=True):
             if not storage.upload_file(user, self, None,
-                                       filename, full_filename, obj_type):
+                                       filename, full_filename, obj_type,
+                                       streamed_url=streamed_url):
 
                 self.redis.delete(commit_wait)
                 return False
@@ -555,28 +627,172 @@ class Collection(PagesMixin, RedisUniqueComponent):
 
         return True
 
-    def sync_coll_index(self, exists=False, do_async=False):
-        coll_cdxj_key = self.COLL_CDXJ_KEY.format(coll=self.my_id)
-        if exists != self.redis.exists(coll_cdxj_key):
-            self.redis.expire(coll_cdxj_key, self.COLL_CDXJ_TTL)
+    def is_coll_index_ready(self, extend=False):
+        now = time.time()
+
+        checked = self.coll_index_ready.get(self.my_id)
+        if checked and now - checked < self.COLL_CDXJ_CHECK_SECS:
+            return True
+
+        ready_key = self.COLL_CDXJ_READY_KEY.format(coll=self.my_id)
+
+        if extend:
+            # index expires after ready key, so a ready index is never missing
+            with redis_pipeline(self.redis) as pi:
+                pi.expire(ready_key, self.COLL_CDXJ_TTL)
+                pi.expire(self.COLL_CDXJ_KEY.format(coll=self.my_id), self.get_coll_index_ttl())
+                ready = pi.execute()[0]
+        else:
+            ready = self.redis.exists(ready_key)
+
+        if not ready:
+            self.coll_index_ready.pop(self.my_id, None)
+            return False
+
+        if len(self.coll_index_ready) >= self.COLL_INDEX_READY_MAX:
+            self.coll_index_ready.clear()
+
+        self.coll_index_ready[self.my_id] = now
+        return True
+
+    def get_coll_index_ttl(self):
+        return self.COLL_CDXJ_TTL + self.COLL_CDXJ_CHECK_SECS
+
+    def sync_coll_index(self, do_async=False):
+        # only built if enabled, otherwise replayed from the recording indexes.
+        # once built, the collection index is kept up to date as recordings
+        # are added and removed, and expires unless replayed
+        if not self.COLL_CDXJ_BUILD:
             return
 
-        cdxj_keys = self._get_rec_keys(Recording.CDXJ_KEY)
-        if not cdxj_keys:
+        if self.is_coll_index_ready(extend=True):
             return
 
-        self.redis.zunionstore(coll_cdxj_key, cdxj_keys)
-        self.redis.expire(coll_cdxj_key, self.COLL_CDXJ_TTL)
+        lock_key = self.COLL_CDXJ_LOCK_KEY.format(coll=self.my_id)
+        if not self.redis.set(lock_key, 1, ex=self.COLL_CDXJ_LOCK_SECS, nx=True):
+            logging.debug('Already building collection index')
+            if not do_async:
+                self._wait_coll_index_ready(lock_key)
 
-        ges = []
-        for cdxj_key in cdxj_keys:
-            if self.redis.exists(cdxj_key):
-                continue
+            return
 
-            ges.append(gevent.spawn(self._do_download_cdxj, cdxj_key, coll_cdxj_key))
+        cdxj_keys = self._get_rec_keys(Recording.CDXJ_KEY)
 
+        ge = gevent.spawn(self._build_coll_index, cdxj_keys, lock_key)
         if not do_async:
-            res = gevent.joinall(ges)
+            ge.join()
+
+    def _build_coll_index(self, cdxj_keys, lock_key):
+        coll_cdxj_key = self.COLL_CDXJ_KEY.format(coll=self.my_id)
+
+        try:
+            # include lines already added while building
+            if cdxj_keys:
+                self.redis.zunionstore(coll_cdxj_key, [coll_cdxj_key] + cdxj_keys)
+
+            # load committed indexes, up to COLL_CDXJ_LOAD_GREENLETS at a time
+            pool = Pool(self.COLL_CDXJ_LOAD_GREENLETS)
+
+            ges = []
+            for cdxj_key in cdxj_keys:
+                if self.redis.exists(cdxj_key):
+                    continue
+
+                ges.append(pool.spawn(self._do_download_cdxj, cdxj_key, coll_cdxj_key))
+
+            gevent.joinall(ges)
+
+            # if any index could not be loaded, rebuilt on next sync
+            if any(ge.value is False for ge in ges):
+                return
+
+            self.redis.set(self.COLL_CDXJ_READY_KEY.format(coll=self.my_id), 1,
+                           ex=self.COLL_CDXJ_TTL)
+
+            self.incr_cdxj_gen()
+
+        finally:
+            # no longer added to unless ready
+            self.redis.expire(coll_cdxj_key, self.get_coll_index_ttl())
+            self.redis.delete(lock_key)
+
+    def _wait_coll_index_ready(self, lock_key):
+        end_time = time.time() + self.COLL_CDXJ_LOCK_SECS
+
+        while time.time() < end_time:
+            if self.is_coll_index_ready() or not self.redis.exists(lock_key):
+                return
+
+            gevent.sleep(0.1)
+
+    def add_rec_index(self, recording):
+        if self.is_coll_index_ready():
+            coll_cdxj_key = self.COLL_CDXJ_KEY.format(coll=self.my_id)
+            cdxj_key = Recording.CDXJ_KEY.format(rec=recording.my_id)
+
+            if self.redis.exists(cdxj_key):
+                self.redis.zunionstore(coll_cdxj_key, [coll_cdxj_key, cdxj_key])
+            else:
+                self._do_download_cdxj(cdxj_key, coll_cdxj_key)
+
+            # zunionstore resets ttl
+            self.redis.expire(coll_cdxj_key, self.get_coll_index_ttl())
+
+        self.incr_cdxj_gen()
+
+    @classmethod
+    def add_coll_index_lines(cls, pi, coll, lines, chunk_size):
+        # add lines to the collection index, if built or being built,
+        # up to chunk_size lines per call
+        keys = [cls.COLL_CDXJ_KEY.format(coll=coll),
+                cls.COLL_CDXJ_READY_KEY.format(coll=coll),
+                cls.COLL_CDXJ_LOCK_KEY.format(coll=coll)]
+
+        lines = [line for line in lines if line]
+
+        for i in range(0, len(lines), chunk_size):
+            pi.eval(cls.ADD_LINES_SCRIPT, len(keys), *(keys + lines[i:i + chunk_size]))
+
+    def incr_cdxj_gen(self):
+        # incremented after any change to the collection or recording indexes,
+        # invalidating cached index lookups
+        self.redis.incr(self.COLL_CDXJ_GEN_KEY.format(coll=self.my_id))
+
+    def remove_rec_index(self, recording):
+        coll_cdxj_key = self.COLL_CDXJ_KEY.format(coll=self.my_id)
+
+        # lines may be added while the index is being built,
+        # so always removed if index exists
+        if not self.redis.exists(coll_cdxj_key):
+            return
+
+        cdxj_key = Recording.CDXJ_KEY.format(rec=recording.my_id)
+
+        if self.redis.exists(cdxj_key):
+            cdxj_lines = self.redis.zrange(cdxj_key, 0, -1)
+
+        else:
+            cdxj_filename = recording.get_prop(self.INDEX_FILE_KEY)
+            if not cdxj_filename:
+                return
+
+            try:
+                fh = load(cdxj_filename)
+                cdxj_lines = [line.decode('utf-8') for line in iter_lines(fh)]
+                fh.close()
+
+                # as added to collection index
+                cdxj_lines = CDXJCodec(self.redis).encode_lines(self.my_id, cdxj_lines)
+            except Exception as e:
+                logging.error('Could not load: ' + cdxj_filename)
+                # remove all lines on next sync
+                self.redis.delete(self.COLL_CDXJ_READY_KEY.format(coll=self.my_id),
+                                  coll_cdxj_key)
+                return
+
+        with redis_pipeline(self.redis) as pi:
+            for i in range(0, len(cdxj_lines), self.INDEX_CHUNK_SIZE):
+                pi.zrem(coll_cdxj_key, *cdxj_lines[i:i + self.INDEX_CHUNK_SIZE])
 
     def _do_download_cdxj(self, cdxj_key, output_key):
         lock_key = None
@@ -585,7 +801,7 @@ class Collection(PagesMixin, RedisUniqueComponent):
             cdxj_filename = self.redis.hget(rec_info_key, self.INDEX_FILE_KEY)
             if not cdxj_filename:
                 logging.debug('No index for ' + rec_info_key)
-                return
+                return True
 
             lock_key = cdxj_key + ':_'
             logging.debug('Downloading for {0} file {1}'.format(rec_info_key, cdxj_filename))
@@ -594,18 +810,18 @@ class Collection(PagesMixin, RedisUniqueComponent):
             if not self.redis.set(lock_key, 1, nx=True):
                 logging.warning('Already downloading, skipping')
                 lock_key = None
-                return
+                # not loaded here, not yet ready
+                return False
 
             while attempts < 10:
                 fh = None
                 try:
                     fh = load(cdxj_filename)
-                    buff = fh.read()
 
-                    for cdxj_line in buff.splitlines():
-                        self.redis.zadd(output_key, 0, cdxj_line)
+                    count = self._zadd_lines(output_key, iter_lines(fh))
 
-                    break
+                    logging.debug('Loaded {0} lines from {1}'.format(count, cdxj_filename))
+                    return True
                 except Exception as e:
                     import traceback
                     traceback.print_exc()
@@ -616,12 +832,13 @@ class Collection(PagesMixin, RedisUniqueComponent):
                     if fh:
                         fh.close()
 
-            self.redis.expire(output_key, self.COLL_CDXJ_TTL)
+            return False
 
         except Exception as e:
             logging.error('Error downloading cache: ' + str(e))
             import traceback
             traceback.print_exc()
+            return False
 
         finally:
             if lock_key:
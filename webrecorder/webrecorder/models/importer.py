@@ -24,7 +24,8 @@ import gevent
 import redis
 
 from webrecorder.utils import SizeTrackingReader, CacheingLimitReader
-from webrecorder.utils import redis_pipeline, sanitize_title
+from webrecorder.utils import redis_pipeline, sanitize_title, get_record_host
+from webrecorder.models.cdxjcodec import CDXJCodec
 
 import logging
 logger = logging.getLogger(__name__)
@@ -81,13 +82,14 @@ class BaseImporter(ImportStatusChecker):
         self.upload_path = config['url_templates']['upload']
         self.upload_exp = int(config['upload_status_expire'])
 
-        self.record_host = os.environ['RECORD_HOST']
+        self.record_hosts = os.environ['RECORD_HOST'].split(',')
 
         self.upload_coll_info = config['upload_coll']
 
         self.detect_list_info = config['page_detect_list']
 
         self.max_detect_pages = config['max_detect_pages']
+        self.detect_pages_chunk_size = int(config['detect_pages_chunk_size'])
 
     def handle_upload(self, stream, upload_id, upload_key, infos, filename,
                       user, force_coll_name, total_size):
@@ -343,17 +345,46 @@ class BaseImporter(ImportStatusChecker):
 
         pages = []
 
-        #for member, score in self.redis.zscan_iter(key):
-        for member in self.redis.zrange(key, 0, -1):
-            cdxj = CDXObject(member.encode('utf-8'))
+        codec = CDXJCodec(self.redis)
 
-            if ((not self.max_detect_pages or len(pages) < self.max_detect_pages)
-                and self.is_page(cdxj)):
-                pages.append(dict(url=cdxj['url'],
-                                  title=cdxj['url'],
-                                  timestamp=cdxj['timestamp']))
+        chunk_size = self.detect_pages_chunk_size
 
-        return pages
+        # read index in chunks, in order, parsing only lines that may be pages
+        start = 0
+        while True:
+            members = self.redis.zrange(key, start, start + chunk_size - 1)
+
+            start += chunk_size
+
+            for member in codec.decode_lines(coll, filter(self.may_be_page, members)):
+                cdxj = CDXObject(member.encode('utf-8'))
+
+                if self.is_page(cdxj):
+                    pages.append(dict(url=cdxj['url'],
+                                      title=cdxj['url'],
+                                      timestamp=cdxj['timestamp']))
+
+                    if self.max_detect_pages and len(pages) >= self.max_detect_pages:
+                        return pages
+
+            if len(members) < chunk_size:
+                return pages
+
+    def may_be_page(self, member):
+        # quick check on the index line (plain or compact) before parsing:
+        # only false if is_page() would be false
+        if 'text/html' not in member and 'text/plain' not in member:
+            return False
+
+        if 'http://' not in member and 'https://' not in member:
+            return False
+
+        # status in json, not compact
+        if '"status": "' in member:
+            if '"status": "200"' not in member and '"status": "-"' not in member:
+                return False
+
+        return True
 
     def is_page(self, cdxj):
         if cdxj['url'].endswith('/robots.txt'):
@@ -576,7 +607,7 @@ class UploadImporter(BaseImporter):
         stream = LimitReader(stream, length)
         headers = {'Content-Length': str(length)}
 
-        upload_url = self.upload_path.format(record_host=self.record_host,
+        upload_url = self.upload_path.format(record_host=get_record_host(self.record_hosts, rec),
                                              user=user,
                                              coll=coll,
                                              rec=rec,
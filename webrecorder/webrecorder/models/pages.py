@@ -1,3 +1,5 @@
+from webrecorder.utils import redis_pipeline
+
 import json
 import hashlib
 
@@ -7,6 +9,11 @@ class PagesMixin(object):
     PAGES_KEY = 'c:{coll}:p'
     PAGE_BOOKMARKS_KEY = 'c:{coll}:p_to_b'
 
+    # page indexes, members are '<timestamp> <page id>', all with score 0,
+    # for range lookups by timestamp, all pages and per recording
+    PAGES_TS_KEY = 'c:{coll}:p_ts'
+    REC_PAGES_KEY = 'r:{rec}:p'
+
     def __init__(self, **kwargs):
         super(PagesMixin, self).__init__(**kwargs)
         self._pages_cache = None
@@ -29,7 +36,11 @@ class PagesMixin(object):
 
         pid = self._new_page_id(page)
 
-        self.redis.hset(self.pages_key, pid, json.dumps(page))
+        self._init_page_index()
+
+        with redis_pipeline(self.redis) as pi:
+            pi.hset(self.pages_key, pid, json.dumps(page))
+            self._add_page_index(pi, pid, page)
 
         return pid
 
@@ -37,14 +48,19 @@ class PagesMixin(object):
         page_attrs = (page['url'] + page['timestamp'] + page.get('rec', '') + page.get('browser', '')).encode('utf-8')
         return hashlib.md5(page_attrs).hexdigest()[:10]
 
-    def delete_page(self, pid, all_page_bookmarks):
+    def delete_page(self, pid, all_page_bookmarks, page=None):
         page_bookmarks = all_page_bookmarks.get(pid, {})
         for bid, list_id in page_bookmarks.items():
             blist = self.get_list(list_id)
             if blist:
                 blist.remove_bookmark(bid)
 
-        self.redis.hdel(self.pages_key, pid)
+        page = page or self.get_page(pid)
+
+        with redis_pipeline(self.redis) as pi:
+            pi.hdel(self.pages_key, pid)
+            if page:
+                self._remove_page_index(pi, pid, page)
 
         page_bookmarks_key = self.PAGE_BOOKMARKS_KEY.format(coll=self.my_id)
         self.redis.hdel(page_bookmarks_key, pid)
@@ -76,12 +92,80 @@ class PagesMixin(object):
         return pages
 
     def list_rec_pages(self, recording):
-        rec_id = recording.my_id
+        if self._pages_cache is not None:
+            return self._pages_cache.get(recording.my_id, [])
+
+        pages, _ = self.list_pages_range(recording=recording)
+        return pages
+
+    def cache_rec_pages(self, pages):
+        self._pages_cache = {}
+        for page in pages:
+            self._pages_cache.setdefault(page.get('rec'), []).append(page)
 
-        if not self._pages_cache:
-            self._pages_cache = self.list_pages()
+    def count_rec_pages(self, recording):
+        self._init_page_index()
 
-        return [page for page in self._pages_cache if page.get('rec') == rec_id]
+        return self.redis.zcard(self.REC_PAGES_KEY.format(rec=recording.my_id))
+
+    # pages in timestamp order after cursor, and the cursor for the next pages, if any
+    def list_pages_range(self, cursor=None, limit=None, recording=None):
+        self._init_page_index()
+
+        if recording:
+            key = self.REC_PAGES_KEY.format(rec=recording.my_id)
+        else:
+            key = self.PAGES_TS_KEY.format(coll=self.my_id)
+
+        start = '(' + cursor if cursor else '-'
+
+        if limit:
+            members = self.redis.zrangebylex(key, start, '+', start=0, num=limit)
+        else:
+            members = self.redis.zrangebylex(key, start, '+')
+
+        if not members:
+            return [], None
+
+        pids = [member.rsplit(' ', 1)[-1] for member in members]
+
+        pages = []
+        for pid, value in zip(pids, self.redis.hmget(self.pages_key, pids)):
+            if value:
+                page = json.loads(value)
+                page['id'] = pid
+                pages.append(page)
+
+        next_cursor = members[-1] if limit and len(members) == limit else None
+
+        return pages, next_cursor
+
+    def _page_index_member(self, pid, page):
+        return '{0} {1}'.format(page.get('timestamp', ''), pid)
+
+    def _add_page_index(self, pi, pid, page):
+        member = self._page_index_member(pid, page)
+
+        pi.zadd(self.PAGES_TS_KEY.format(coll=self.my_id), 0, member)
+        if page.get('rec'):
+            pi.zadd(self.REC_PAGES_KEY.format(rec=page['rec']), 0, member)
+
+    def _remove_page_index(self, pi, pid, page):
+        member = self._page_index_member(pid, page)
+
+        pi.zrem(self.PAGES_TS_KEY.format(coll=self.my_id), member)
+        if page.get('rec'):
+            pi.zrem(self.REC_PAGES_KEY.format(rec=page['rec']), member)
+
+    def _init_page_index(self):
+        # pages added before indexes were maintained, index all once
+        ts_key = self.PAGES_TS_KEY.format(coll=self.my_id)
+        if self.redis.exists(ts_key) or not self.redis.exists(self.pages_key):
+            return
+
+        with redis_pipeline(self.redis) as pi:
+            for page in self.list_pages():
+                self._add_page_index(pi, page['id'], page)
 
     def get_pages_for_list(self, id_list):
         if not id_list:
@@ -98,7 +182,7 @@ class PagesMixin(object):
         all_page_bookmarks = self.get_all_page_bookmarks(rec_pages)
 
         for n in rec_pages:
-            self.delete_page(n['id'], all_page_bookmarks)
+            self.delete_page(n['id'], all_page_bookmarks, n)
 
     def import_pages(self, pagelist, recording):
         if not pagelist:
@@ -122,7 +206,13 @@ class PagesMixin(object):
 
             pages[pid] = json.dumps(page)
 
-        self.redis.hmset(self.pages_key, pages)
+        self._init_page_index()
+
+        with redis_pipeline(self.redis) as pi:
+            pi.hmset(self.pages_key, pages)
+
+            for page in pagelist:
+                self._add_page_index(pi, page['id'], page)
 
         return id_map
 
@@ -3,6 +3,7 @@ import hashlib
 import os
 import base64
 import shutil
+import time
 
 from six.moves.urllib.parse import urlsplit
 
@@ -11,9 +12,10 @@ from pywb.warcserver.index.cdxobject import CDXObject
 
 from pywb.utils.loaders import BlockLoader
 
-from webrecorder.utils import redis_pipeline
+from webrecorder.utils import redis_pipeline, get_new_id
 from webrecorder.models.base import RedisUniqueComponent, RedisUnorderedList
 from webrecorder.models.stats import Stats
+from webrecorder.models.cdxjcodec import CDXJCodec
 from webrecorder.rec.storage.storagepaths import strip_prefix, add_local_store_prefix
 from webrecorder.rec.storage import LocalFileStorage
 
@@ -30,29 +32,75 @@ class Recording(RedisUniqueComponent):
 
     CDXJ_KEY = 'r:{rec}:cdxj'
 
+    DEDUP_BLOOM_KEY = 'r:{rec}:_bf'
+
     RA_KEY = 'r:{rec}:ra'
 
+    # remote archive sources, if loaded along with other recordings
+    ra_sources = None
+
     PENDING_SIZE_KEY = 'r:{rec}:_ps'
     PENDING_COUNT_KEY = 'r:{rec}:_pc'
     PENDING_TTL = 90
 
+    # skip if rec no longer exists (deleted while transfer is pending)
+    INCR_PENDING_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return 0
+end
+
+redis.call('incrby', KEYS[2], tonumber(ARGV[1]))
+redis.call('expire', KEYS[2], tonumber(ARGV[3]))
+
+redis.call('incrby', KEYS[3], tonumber(ARGV[2]))
+redis.call('expire', KEYS[3], tonumber(ARGV[3]))
+return 1
+"""
+
     REC_WARC_KEY = 'r:{rec}:wk'
+
+    # warcs uploaded to storage while recording, not yet committed
+    STREAMED_WARC_KEY = 'r:{rec}:_sw'
     COLL_WARC_KEY = 'c:{coll}:warc'
 
     COMMIT_LOCK_KEY = 'r:{rec}:lock'
 
+    # KEYS: lock key
+    # ARGV: lease token, ttl
+    RENEW_COMMIT_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], tonumber(ARGV[2]))
+end
+return 0
+"""
+
+    # KEYS: lock key
+    # ARGV: lease token
+    RELEASE_COMMIT_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
     INDEX_FILE_KEY = '@index_file'
 
     INDEX_NAME_TEMPL = 'index-{timestamp}-{random}.cdxj'
 
     DELETE_RETRY = 'q:delete_retry'
 
+    # rec id -> time when rec is next due to be checked for commit
+    COMMIT_QUEUE = 'q:commit'
+
     # overridable
     OPEN_REC_TTL = 5400
 
+    COMMIT_LOCK_SECS = 300
+
     @classmethod
     def init_props(cls, config):
         cls.OPEN_REC_TTL = int(config['open_rec_ttl'])
+        cls.COMMIT_LOCK_SECS = int(config['commit_lock_secs'])
         #cls.INDEX_FILE_KEY = config['info_index_key']
 
         cls.CDXJ_KEY = config.get('cdxj_key_templ', cls.CDXJ_KEY)
@@ -87,6 +135,8 @@ class Recording(RedisUniqueComponent):
 
             pi.setex(open_rec_key, self.OPEN_REC_TTL, 1)
 
+            self.schedule_commit(pi, time.time() + self.OPEN_REC_TTL)
+
         return rec
 
     def is_open(self, extend=True):
@@ -96,9 +146,20 @@ class Recording(RedisUniqueComponent):
         else:
             return self.redis.exists(open_rec_key)
 
+    def schedule_commit(self, pi, due_at):
+        pi.zadd(self.COMMIT_QUEUE, due_at, self.my_id)
+
     def set_closed(self):
         open_rec_key = self.OPEN_REC_KEY.format(rec=self.my_id)
-        self.redis.delete(open_rec_key)
+
+        with redis_pipeline(self.redis) as pi:
+            pi.delete(open_rec_key)
+
+            # commit as soon as possible
+            self.schedule_commit(pi, time.time())
+
+        # recorders may cache open state, notify of close
+        self.redis.publish('close_rec', self.INFO_KEY.format(rec=self.my_id))
 
     def is_fully_committed(self):
         if self.get_pending_count() > 0:
@@ -115,32 +176,13 @@ class Recording(RedisUniqueComponent):
         pending_size = self.PENDING_SIZE_KEY.format(rec=self.my_id)
         return int(self.redis.get(pending_size) or 0)
 
-    def inc_pending_count(self):
-        if not self.is_open(extend=False):
-            return
-
-        pending_count = self.PENDING_COUNT_KEY.format(rec=self.my_id)
-        self.redis.incrby(pending_count, 1)
-        self.redis.expire(pending_count, self.PENDING_TTL)
-
-    def inc_pending_size(self, size):
-        if not self.is_open(extend=False):
-            return
-
-        pending_size = self.PENDING_SIZE_KEY.format(rec=self.my_id)
-        self.redis.incrby(pending_size, size)
-        self.redis.expire(pending_size, self.PENDING_TTL)
-
-    def dec_pending_count_and_size(self, size):
-        # return if rec no longer exists (deleted while transfer is pending)
-        if not self.redis.exists(self.info_key):
-            return
-
-        pending_count = self.PENDING_COUNT_KEY.format(rec=self.my_id)
-        self.redis.incrby(pending_count, -1)
-
-        pending_size = self.PENDING_SIZE_KEY.format(rec=self.my_id)
-        self.redis.incrby(pending_size, -size)
+    def incr_pending(self, count, size, pi=None):
+        pi = pi or self.redis
+        pi.eval(self.INCR_PENDING_SCRIPT, 3,
+                self.info_key,
+                self.PENDING_COUNT_KEY.format(rec=self.my_id),
+                self.PENDING_SIZE_KEY.format(rec=self.my_id),
+                count, size, self.PENDING_TTL)
 
     def serialize(self,
                   include_pages=False,
@@ -155,8 +197,11 @@ class Recording(RedisUniqueComponent):
             data['pages'] = self.get_owner().list_rec_pages(self)
 
         # add any remote archive sources
-        ra_key = self.RA_KEY.format(rec=self.my_id)
-        data['ra_sources'] = list(self.redis.smembers(ra_key))
+        if self.ra_sources is not None:
+            data['ra_sources'] = self.ra_sources
+        else:
+            ra_key = self.RA_KEY.format(rec=self.my_id)
+            data['ra_sources'] = list(self.redis.smembers(ra_key))
 
         if include_files:
             files = {}
@@ -171,8 +216,24 @@ class Recording(RedisUniqueComponent):
 
         return data
 
-    def delete_me(self, storage, pages=True):
-        res = self.delete_files(storage)
+    @classmethod
+    def load_ra_sources(cls, redis, recordings):
+        if not recordings:
+            return
+
+        pi = redis.pipeline(transaction=False)
+        for recording in recordings:
+            pi.smembers(cls.RA_KEY.format(rec=recording.my_id))
+
+        for recording, ra_sources in zip(recordings, pi.execute()):
+            recording.ra_sources = list(ra_sources)
+
+    def delete_me(self, storage, pages=True, all_files=None):
+        self.set_closed()
+
+        self.redis.zrem(self.COMMIT_QUEUE, self.my_id)
+
+        res = self.delete_files(storage, all_files)
 
         Stats(self.redis).incr_delete(self)
 
@@ -205,34 +266,53 @@ class Recording(RedisUniqueComponent):
             if index_file:
                 yield self.INDEX_FILE_KEY, index_file
 
-    def delete_files(self, storage):
-        errs = []
-
+    def delete_files(self, storage, all_files=None):
         coll_warc_key = self._coll_warc_key()
 
-        local_storage = LocalFileStorage(self.redis)
+        files = {v: n for n, v in self.iter_all_files(include_index=True) if v}
 
-        for n, v in self.iter_all_files(include_index=True):
-            success = storage.delete_file(v)
+        streamed_key = self.STREAMED_WARC_KEY.format(rec=self.my_id)
+        streamed = [v for v in self.redis.hvals(streamed_key) if v not in files]
 
-            # if delete with default storage failed,
-            #  may be a local, uncomitted file, that must be deleted with local storage
-            if not success:
-                success = local_storage.delete_file(v)
+        # if deleting collection, files for all recordings deleted together
+        if all_files is not None:
+            all_files.extend(files.keys())
+            all_files.extend(streamed)
+            return {}
 
-            if not success:
-                errs.append(v)
+        errs = self.delete_file_list(self.redis, storage, list(files.keys()))
 
-                # queue file to retry deletion later
-                self.redis.rpush(self.DELETE_RETRY, v)
-            else:
-                self.redis.hdel(coll_warc_key, n)
+        with redis_pipeline(self.redis) as pi:
+            for v, n in files.items():
+                if v not in errs:
+                    pi.hdel(coll_warc_key, n)
+
+        if storage and streamed:
+            storage.delete_files(streamed)
 
         if errs:
             return {'error_delete_files': errs}
         else:
             return {}
 
+    @classmethod
+    def delete_file_list(cls, redis, storage, filenames):
+        if storage:
+            failed = storage.delete_files(filenames)
+        else:
+            failed = filenames
+
+        # if delete with default storage failed,
+        #  may be a local, uncomitted file, that must be deleted with local storage
+        if failed:
+            failed = LocalFileStorage(redis).delete_files(failed)
+
+        # queue files to retry deletion later
+        if failed:
+            redis.rpush(cls.DELETE_RETRY, *failed)
+
+        return failed
+
     def track_remote_archive(self, pi, source_id):
         ra_key = self.RA_KEY.format(rec=self.my_id)
         pi.sadd(ra_key, source_id)
@@ -268,6 +348,10 @@ class Recording(RedisUniqueComponent):
 
         cdxj_list = self.redis.zrange(cdxj_key, 0, -1)
 
+        # committed index always written as plain cdxj
+        codec = CDXJCodec(self.redis)
+        cdxj_list = sorted(codec.decode_lines(self.get_owner().my_id, cdxj_list))
+
         with open(full_filename, 'wt') as out:
             for cdxj in cdxj_list:
                 out.write(cdxj + '\n')
@@ -279,11 +363,61 @@ class Recording(RedisUniqueComponent):
 
         return cdxj_filename, full_filename
 
-    def commit_to_storage(self, storage=None):
+    def recode_cdxj(self, cdxj_key, source_coll_id, coll_id):
+        codec = CDXJCodec(self.redis)
+        members = [member for member in self.redis.zrange(cdxj_key, 0, -1)
+                   if codec.is_compact(member)]
+
+        if not members:
+            return
+
+        lines = [codec.decode(source_coll_id, member) for member in members]
+        lines = codec.encode_lines(coll_id, lines)
+
+        with redis_pipeline(self.redis) as pi:
+            pi.zrem(cdxj_key, *members)
+            pi.zadd(cdxj_key, *[val for line in lines for val in (0, line)])
+
+    def acquire_commit_lock(self):
+        commit_lock = self.COMMIT_LOCK_KEY.format(rec=self.my_id)
+        token = get_new_id()
+
+        if not self.redis.set(commit_lock, token, ex=self.COMMIT_LOCK_SECS, nx=True):
+            return False
+
+        self.commit_token = token
+        return True
+
+    def renew_commit_lock(self):
+        token = getattr(self, 'commit_token', None)
+        if not token:
+            return False
+
         commit_lock = self.COMMIT_LOCK_KEY.format(rec=self.my_id)
-        if not self.redis.setnx(commit_lock, '1'):
+        return self.redis.eval(self.RENEW_COMMIT_LOCK_SCRIPT, 1, commit_lock,
+                               token, self.COMMIT_LOCK_SECS) == 1
+
+    def release_commit_lock(self):
+        token = getattr(self, 'commit_token', None)
+        if not token:
             return
 
+        self.commit_token = None
+
+        commit_lock = self.COMMIT_LOCK_KEY.format(rec=self.my_id)
+        self.redis.eval(self.RELEASE_COMMIT_LOCK_SCRIPT, 1, commit_lock, token)
+
+    def commit_to_storage(self, storage=None):
+        # lease expires if committer exits, renewed while committing
+        if not self.acquire_commit_lock():
+            return False
+
+        try:
+            return self._commit_to_storage(storage)
+        finally:
+            self.release_commit_lock()
+
+    def _commit_to_storage(self, storage):
         collection = self.get_owner()
         user = collection.get_owner()
 
@@ -298,6 +432,10 @@ class Recording(RedisUniqueComponent):
 
         cdxj_filename, full_cdxj_filename = self.write_cdxj(user, cdxj_key)
 
+        # warc name -> url, if uploaded while recording
+        streamed_key = self.STREAMED_WARC_KEY.format(rec=self.my_id)
+        streamed = self.redis.hgetall(streamed_key)
+
         all_done = True
 
         if storage:
@@ -305,15 +443,28 @@ class Recording(RedisUniqueComponent):
                                         info_key, self.INDEX_FILE_KEY, direct_delete=True)
 
             for warc_filename, warc_full_filename in self.iter_all_files():
-                done = collection.commit_file(warc_filename, warc_full_filename, 'warcs', warc_key)
+                if not self.renew_commit_lock():
+                    print('Commit lease lost: ' + self.my_id)
+                    return False
+
+                done = collection.commit_file(warc_filename, warc_full_filename, 'warcs', warc_key,
+                                              streamed_url=streamed.get(warc_filename))
 
                 all_done = all_done and done
 
         if all_done:
+            # streamed but uploaded again, eg. if recording moved while recording
+            committed = set(url for name, url in self.iter_all_files())
+            unused = [url for url in streamed.values() if url not in committed]
+            if storage and unused:
+                storage.delete_files(unused)
+
             print('Deleting Redis Key: ' + cdxj_key)
-            self.redis.delete(cdxj_key)
+            self.redis.delete(cdxj_key,
+                              self.DEDUP_BLOOM_KEY.format(rec=self.my_id),
+                              streamed_key)
 
-        self.redis.delete(commit_lock)
+        return all_done
 
     def _copy_prop(self, source, name):
         prop = source.get_prop(name)
@@ -373,8 +524,12 @@ class Recording(RedisUniqueComponent):
 
         self.redis.zunionstore(target_key, [source_key])
 
-        # recreate pages, if any, in new recording
+        # filename ids are per collection, re-encode for target collection
         source_coll = source.get_owner()
+        if source_coll.my_id != collection.my_id:
+            self.recode_cdxj(target_key, source_coll.my_id, collection.my_id)
+
+        # recreate pages, if any, in new recording
         source_pages = source_coll.list_rec_pages(source)
         collection.import_pages(source_pages, self)
 
@@ -386,8 +541,8 @@ class Recording(RedisUniqueComponent):
         self.redis.sunionstore(self.REC_WARC_KEY.format(rec=self.my_id),
                                self.REC_WARC_KEY.format(rec=source.my_id))
 
-        # sync collection cdxj, if exists
-        collection.sync_coll_index(exists=True, do_async=True)
+        # add to collection cdxj, if exists
+        collection.add_rec_index(self)
 
         if not errored and delete_source:
             collection = source.get_owner()
@@ -42,6 +42,23 @@ class Stats(object):
     BOOKMARK_MOD_KEY = 'st:bookmark-mod'
     BOOKMARK_DEL_KEY = 'st:bookmark-del'
 
+    COMMIT_COUNT_KEY = 'st:commit-count'
+    COMMIT_TIME_KEY = 'st:commit-time-ms'
+    COMMIT_QUEUE_KEY = 'st:commit-queue-max'
+
+    # KEYS: stats key
+    # ARGV: day, value
+    SET_MAX_SCRIPT = """
+if tonumber(ARGV[2]) > tonumber(redis.call('hget', KEYS[1], ARGV[1]) or 0) then
+    redis.call('hset', KEYS[1], ARGV[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+    WARC_CACHE_HIT_KEY = 'st:warc-cache-hit'
+    WARC_CACHE_MISS_KEY = 'st:warc-cache-miss'
+
     BROWSERS_KEY = 'st:br:{0}'
 
     SOURCES_KEY = 'st:ra:{0}'
@@ -73,51 +90,53 @@ class Stats(object):
         rate_limit_key = self.RATE_LIMIT_KEY.format(ip=ip, H=h)
         return rate_limit_key
 
-    def incr_record(self, params, size, cdx_list):
+    def incr_record(self, params, size, cdx_list, pi=None):
         username = params.get('param.user')
         if not username:
             return
 
+        if not pi:
+            with redis_pipeline(self.redis) as pi:
+                return self.incr_record(params, size, cdx_list, pi=pi)
+
         today = today_str()
 
-        with redis_pipeline(self.redis) as pi:
-            # rate limiting
-            rate_limit_key = self.get_rate_limit_key(params)
-            if rate_limit_key:
-                pi.incrby(rate_limit_key, size)
-                pi.expire(rate_limit_key, self.RATE_LIMIT_TTL)
-
-            # write size to usage hashes
-            if username.startswith(self.TEMP_PREFIX):
-                key = self.ALL_CAPTURE_TEMP_KEY
-            else:
-                key = self.ALL_CAPTURE_USER_KEY
+        # rate limiting
+        rate_limit_key = self.get_rate_limit_key(params)
+        if rate_limit_key:
+            pi.incrby(rate_limit_key, size)
+            pi.expire(rate_limit_key, self.RATE_LIMIT_TTL)
 
-            if key:
-                pi.hincrby(key, today, size)
+        # write size to usage hashes
+        if username.startswith(self.TEMP_PREFIX):
+            key = self.ALL_CAPTURE_TEMP_KEY
+        else:
+            key = self.ALL_CAPTURE_USER_KEY
+
+        if key:
+            pi.hincrby(key, today, size)
 
         is_extract = params.get('sources') != None
         is_patch = params.get('param.recorder.rec') != None
 
         if is_extract or is_patch:
-            with redis_pipeline(self.redis) as pi:
-                for cdx in cdx_list:
-                    try:
-                        cdx = CDXObject(cdx)
-                        source_id = cdx['orig_source_id']
-                        size = int(cdx['length'])
-                        if source_id and size:
-                            pi.hincrby(self.SOURCES_KEY.format(source_id), today, size)
-                    except Exception as e:
-                        pass
-
-                if is_patch:
-                    if username.startswith(self.TEMP_PREFIX):
-                        key = self.PATCH_TEMP_KEY
-                    else:
-                        key = self.PATCH_USER_KEY
-
-                    pi.hincrby(key, today, size)
+            for cdx in cdx_list:
+                try:
+                    cdx = CDXObject(cdx)
+                    source_id = cdx['orig_source_id']
+                    size = int(cdx['length'])
+                    if source_id and size:
+                        pi.hincrby(self.SOURCES_KEY.format(source_id), today, size)
+                except Exception as e:
+                    pass
+
+            if is_patch:
+                if username.startswith(self.TEMP_PREFIX):
+                    key = self.PATCH_TEMP_KEY
+                else:
+                    key = self.PATCH_USER_KEY
+
+                pi.hincrby(key, today, size)
 
     def incr_browser(self, browser_id):
         browser_key = self.BROWSERS_KEY.format(browser_id)
@@ -158,6 +177,26 @@ class Stats(object):
         self.redis.hincrby(self.UPLOADS_COUNT_KEY, today, 1)
         self.redis.hincrby(self.UPLOADS_SIZE_KEY, today, size)
 
+    def incr_commit(self, secs):
+        today = today_str()
+        with redis_pipeline(self.redis) as pi:
+            pi.hincrby(self.COMMIT_COUNT_KEY, today, 1)
+            pi.hincrby(self.COMMIT_TIME_KEY, today, int(secs * 1000))
+
+    def set_commit_queue_depth(self, depth):
+        # max number of recordings due for commit, per day
+        if depth > 0:
+            self.redis.eval(self.SET_MAX_SCRIPT, 1, self.COMMIT_QUEUE_KEY, today_str(), depth)
+
+    def incr_warc_cache(self, hits, misses):
+        today = today_str()
+        with redis_pipeline(self.redis) as pi:
+            if hits:
+                pi.hincrby(self.WARC_CACHE_HIT_KEY, today, hits)
+
+            if misses:
+                pi.hincrby(self.WARC_CACHE_MISS_KEY, today, misses)
+
     def incr_bookmark_add(self):
         self.redis.hincrby(self.BOOKMARK_ADD_KEY, today_str(), 1)
 
@@ -98,24 +98,25 @@ class User(RedisUniqueComponent):
         if not coll:
             return None
 
-        collection = Collection(my_id=coll,
-                                name=coll_name,
-                                redis=self.redis,
-                                access=self.access)
+        collection = Collection.get_instance(my_id=coll,
+                                             name=coll_name,
+                                             redis=self.redis,
+                                             access=self.access)
 
         collection.owner = self
         return collection
 
-    def get_collections(self, load=True):
+    def get_collections(self, load=True, fields=None):
         all_collections = self.colls.get_objects(Collection)
         collections = []
         for collection in all_collections:
             collection.owner = self
             if self.access.can_read_coll(collection, allow_superuser=False):
-                if load:
-                    collection.load()
                 collections.append(collection)
 
+        if load:
+            Collection.load_objects(self.redis, collections, fields)
+
         return collections
 
     def num_total_collections(self):
@@ -201,6 +202,9 @@ class User(RedisUniqueComponent):
         key = self.URL_SKIP_KEY.format(user=self.my_id,  url=url)
         r = self.redis.setex(key, self.SKIP_KEY_SECS, 1)
 
+        # invalidate any cached lookups in recorders
+        self.redis.publish('skip_url', key)
+
     def is_anon(self):
         return self.name.startswith('temp-')
 
@@ -361,9 +365,9 @@ class UserTable(object):
         self.users_key = users_key or self.USERS_KEY
 
     def make_user(self, name):
-        return User(my_id=name,
-                    redis=self.redis,
-                    access=self.access_func())
+        return User.get_instance(my_id=name,
+                                 redis=self.redis,
+                                 access=self.access_func())
 
     def __contains__(self, name):
         return self.redis.sismember(self.users_key, name) or self._anon_user_exists(name)
@@ -0,0 +1,139 @@
+from pywb.utils.format import res_template
+
+from collections import OrderedDict
+
+import hashlib
+import struct
+import time
+
+
+# ============================================================================
+# Bloom filter of payload digests for each recording, stored as a redis bitmap.
+# Answers definite misses for revisit lookups, possible hits are confirmed
+# with a full index lookup.
+#
+# Lookups check a local copy of the filter, so that a miss needs no redis call.
+# The local copy is loaded on first lookup, updated as digests are added,
+# and synced again every sync_secs for digests added by other recorders.
+class DedupBloomFilter(object):
+    # only start a filter for a new (empty) index, so that it covers every entry
+    # KEYS: bloom key, cdxj key
+    # ARGV: bit offsets
+    ADD_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 and redis.call('exists', KEYS[2]) == 1 then
+    return 0
+end
+
+for i = 1, #ARGV do
+    redis.call('setbit', KEYS[1], tonumber(ARGV[i]), 1)
+end
+return 1
+"""
+
+    # filter as hex, or 0 if index has no filter, 1 if not yet started
+    # KEYS: bloom key, cdxj key
+    SYNC_SCRIPT = """
+local data = redis.call('get', KEYS[1])
+if not data then
+    return redis.call('exists', KEYS[2]) == 1 and 0 or 1
+end
+
+local hex = {}
+for i = 1, #data do
+    hex[i] = string.format('%02x', string.byte(data, i))
+end
+return table.concat(hex)
+"""
+
+    def __init__(self, redis, key_template, config):
+        self.redis = redis
+        self.key_template = key_template
+
+        self.num_bits = int(config['dedup_bloom_bits'])
+        self.num_hashes = min(int(config['dedup_bloom_hashes']), 5)
+
+        self.max_local = int(config['dedup_bloom_max_local'])
+        self.sync_secs = int(config['dedup_bloom_sync_secs'])
+
+        # bloom key -> (synced_at, bits), least recently used first
+        # bits is None if the index has no filter, synced_at 0 if not yet synced
+        self.filters = OrderedDict()
+
+    def get_offsets(self, digest):
+        digest = digest.split(':')[-1].encode('utf-8')
+        hashes = struct.unpack('>5I', hashlib.sha1(digest).digest())
+        return [h % self.num_bits for h in hashes[:self.num_hashes]]
+
+    def add_digests(self, pi, params, cdxj_key, digests):
+        offsets = set()
+        for digest in digests:
+            offsets.update(self.get_offsets(digest))
+
+        if not offsets:
+            return
+
+        bloom_key = res_template(self.key_template, params)
+        pi.eval(self.ADD_SCRIPT, 2, bloom_key, cdxj_key, *offsets)
+
+        # set locally right away, merged with the redis filter once synced
+        synced_at, bits = self.filters.get(bloom_key, (0, None))
+        if not synced_at and bits is None:
+            bits = bytearray(self.num_bits // 8 + 1)
+            self._put(bloom_key, (0, bits))
+
+        if bits is not None:
+            for offset in offsets:
+                bits[offset >> 3] |= 0x80 >> (offset & 7)
+
+    def might_contain(self, params, cdxj_key, digest):
+        bloom_key = res_template(self.key_template, params)
+
+        entry = self.filters.get(bloom_key)
+        if not entry or time.time() - entry[0] >= self.sync_secs:
+            entry = self.sync(bloom_key, cdxj_key)
+        else:
+            self.filters.move_to_end(bloom_key)
+
+        synced_at, bits = entry
+
+        # no filter, always check index
+        if not synced_at or bits is None:
+            return True
+
+        for offset in self.get_offsets(digest):
+            if not bits[offset >> 3] & (0x80 >> (offset & 7)):
+                return False
+
+        return True
+
+    def sync(self, bloom_key, cdxj_key):
+        res = self.redis.eval(self.SYNC_SCRIPT, 2, bloom_key, cdxj_key)
+
+        # local bits, including any added while syncing
+        synced_at, bits = self.filters.get(bloom_key, (0, None))
+
+        if res == 0:
+            entry = (time.time(), None)
+
+        elif res == 1:
+            entry = (0, bits)
+
+        else:
+            synced = bytearray.fromhex(res)
+            synced.extend(bytes(max(self.num_bits // 8 + 1 - len(synced), 0)))
+
+            if bits is not None:
+                for i, value in enumerate(bits):
+                    synced[i] |= value
+
+            entry = (time.time(), synced)
+
+        self._put(bloom_key, entry)
+        return entry
+
+    def _put(self, bloom_key, entry):
+        self.filters[bloom_key] = entry
+        self.filters.move_to_end(bloom_key)
+
+        if len(self.filters) > self.max_local:
+            self.filters.popitem(last=False)
@@ -0,0 +1,157 @@
+import os
+import json
+import redis
+import socket
+import time
+
+from webrecorder.models.recording import Recording
+from webrecorder.models.collection import Collection
+from webrecorder.rec.storage import get_storage
+from webrecorder.rec.storage.storagepaths import strip_prefix
+
+
+# ============================================================================
+# Retries deletion of files queued on the delete retry queue, in batches.
+# Remote files are deleted with batched storage deletes, local files directly.
+# Failed deletes are retried with exponential backoff,
+# and moved to the dead letter queue after max attempts.
+# Each batch is moved to a processing list until handled,
+# and processed again if the processor exits before then.
+class DeleteRetryProcessor(object):
+    DEAD_LETTER = 'q:delete_dead'
+
+    PROCESSING_KEY = 'q:delete_retry:{host}'
+
+    # KEYS: retry queue, processing list
+    # ARGV: batch size
+    MOVE_BATCH_SCRIPT = """
+local entries = redis.call('lrange', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+redis.call('ltrim', KEYS[1], #entries, -1)
+
+for i = 1, #entries do
+    redis.call('rpush', KEYS[2], entries[i])
+end
+return entries
+"""
+
+    def __init__(self, config):
+        super(DeleteRetryProcessor, self).__init__()
+
+        self.redis = redis.StrictRedis.from_url(os.environ['REDIS_BASE_URL'], decode_responses=True)
+
+        self.retry_queue = Recording.DELETE_RETRY
+
+        # per host, a restarted processor resumes its own batch
+        self.processing_key = self.PROCESSING_KEY.format(host=socket.gethostname())
+
+        self.batch_size = int(config['delete_retry_batch_size'])
+        self.max_attempts = int(config['delete_retry_max_attempts'])
+        self.backoff_secs = int(config['delete_retry_backoff_secs'])
+
+        self.storage = get_storage(Collection.DEFAULT_STORE_TYPE, self.redis)
+
+        print('Delete Retry Processor Started')
+
+    def __call__(self):
+        now = time.time()
+
+        entries = self.pop_batch()
+        if not entries:
+            return
+
+        due = {}
+        requeue = []
+
+        for entry in entries:
+            entry = self.parse_entry(entry)
+
+            if entry['retry_at'] > now:
+                requeue.append(entry)
+            else:
+                due[entry['url']] = entry
+
+        failed = self.delete_batch(list(due.keys()))
+
+        dead = []
+
+        for url in failed:
+            entry = due[url]
+            entry['attempts'] += 1
+
+            if entry['attempts'] >= self.max_attempts:
+                print('Delete Failed, Giving Up: ' + url)
+                dead.append(entry)
+            else:
+                entry['retry_at'] = now + self.backoff_secs * (2 ** (entry['attempts'] - 1))
+                requeue.append(entry)
+
+        print('Delete Retry: {0} deleted, {1} requeued, {2} failed'.format(
+              len(due) - len(failed), len(requeue), len(dead)))
+
+        # requeue and remove batch from processing list together
+        pi = self.redis.pipeline(transaction=True)
+
+        if requeue:
+            pi.rpush(self.retry_queue, *[json.dumps(entry) for entry in requeue])
+
+        if dead:
+            pi.rpush(self.DEAD_LETTER, *[json.dumps(entry) for entry in dead])
+
+        pi.delete(self.processing_key)
+        pi.execute()
+
+    def pop_batch(self):
+        # batch not yet handled, if processor exited while processing
+        entries = self.redis.lrange(self.processing_key, 0, -1)
+        if entries:
+            return entries
+
+        # atomically move batch from front of queue to processing list
+        return self.redis.eval(self.MOVE_BATCH_SCRIPT, 2, self.retry_queue,
+                               self.processing_key, self.batch_size)
+
+    def parse_entry(self, entry):
+        # queued by Recording.delete_files as plain url, or requeued with retry state
+        if entry.startswith('{'):
+            return json.loads(entry)
+
+        return {'url': entry, 'attempts': 0, 'retry_at': 0}
+
+    def delete_batch(self, urls):
+        local = {}
+        remote = []
+
+        for url in urls:
+            path = strip_prefix(url)
+            if '://' in path:
+                remote.append(url)
+            else:
+                local[url] = path
+
+        failed = [url for url, path in local.items()
+                  if not self.delete_local(path)]
+
+        if remote:
+            if self.storage:
+                failed.extend(self.storage.delete_files(remote))
+            else:
+                failed.extend(remote)
+
+        return failed
+
+    def delete_local(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            # already deleted
+            return True
+        except OSError as e:
+            print(e)
+            return False
+
+
+# =============================================================================
+if __name__ == "__main__":
+    from webrecorder.rec.worker import Worker
+    Worker(DeleteRetryProcessor).run()
@@ -0,0 +1,57 @@
+from webrecorder.utils import redis_pipeline
+
+import gevent
+
+
+# ============================================================================
+# Per-process pending count and size deltas for each recording.
+# Deltas are flushed to redis when a pending count changes,
+# when pending_flush_size is exceeded, or after pending_flush_secs
+class PendingCounter(object):
+    def __init__(self, redis, config):
+        self.redis = redis
+
+        self.flush_secs = float(config['pending_flush_secs'])
+        self.flush_size = int(config['pending_flush_size'])
+
+        # rec id -> [recording, count delta, size delta]
+        self.pending = {}
+        self.pending_size = 0
+
+        self.flush_timer = None
+
+    def incr(self, recording, count=0, size=0):
+        deltas = self.pending.get(recording.my_id)
+        if not deltas:
+            deltas = self.pending[recording.my_id] = [recording, 0, 0]
+
+        deltas[1] += count
+        deltas[2] += size
+
+        self.pending_size += abs(size)
+
+        if count or self.pending_size >= self.flush_size:
+            self.flush()
+
+        elif not self.flush_timer:
+            self.flush_timer = gevent.spawn_later(self.flush_secs, self.flush)
+
+    def flush(self):
+        pending = self.pending
+
+        self.pending = {}
+        self.pending_size = 0
+
+        # flushed before timer, cancel it
+        if self.flush_timer and self.flush_timer is not gevent.getcurrent():
+            self.flush_timer.kill(block=False)
+
+        self.flush_timer = None
+
+        if not pending:
+            return
+
+        with redis_pipeline(self.redis) as pi:
+            for recording, count, size in pending.values():
+                if count or size:
+                    recording.incr_pending(count, size, pi)
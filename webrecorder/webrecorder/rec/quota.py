@@ -0,0 +1,118 @@
+from pywb.utils.format import res_template
+
+import time
+
+
+# ============================================================================
+# Per-process cache of user quota, leased in chunks from redis.
+# Each lease is added to the user's reserved key, such that
+# size + reserved never exceeds max_size across all recorders.
+# Leased bytes are consumed locally and released from the reserved key
+# as the written records are indexed.
+class QuotaLeases(object):
+    # KEYS: user info key, reserved key
+    # ARGV: length needed, lease size, unused bytes returned, ttl
+    RESERVE_SCRIPT = """
+local reserved = tonumber(redis.call('get', KEYS[2]) or 0) - tonumber(ARGV[3])
+if reserved < 0 then reserved = 0 end
+
+local size = tonumber(redis.call('hget', KEYS[1], 'size') or 0)
+local max_size = tonumber(redis.call('hget', KEYS[1], 'max_size') or 0)
+
+local need = tonumber(ARGV[1])
+local avail = max_size - size - reserved
+
+local amount = -1
+if avail >= need then
+    amount = math.min(math.max(tonumber(ARGV[2]), need), avail)
+    reserved = reserved + amount
+end
+
+if reserved > 0 then
+    redis.call('set', KEYS[2], reserved)
+    redis.call('expire', KEYS[2], tonumber(ARGV[4]))
+else
+    redis.call('del', KEYS[2])
+end
+
+return amount
+"""
+
+    # KEYS: reserved key
+    # ARGV: bytes to release
+    RELEASE_SCRIPT = """
+local reserved = redis.call('incrby', KEYS[1], -tonumber(ARGV[1]))
+if reserved <= 0 then
+    redis.call('del', KEYS[1])
+end
+return reserved
+"""
+
+    def __init__(self, redis, config):
+        self.redis = redis
+
+        self.user_key = config['info_key_templ']['user']
+        self.reserved_key = config['quota_reserved_key_templ']
+
+        self.lease_size = int(config['quota_lease_size'])
+        self.lease_secs = int(config['quota_lease_secs'])
+
+        # reserved key -> (remaining bytes, time leased)
+        self.leases = {}
+
+    def get_reserved_key(self, params):
+        return res_template(self.reserved_key, params)
+
+    def reserve(self, params, length):
+        reserved_key = self.get_reserved_key(params)
+
+        now = time.time()
+        remaining, leased_at = self.leases.pop(reserved_key, (0, 0))
+
+        # renew leases halfway through, while still reserved in redis
+        if now - leased_at < self.lease_secs / 2:
+            if remaining >= length:
+                self.leases[reserved_key] = (remaining - length, leased_at)
+                return True
+
+        elif now - leased_at >= self.lease_secs:
+            remaining = 0
+
+        user_key = res_template(self.user_key, params)
+
+        amount = self.redis.eval(self.RESERVE_SCRIPT, 2,
+                                 user_key, reserved_key,
+                                 length, self.lease_size,
+                                 remaining, self.lease_secs)
+
+        if amount < 0:
+            return False
+
+        self.leases[reserved_key] = (amount - length, now)
+        return True
+
+    def refund(self, params, length):
+        reserved_key = self.get_reserved_key(params)
+
+        remaining, leased_at = self.leases.get(reserved_key, (0, 0))
+
+        # if expired, the reservation is dropped with the reserved key
+        if time.time() - leased_at < self.lease_secs:
+            self.leases[reserved_key] = (remaining + length, leased_at)
+
+    def release_written(self, pi, params, length):
+        pi.eval(self.RELEASE_SCRIPT, 1, self.get_reserved_key(params), length)
+
+    def release(self, reserved_key, now=None):
+        remaining, leased_at = self.leases.pop(reserved_key, (0, 0))
+
+        now = now or time.time()
+        if remaining > 0 and now - leased_at < self.lease_secs:
+            self.redis.eval(self.RELEASE_SCRIPT, 1, reserved_key, remaining)
+
+    def release_expired(self):
+        now = time.time()
+
+        for reserved_key, (remaining, leased_at) in list(self.leases.items()):
+            if now - leased_at >= self.lease_secs / 2:
+                self.release(reserved_key, now)
@@ -0,0 +1,50 @@
+from collections import OrderedDict
+
+import time
+
+
+# ============================================================================
+# Bounded LRU cache of skip key lookups for the recorder.
+# Skipped urls are cached until the skip key expires, urls not skipped
+# for up to skip_cache_secs or until invalidated by a 'skip_url' message
+class SkipUrlCache(object):
+    def __init__(self, redis, config):
+        self.redis = redis
+
+        self.max_size = int(config['skip_cache_size'])
+        self.cache_secs = min(int(config['skip_cache_secs']),
+                              int(config['skip_key_secs']))
+
+        # skip key -> (skipped, expire time)
+        self.cache = OrderedDict()
+
+    def is_skipped(self, skip_key):
+        now = time.time()
+
+        result = self.cache.get(skip_key)
+        if result and result[1] > now:
+            self.cache.move_to_end(skip_key)
+            return result[0]
+
+        pi = self.redis.pipeline(transaction=False)
+        pi.get(skip_key)
+        pi.ttl(skip_key)
+        value, ttl = pi.execute()
+
+        skipped = (value == '1')
+
+        if skipped and ttl and ttl > 0:
+            expires = now + ttl
+        else:
+            expires = now + self.cache_secs
+
+        self.cache[skip_key] = (skipped, expires)
+        self.cache.move_to_end(skip_key)
+
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+        return skipped
+
+    def invalidate(self, skip_key):
+        self.cache.pop(skip_key, None)
@@ -24,16 +24,28 @@ class BaseStorage(object):
         return True
 
     def upload_file(self, user, collection, recording,
-                    filename, full_filename, obj_type):
+                    filename, full_filename, obj_type, streamed_url=None):
 
         target_url = self.get_target_url(collection, obj_type, filename)
 
+        # already uploaded while recording, if to the same target
+        if (streamed_url and streamed_url == self.get_client_url(target_url) and
+            self.is_uploaded(target_url, full_filename)):
+            print('Already Uploaded {0} -> {1}'.format(full_filename, streamed_url))
+            self.cache[filename] = target_url
+            return True
+
         if self.do_upload(target_url, full_filename):
             self.cache[filename] = target_url
             return True
 
         return False
 
+    def is_uploaded(self, target_url, full_filename):
+        """ Check if target matches the local file, after a streaming upload
+        """
+        return False
+
     def get_upload_url(self, filename):
         target_url = self.cache.get(filename)
 
@@ -51,3 +63,8 @@ class BaseStorage(object):
 
         return self.do_delete(target_url, filename)
 
+    def delete_files(self, filenames):
+        """ Delete a batch of files, returning the filenames that could not be deleted
+        """
+        return [filename for filename in filenames
+                if not self.delete_file(filename)]
@@ -1,4 +1,5 @@
 import os
+import errno
 import shutil
 
 from webrecorder.rec.storage.base import BaseStorage
@@ -29,16 +30,36 @@ class DirectLocalFileStorage(BaseStorage):
         os.makedirs(os.path.dirname(target_url), exist_ok=True)
 
         try:
-            if full_filename != target_url:
-                shutil.copyfile(full_filename, target_url)
-            else:
+            if full_filename == target_url:
                 print('Same File')
 
+            elif not self.link_file(full_filename, target_url):
+                shutil.copyfile(full_filename, target_url)
+
             return True
         except Exception as e:
             print(e)
             return False
 
+    def link_file(self, full_filename, target_url):
+        # hardlink if on the same filesystem, the original is deleted once committed
+        try:
+            if os.path.isfile(target_url):
+                if os.path.samefile(full_filename, target_url):
+                    return True
+
+                os.remove(target_url)
+
+            os.link(full_filename, target_url)
+            return True
+
+        except OSError as e:
+            # different filesystem or no hardlink support, copy instead
+            if e.errno in (errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EMLINK):
+                return False
+
+            raise
+
     def is_valid_url(self, target_url):
         return os.path.isfile(target_url)
 
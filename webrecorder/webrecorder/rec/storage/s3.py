@@ -1,6 +1,10 @@
 import boto3
+import hashlib
+import base64
 import os
 
+from gevent.threadpool import ThreadPool
+
 from six.moves.urllib.parse import urlsplit, quote_plus
 
 from webrecorder.rec.storage.base import BaseStorage
@@ -8,6 +12,21 @@ from webrecorder.rec.storage.base import BaseStorage
 
 # ============================================================================
 class S3Storage(BaseStorage):
+    # overridable
+    UPLOAD_PART_SIZE = 16000000
+    UPLOAD_THREADS = 4
+    UPLOAD_PART_RETRIES = 3
+
+    # max keys per delete_objects request
+    DELETE_BATCH_SIZE = 1000
+
+    @classmethod
+    def init_props(cls, config):
+        # s3 requires parts of at least 5MB, except the last
+        cls.UPLOAD_PART_SIZE = max(int(config['s3_upload_part_size']), 5242880)
+        cls.UPLOAD_THREADS = int(config['s3_upload_threads'])
+        cls.UPLOAD_PART_RETRIES = int(config['s3_upload_part_retries'])
+
     def __init__(self):
         super(S3Storage, self).__init__()
         self.storage_root = os.environ['S3_ROOT']
@@ -17,6 +36,16 @@ class S3Storage(BaseStorage):
 
         self.s3 = boto3.client('s3')
 
+        # shared by streaming uploads, started on first use
+        self.upload_pool = None
+
+    def get_upload_pool(self):
+        # bounds part uploads in progress, and reads and hashes parts off the gevent loop
+        if not self.upload_pool:
+            self.upload_pool = ThreadPool(self.UPLOAD_THREADS)
+
+        return self.upload_pool
+
     def _split_bucket_path(self, url):
         parts = urlsplit(url)
         return parts.netloc, parts.path.lstrip('/')
@@ -43,11 +72,20 @@ class S3Storage(BaseStorage):
         s3_url = self._get_s3_url(target_url)
 
         try:
+            size = os.path.getsize(full_filename)
+
             print('Uploading {0} -> {1}'.format(full_filename, s3_url))
-            with open(full_filename, 'rb') as fh:
+
+            if size <= self.UPLOAD_PART_SIZE:
+                with open(full_filename, 'rb') as fh:
+                    data = fh.read()
+
                 self.s3.put_object(Bucket=self.bucket_name,
                                    Key=target_url,
-                                   Body=fh)
+                                   Body=data,
+                                   ContentMD5=self._get_content_md5(data))
+            else:
+                self.do_multipart_upload(target_url, full_filename, size)
 
             return True
         except Exception as e:
@@ -55,6 +93,104 @@ class S3Storage(BaseStorage):
             print('Failed to Upload to {0}'.format(s3_url))
             return False
 
+    def is_uploaded(self, target_url, full_filename):
+        try:
+            res = self.s3.head_object(Bucket=self.bucket_name,
+                                      Key=target_url)
+
+        except Exception as e:
+            return False
+
+        if res['ContentLength'] != os.path.getsize(full_filename):
+            return False
+
+        etag = self.get_upload_pool().apply(self._get_multipart_etag, (full_filename,))
+        return res['ETag'].strip('"') == etag
+
+    def _get_multipart_etag(self, full_filename):
+        # etag of object streamed in UPLOAD_PART_SIZE parts: md5 of the part md5s
+        part_md5s = []
+
+        with open(full_filename, 'rb') as fh:
+            while True:
+                data = fh.read(self.UPLOAD_PART_SIZE)
+                if not data and part_md5s:
+                    break
+
+                part_md5s.append(hashlib.md5(data).digest())
+
+                if len(data) < self.UPLOAD_PART_SIZE:
+                    break
+
+        return '{0}-{1}'.format(hashlib.md5(b''.join(part_md5s)).hexdigest(), len(part_md5s))
+
+    def _get_content_md5(self, data):
+        # s3 rejects the upload if the data does not match
+        return base64.b64encode(hashlib.md5(data).digest()).decode('utf-8')
+
+    def do_multipart_upload(self, target_url, full_filename, size):
+        resp = self.s3.create_multipart_upload(Bucket=self.bucket_name,
+                                               Key=target_url)
+
+        upload_id = resp['UploadId']
+
+        offsets = range(0, size, self.UPLOAD_PART_SIZE)
+
+        pool = ThreadPool(min(self.UPLOAD_THREADS, len(offsets)))
+
+        try:
+            results = [pool.spawn(self.upload_part, target_url, upload_id,
+                                  full_filename, part_num, offset)
+                       for part_num, offset in enumerate(offsets, 1)]
+
+            parts = [result.get() for result in results]
+
+            self.s3.complete_multipart_upload(Bucket=self.bucket_name,
+                                              Key=target_url,
+                                              UploadId=upload_id,
+                                              MultipartUpload={'Parts': parts})
+
+        except:
+            pool.kill()
+            self.s3.abort_multipart_upload(Bucket=self.bucket_name,
+                                           Key=target_url,
+                                           UploadId=upload_id)
+            raise
+
+        finally:
+            pool.join()
+
+    def upload_part(self, target_url, upload_id, full_filename, part_num, offset, length=None):
+        if length is None:
+            length = self.UPLOAD_PART_SIZE
+
+        with open(full_filename, 'rb') as fh:
+            fh.seek(offset)
+            data = fh.read(length)
+
+        content_md5 = self._get_content_md5(data)
+
+        # retry each part on its own
+        attempt = 0
+        while True:
+            try:
+                resp = self.s3.upload_part(Bucket=self.bucket_name,
+                                           Key=target_url,
+                                           UploadId=upload_id,
+                                           PartNumber=part_num,
+                                           Body=data,
+                                           ContentMD5=content_md5)
+                break
+
+            except Exception as e:
+                attempt += 1
+                if attempt > self.UPLOAD_PART_RETRIES:
+                    raise
+
+                print('Retrying part {0} of {1}: {2}'.format(part_num, target_url, e))
+
+        return {'PartNumber': part_num, 'ETag': resp['ETag']}
+
     def client_url_to_target_url(self, client_url):
         bucket, path = self._split_bucket_path(client_url)
 
@@ -70,3 +206,116 @@ class S3Storage(BaseStorage):
         except Exception as e:
             print(e)
             return False
+
+    def delete_files(self, filenames):
+        # delete in batches with delete_objects, only for urls in this bucket
+        prefix = self._get_s3_url('')
+
+        failed = [filename for filename in filenames
+                  if not filename.startswith(prefix)]
+
+        keys = {}
+        for filename in filenames:
+            if filename.startswith(prefix):
+                keys[filename[len(prefix):]] = filename
+
+        key_list = list(keys.keys())
+
+        for i in range(0, len(key_list), self.DELETE_BATCH_SIZE):
+            batch = key_list[i:i + self.DELETE_BATCH_SIZE]
+
+            print('Deleting Remote {0} files'.format(len(batch)))
+
+            try:
+                resp = self.s3.delete_objects(Bucket=self.bucket_name,
+                                              Delete={'Objects': [{'Key': key} for key in batch],
+                                                      'Quiet': True})
+
+                for error in resp.get('Errors', []):
+                    print('Delete Failed: {0} {1}'.format(error['Key'], error.get('Message')))
+                    failed.append(keys[error['Key']])
+
+            except Exception as e:
+                print(e)
+                failed.extend(keys[key] for key in batch)
+
+        return failed
+
+
+# ============================================================================
+# Multipart upload of a WARC to s3 while it is being written.
+# Full parts are uploaded as the file grows, the remainder
+# when the file is closed, completing the upload.
+class S3StreamingUpload(object):
+    def __init__(self, storage, target_url, full_filename):
+        self.storage = storage
+        self.target_url = target_url
+        self.full_filename = full_filename
+
+        resp = storage.s3.create_multipart_upload(Bucket=storage.bucket_name,
+                                                  Key=target_url)
+
+        self.upload_id = resp['UploadId']
+
+        self.offset = 0
+        self.parts = []
+
+        self.aborted = False
+
+    def _upload_part(self, length):
+        part_num = len(self.parts) + 1
+
+        self.parts.append(self.storage.get_upload_pool().spawn(self._run_upload_part,
+                                                               part_num, self.offset, length))
+
+        self.offset += length
+
+    def _run_upload_part(self, part_num, offset, length):
+        # parts still queued when aborted are not uploaded
+        if self.aborted:
+            raise Exception('Upload aborted')
+
+        return self.storage.upload_part(self.target_url, self.upload_id,
+                                        self.full_filename, part_num,
+                                        offset, length)
+
+    def add_data(self, size):
+        part_size = self.storage.UPLOAD_PART_SIZE
+
+        while size - self.offset >= part_size:
+            self._upload_part(part_size)
+
+    def finish(self, size):
+        try:
+            # last part may be smaller, or empty if only part
+            if size > self.offset or not self.parts:
+                self._upload_part(size - self.offset)
+
+            parts = [result.get() for result in self.parts]
+
+            self.storage.s3.complete_multipart_upload(Bucket=self.storage.bucket_name,
+                                                      Key=self.target_url,
+                                                      UploadId=self.upload_id,
+                                                      MultipartUpload={'Parts': parts})
+
+            return self.storage.get_client_url(self.target_url)
+
+        except Exception as e:
+            print(e)
+            print('Streaming Upload Failed, will upload on commit: ' + self.full_filename)
+            self.abort()
+            return None
+
+    def abort(self):
+        self.aborted = True
+
+        # wait for any parts in progress
+        for result in self.parts:
+            result.wait()
+
+        try:
+            self.storage.s3.abort_multipart_upload(Bucket=self.storage.bucket_name,
+                                                   Key=self.target_url,
+                                                   UploadId=self.upload_id)
+        except Exception as e:
+            print(e)
@@ -1,7 +1,12 @@
 import os
 import redis
+import time
+import gevent
+
+from gevent.pool import Pool
 
 from webrecorder.models.recording import Recording
+from webrecorder.models.stats import Stats
 from webrecorder.models.base import BaseAccess
 
 
@@ -14,29 +19,115 @@ class StorageCommitter(object):
 
         self.all_cdxj_templ = Recording.CDXJ_KEY.format(rec='*')
 
+        self.commit_queue = Recording.COMMIT_QUEUE
+
+        # full scan to reconcile any recordings not in the commit queue
+        self.sweep_secs = int(config['commit_sweep_secs'])
+        self.last_sweep = 0
+
+        # commit leases renewed while commits are in progress
+        self.renew_secs = Recording.COMMIT_LOCK_SECS / 3.0
+
+        self.commit_pool = Pool(int(config['commit_greenlets']))
+
+        self.stats = Stats(self.redis)
+
         print('Storage Committer Started')
         print('Storage Root: ' + os.environ['STORAGE_ROOT'])
 
     def __call__(self):
-        for cdxj_key in self.redis.scan_iter(self.all_cdxj_templ):
-            self.process_cdxj_key(cdxj_key)
+        now = time.time()
+
+        if now - self.last_sweep >= self.sweep_secs:
+            self.last_sweep = now
+
+            # scanned as commits are started
+            recs = (cdxj_key.split(':', 2)[1] for cdxj_key in
+                    self.redis.scan_iter(self.all_cdxj_templ))
+
+            self.run_commits(recs, self.process_cdxj_rec)
+
+        else:
+            recs = self.redis.zrangebyscore(self.commit_queue, '-inf', now)
+
+            self.stats.set_commit_queue_depth(len(recs))
+
+            self.run_commits(recs, self.process_due_rec)
 
         self.redis.publish('close_idle', '')
 
-    def process_cdxj_key(self, cdxj_key):
-        _, rec, _2 = cdxj_key.split(':', 2)
+    def run_commits(self, recs, process_func):
+        # rec -> recording, for commits in progress
+        in_progress = {}
+
+        # started first, spawn() waits while commit_pool is full
+        renew_ge = gevent.spawn(self.renew_commit_locks, in_progress)
+
+        try:
+            for rec in recs:
+                self.commit_pool.spawn(self.run_commit, process_func,
+                                       self.get_recording(rec), in_progress)
 
-        recording = Recording(my_id=rec,
-                              redis=self.redis,
-                              access=BaseAccess())
+            self.commit_pool.join()
 
+        finally:
+            renew_ge.kill()
+
+    def run_commit(self, process_func, recording, in_progress):
+        in_progress[recording.my_id] = recording
+        try:
+            process_func(recording)
+        except Exception as e:
+            print(e)
+        finally:
+            in_progress.pop(recording.my_id, None)
+
+    def renew_commit_locks(self, in_progress):
+        while True:
+            gevent.sleep(self.renew_secs)
+
+            for recording in list(in_progress.values()):
+                recording.renew_commit_lock()
+
+    def get_recording(self, rec):
+        return Recording(my_id=rec,
+                         redis=self.redis,
+                         access=BaseAccess())
+
+    def process_cdxj_rec(self, recording):
         if not recording.is_open(extend=False):
-            recording.commit_to_storage()
+            self.commit(recording)
+
+    def process_due_rec(self, recording):
+        rec = recording.my_id
+
+        # open key may have been extended since scheduled, check again when it expires
+        ttl = self.redis.ttl(Recording.OPEN_REC_KEY.format(rec=rec))
+        if ttl is not None and ttl > 0:
+            recording.schedule_commit(self.redis, time.time() + ttl)
+            return
+
+        cdxj_key = Recording.CDXJ_KEY.format(rec=rec)
+
+        if self.redis.exists(cdxj_key):
+            self.commit(recording)
+
+        # if not yet fully committed or writes still pending,
+        # stays due and is retried on next run
+        if not self.redis.exists(cdxj_key) and recording.get_pending_count() <= 0:
+            self.redis.zrem(self.commit_queue, rec)
+
+    def commit(self, recording):
+        start = time.time()
+
+        if recording.commit_to_storage():
+            self.stats.incr_commit(time.time() - start)
 
 
 # =============================================================================
 if __name__ == "__main__":
+    from gevent import monkey; monkey.patch_all()
+
     from webrecorder.rec.worker import Worker
     Worker(StorageCommitter).run()
 
-
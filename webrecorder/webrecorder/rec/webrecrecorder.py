@@ -8,20 +8,30 @@ from pywb.recorder.filters import WriteRevisitDupePolicy, SkipDupePolicy
 from pywb.recorder.filters import ExcludeHttpOnlyCookieHeaders
 from pywb.recorder.filters import SkipRangeRequestFilter, SkipDefaultFilter
 
-from pywb.indexer.cdxindexer import BaseCDXWriter, CDXJ
+from pywb.indexer.cdxindexer import BaseCDXWriter, CDXJ, write_cdx_index
 
-from pywb.utils.format import res_template
+from pywb.utils.format import res_template, ParamFormatter
 from pywb.utils.io import BUFF_SIZE
 
-from webrecorder.utils import SizeTrackingReader, redis_pipeline
+from webrecorder.utils import SizeTrackingReader, redis_pipeline, get_bool, zadd_lines
 
 from webrecorder.load.wamloader import WAMLoader
 
+from webrecorder.rec.quota import QuotaLeases
+from webrecorder.rec.pending import PendingCounter
+from webrecorder.rec.skipcache import SkipUrlCache
+from webrecorder.rec.dedupbloom import DedupBloomFilter
+
 import webrecorder.rec.storage.storagepaths as storagepaths
 from webrecorder.rec.storage.local import DirectLocalFileStorage
+from webrecorder.rec.storage.s3 import S3Storage, S3StreamingUpload
 
 from webrecorder.models.base import BaseAccess
 from webrecorder.models import Recording, Collection, Stats
+from webrecorder.models.cdxjcodec import CompactRedisIndexSource
+
+from gevent.threadpool import ThreadPool
+from gevent.lock import RLock
 
 import redis
 import json
@@ -29,9 +39,12 @@ import glob
 import tempfile
 import traceback
 import logging
+import time
+import gevent
 
 from bottle import Bottle, request, debug
 from datetime import datetime
+from io import BytesIO
 import os
 from six import iteritems
 from six.moves.urllib.parse import quote
@@ -67,6 +80,8 @@ class WebRecRecorder(object):
 
         self.local_storage = DirectLocalFileStorage()
 
+        self.quota = QuotaLeases(self.redis, config)
+
         self.msg_ge = None
         self.pubsub = None
         self.writer = None
@@ -109,6 +124,8 @@ class WebRecRecorder(object):
             dupe_policy=WriteRevisitDupePolicy(),
             #dupe_policy=SkipDupePolicy(),
 
+            quota=self.quota,
+
             info_keys=self.info_keys.values(),
             rec_info_key_templ=self.info_keys['rec'],
 
@@ -125,6 +142,7 @@ class WebRecRecorder(object):
         writer = SkipCheckingMultiFileWARCWriter(dir_template=self.warc_path_templ,
                                      dedup_index=self.dedup_index,
                                      redis=self.redis,
+                                     quota=self.quota,
                                      key_template=self.info_keys['rec'],
                                      header_filter=ExcludeHttpOnlyCookieHeaders(),
                                      config=self.config)
@@ -140,6 +158,11 @@ class WebRecRecorder(object):
                                    #accept_colls=self.accept_colls,
                                    create_buff_func=writer.create_write_buffer)
 
+        # one write loop per write_pool thread, records for different recordings
+        # are written concurrently, records for same recording in queue order
+        for _ in range(1, writer.write_threads):
+            gevent.spawn(recorder_app._write_loop)
+
         self.recorder = recorder_app
 
     # Messaging ===============
@@ -148,6 +171,7 @@ class WebRecRecorder(object):
 
         self.pubsub.subscribe('close_rec')
         self.pubsub.subscribe('close_idle')
+        self.pubsub.subscribe('skip_url')
 
         self.pubsub.subscribe('handle_delete_file')
         self.pubsub.subscribe('handle_delete_dir')
@@ -168,10 +192,14 @@ class WebRecRecorder(object):
 
             elif item['channel'] == 'close_idle':
                 self.recorder.writer.close_idle_files()
+                self.recorder.writer.quota.release_expired()
 
             elif item['channel'] == 'close_rec':
                 self.recorder.writer.close_key(item['data'])
 
+            elif item['channel'] == 'skip_url':
+                self.recorder.writer.skip_cache.invalidate(item['data'])
+
             elif item['channel'] == 'handle_delete_file':
                 self.handle_delete_file(item['data'])
 
@@ -185,6 +213,9 @@ class WebRecRecorder(object):
         # determine if local file
         filename = storagepaths.strip_prefix(uri)
 
+        # file deleted, don't complete any streaming upload
+        self.recorder.writer.abort_stream_upload(filename)
+
         closed = self.recorder.writer.close_file(filename)
 
         self.local_storage.delete_file(filename)
@@ -244,16 +275,20 @@ class CDXJIndexer(CDXJ, BaseCDXWriter):
 
 
 # ============================================================================
-class WebRecRedisIndexer(WritableRedisIndexer):
+# dedup lookups decode compact index members
+class WebRecRedisIndexer(WritableRedisIndexer, CompactRedisIndexSource):
     def __init__(self, *args, **kwargs):
         super(WebRecRedisIndexer, self).__init__(*args, **kwargs)
 
+        # index lookups resolve keys with this source name, eg. param.recorder.rec
+        self.name = kwargs.get('name', 'recorder')
+
         self.info_keys = kwargs.get('info_keys', [])
         self.rec_info_key_templ = kwargs.get('rec_info_key_templ')
 
         config = kwargs['config']
 
-        self.coll_cdxj_key = Collection.COLL_CDXJ_KEY
+        self.coll_cdxj_gen_key = Collection.COLL_CDXJ_GEN_KEY
         self.rec_file_key_template = Recording.REC_WARC_KEY
 
         self.wam_loader = WAMLoader()
@@ -263,6 +298,15 @@ class WebRecRedisIndexer(WritableRedisIndexer):
 
         self.stats = Stats(self.redis)
 
+        self.quota = kwargs.get('quota')
+
+        self.index_chunk_size = int(config['index_chunk_size'])
+
+        if int(config['dedup_bloom_bits']) > 0:
+            self.dedup_bloom = DedupBloomFilter(self.redis, Recording.DEDUP_BLOOM_KEY, config)
+        else:
+            self.dedup_bloom = None
+
     def add_warc_file(self, full_filename, params):
         base_filename = self._get_rel_or_base_name(full_filename, params)
         file_key = res_template(self.file_key_template, params)
@@ -278,23 +322,37 @@ class WebRecRedisIndexer(WritableRedisIndexer):
         if upload_key:
             stream = SizeTrackingReader(stream, length, self.redis, upload_key)
 
-        params['writer_cls'] = CDXJIndexer
+        base_filename = self._get_rel_or_base_name(filename, params)
+
+        cdxout = BytesIO()
+        write_cdx_index(cdxout, stream, base_filename,
+                        cdxj=True, append_post=True,
+                        writer_cls=CDXJIndexer)
+
+        cdx_list = cdxout.getvalue().rstrip().split(b'\n')
 
-        cdx_list = (super(WebRecRedisIndexer, self).
-                      add_urls_to_index(stream, params, filename, length))
+        z_key = res_template(self.redis_key_template, params)
 
-        # if replay key exists, add to it as well!
-        coll_cdxj_key = res_template(self.coll_cdxj_key, params)
-        if self.redis.exists(coll_cdxj_key):
-            for cdx in cdx_list:
-                if cdx:
-                    self.redis.zadd(coll_cdxj_key, 0, cdx)
+        coll = res_template('{coll}', params)
 
         dt_now = datetime.utcnow()
 
         ts_sec = int(dt_now.timestamp())
 
+        members = self.codec.encode_lines(coll, cdx_list)
+
         with redis_pipeline(self.redis) as pi:
+            if self.dedup_bloom:
+                self.dedup_bloom.add_digests(pi, params, z_key, self.iter_digests(cdx_list))
+
+            zadd_lines(pi, [z_key], members, self.index_chunk_size)
+
+            # collection index kept up to date while built
+            Collection.add_coll_index_lines(pi, coll, members, self.index_chunk_size)
+
+            if cdx_list:
+                pi.incr(res_template(self.coll_cdxj_gen_key, params))
+
             for key_templ in self.info_keys:
                 key = res_template(key_templ, params)
                 pi.hincrby(key, 'size', length)
@@ -303,13 +361,48 @@ class WebRecRedisIndexer(WritableRedisIndexer):
                     if key_templ == self.rec_info_key_templ:
                         pi.hset(key, 'recorded_at', ts_sec)
 
-        self.stats.incr_record(params, length, cdx_list)
+            self.stats.incr_record(params, length, cdx_list, pi=pi)
+
+            # written, no longer reserved
+            quota_reserved = params.pop('quota_reserved', 0)
+            if quota_reserved and self.quota:
+                self.quota.release_written(pi, params, quota_reserved)
 
         return cdx_list
 
+    def iter_digests(self, cdx_list):
+        # only non-revisit records are matched by lookup_revisit()
+        for cdx in cdx_list:
+            if not cdx:
+                continue
+
+            cdx = json.loads(cdx.split(b' ', 2)[2].decode('utf-8'))
+            if cdx.get('mime') != 'warc/revisit' and cdx.get('digest', '-') != '-':
+                yield cdx['digest']
+
+    def lookup_revisit(self, lookup_params, digest, url, iso_dt):
+        # skip index lookup if digest definitely not yet in recording
+        if self.dedup_bloom and digest and digest != '-':
+            params = {}
+            for param in lookup_params:
+                if param.startswith('param.'):
+                    params[param] = lookup_params[param]
+
+            # same recording as index lookup and add_digests()
+            params['_formatter'] = ParamFormatter(params, name=self.name)
+
+            cdxj_key = res_template(self.redis_key_template, params)
+
+            if not self.dedup_bloom.might_contain(params, cdxj_key, digest):
+                return None
+
+        return super(WebRecRedisIndexer, self).lookup_revisit(lookup_params, digest, url, iso_dt)
+
 
 # ============================================================================
 class SkipCheckingMultiFileWARCWriter(MultiFileWARCWriter):
+    WRITE_LOCK_STRIPES = 64
+
     def __init__(self, *args, **kwargs):
         config = kwargs.get('config')
         kwargs['filename_template'] = config['warc_name_templ']
@@ -326,7 +419,36 @@ class SkipCheckingMultiFileWARCWriter(MultiFileWARCWriter):
         self.open_rec_key = config['open_rec_key_templ']
         self.open_rec_ttl = kwargs['max_idle_secs']
 
-        self.user_key = config['info_key_templ']['user']
+        # check (and extend) open recordings at most every open_rec_check_secs,
+        # well within the open key ttl
+        self.open_rec_check_secs = min(int(config['open_rec_check_secs']),
+                                       self.open_rec_ttl / 2)
+
+        # dir key -> (next open check time, reserved quota key)
+        self.open_recs = {}
+
+        self.quota = kwargs.get('quota') or QuotaLeases(self.redis, config)
+
+        self.pending = PendingCounter(self.redis, config)
+
+        self.skip_cache = SkipUrlCache(self.redis, config)
+
+        # native threads for digesting and compressing records
+        self.write_threads = int(config['write_pool_threads'])
+        self.write_pool = ThreadPool(self.write_threads) if self.write_threads > 0 else None
+        self.write_pool_min_size = int(config['write_pool_min_size'])
+
+        # held while writing to or closing a recording's open warc,
+        # locks are striped by dir key
+        self.write_locks = [RLock() for _ in range(self.WRITE_LOCK_STRIPES)]
+
+        # optionally upload warcs to s3 while recording, committed on close
+        self.stream_storage = None
+        if get_bool(config.get('stream_warcs_to_storage')) and Collection.DEFAULT_STORE_TYPE == 's3':
+            self.stream_storage = S3Storage()
+
+        # local filename -> S3StreamingUpload
+        self.stream_uploads = {}
 
     def create_write_buffer(self, params, name):
         rec_id = params.get('param.recorder.rec') or params.get('param.rec')
@@ -336,7 +458,10 @@ class SkipCheckingMultiFileWARCWriter(MultiFileWARCWriter):
 
         params['recording'] = recording
 
-        return TempWriteBuffer(recording, name, params['url'])
+        # only track pending size if open when buffer is created
+        pending = self.pending if self.is_rec_open(params) else None
+
+        return TempWriteBuffer(recording, name, params['url'], pending)
 
     def write_stream_to_file(self, params, stream):
         upload_id = params.get('param.upid')
@@ -352,16 +477,187 @@ class SkipCheckingMultiFileWARCWriter(MultiFileWARCWriter):
 
         return self._write_to_file(params, write_callback)
 
-    def _is_write_resp(self, resp, params):
+    def run_in_pool(self, func, *args):
+        # ThreadPool len() is number of running tasks, check for None
+        if self.write_pool is None:
+            return func(*args)
+
+        return self.write_pool.apply(func, args)
+
+    def run_for_record(self, record, func, *args):
+        # small records are faster to process directly in the gevent loop
+        if record.length is not None and record.length < self.write_pool_min_size:
+            return func(*args)
+
+        return self.run_in_pool(func, *args)
+
+    def get_write_lock(self, dir_key):
+        if isinstance(dir_key, dict):
+            dir_key = self.get_dir_key(dir_key)
+
+        return self.write_locks[hash(dir_key) % len(self.write_locks)]
+
+    def _do_write_req_resp(self, req, resp, params):
+        # dedup lookup and write for same recording in order
+        with self.get_write_lock(params):
+            return self._write_req_resp_locked(req, resp, params)
+
+    def _write_req_resp_locked(self, req, resp, params):
+        try:
+            self._copy_header(resp, req, 'WARC-Source-URI')
+            self._copy_header(resp, req, 'WARC-Creation-Date')
+
+            # payload digest needed for dedup, computed off the gevent loop
+            self.run_for_record(resp, self.ensure_digest, resp, False, True)
+
+            resp = self._check_revisit(resp, params)
+            if not resp:
+                return
+
+            if not self._is_write_resp(resp, params):
+                return
+
+            if not req or not self._is_write_req(req, params):
+                req = None
+
+            # digest, gzip and write directly to the open warc, off the gevent loop
+            def write_callback(out, filename):
+                self.run_for_record(resp, self._write_records, out, resp, req)
+
+            return self._write_to_file(params, write_callback)
+
+        finally:
+            # if not indexed, return reserved quota to the lease
+            quota_reserved = params.pop('quota_reserved', 0)
+            if quota_reserved:
+                self.quota.refund(params, quota_reserved)
+
+    def _open_file(self, filename, params):
+        fh = super(SkipCheckingMultiFileWARCWriter, self)._open_file(filename, params)
+
+        if self.stream_storage:
+            self.start_stream_upload(filename, params)
+
+        return fh
+
+    def _write_to_file(self, params, write_callback):
+        with self.get_write_lock(params):
+            return self._write_to_file_locked(params, write_callback)
+
+    def _write_to_file_locked(self, params, write_callback):
+        res = super(SkipCheckingMultiFileWARCWriter, self)._write_to_file(params, write_callback)
+
+        # upload any new full parts, if still open
+        if self.stream_uploads:
+            result = self.fh_cache.get(self.get_dir_key(params))
+            upload = self.stream_uploads.get(result[1]) if result else None
+            if upload:
+                upload.add_data(os.path.getsize(upload.full_filename))
+
+        return res
+
+    def _close_file(self, fh):
+        upload = self.stream_uploads.pop(fh.name, None)
+
+        res = super(SkipCheckingMultiFileWARCWriter, self)._close_file(fh)
+
+        # on rollover or close, upload last part and complete
+        if upload:
+            gevent.spawn(self.finish_stream_upload, upload)
+
+        return res
+
+    def start_stream_upload(self, filename, params):
+        try:
+            collection = Collection(my_id=params['param.recorder.coll'],
+                                    redis=self.redis,
+                                    access=BaseAccess())
+
+            # not committed to storage
+            if collection.get_owner().is_anon():
+                return
+
+            # same target as when committing to storage
+            target_url = self.stream_storage.get_target_url(collection, 'warcs',
+                                                            os.path.basename(filename))
+
+            upload = S3StreamingUpload(self.stream_storage, target_url, filename)
+            upload.rec = params['param.recorder.rec']
+
+            self.stream_uploads[filename] = upload
+
+        except Exception as e:
+            traceback.print_exc()
+
+    def abort_stream_upload(self, filename):
+        upload = self.stream_uploads.pop(filename, None)
+        if upload:
+            gevent.spawn(upload.abort)
+
+    def finish_stream_upload(self, upload):
+        try:
+            size = os.path.getsize(upload.full_filename)
+        except OSError:
+            upload.abort()
+            return
+
+        remote_url = upload.finish(size)
+
+        # track to delete if recording deleted before commit
+        if remote_url:
+            streamed_key = Recording.STREAMED_WARC_KEY.format(rec=upload.rec)
+            self.redis.hset(streamed_key, os.path.basename(upload.full_filename), remote_url)
+
+    def close(self):
+        super(SkipCheckingMultiFileWARCWriter, self).close()
+
+        if self.write_pool is not None:
+            self.write_pool.kill()
+
+    def _write_records(self, out, resp, req):
+        # runs in write_pool for large records
+        self._write_warc_record(out, resp)
+
+        if req:
+            self._write_warc_record(out, req)
+
+    def close_key(self, dir_key):
+        # wait for any write in progress to the open warc
+        with self.get_write_lock(dir_key):
+            if not isinstance(dir_key, dict):
+                self.close_open_rec(dir_key)
+
+            return super(SkipCheckingMultiFileWARCWriter, self).close_key(dir_key)
+
+    def close_open_rec(self, dir_key):
+        result = self.open_recs.pop(dir_key, None)
+        if not result:
+            return
+
+        reserved_key = result[1]
+        if not any(key == reserved_key for _, key in self.open_recs.values()):
+            self.quota.release(reserved_key)
+
+    def is_rec_open(self, params):
+        dir_key = self.get_dir_key(params)
+
+        now = time.time()
+        result = self.open_recs.get(dir_key)
+        if result and result[0] > now:
+            return True
+
         if not params['recording'].is_open():
-            logging.debug('Writing skipped, recording not open for write')
+            self.close_open_rec(dir_key)
             return False
 
-        user_key = res_template(self.user_key, params)
-        size, max_size = self.redis.hmget(user_key, ['size', 'max_size'])
+        self.open_recs[dir_key] = (now + self.open_rec_check_secs,
+                                   self.quota.get_reserved_key(params))
+        return True
 
-        size = int(size or 0)
-        max_size = int(max_size or 0)
+    def _is_write_resp(self, resp, params):
+        if not self.is_rec_open(params):
+            logging.debug('Writing skipped, recording not open for write')
+            return False
 
         length = resp.length or resp.rec_headers.get_header('Content-Length')
         if length is None:
@@ -369,10 +665,13 @@ class SkipCheckingMultiFileWARCWriter(MultiFileWARCWriter):
             resp.length = resp.payload_length
             length = resp.length
 
-        if size + length > max_size:
+        length = int(length)
+
+        if not self.quota.reserve(params, length):
             print('New Record for {0} exceeds max size, not recording!'.format(params['url']))
             return False
 
+        params['quota_reserved'] = length
         return True
 
     def _is_write_req(self, req, params):
@@ -381,7 +680,7 @@ class SkipCheckingMultiFileWARCWriter(MultiFileWARCWriter):
 
         skip_key = res_template(self.skip_key_template, params)
 
-        if self.redis.get(skip_key) == '1':
+        if self.skip_cache.is_skipped(skip_key):
             print('SKIPPING REQ', params.get('url'))
             return False
 
@@ -390,12 +689,14 @@ class SkipCheckingMultiFileWARCWriter(MultiFileWARCWriter):
 
 # ============================================================================
 class TempWriteBuffer(tempfile.SpooledTemporaryFile):
-    def __init__(self, recording, class_name, url):
+    def __init__(self, recording, class_name, url, pending=None):
         super(TempWriteBuffer, self).__init__(max_size=512*1024)
         self.recording = recording
         self.class_name = class_name
 
-        self.recording.inc_pending_count()
+        self.pending = pending
+        if self.pending:
+            self.pending.incr(self.recording, count=1)
 
         self._wsize = 0
 
@@ -404,7 +705,8 @@ class TempWriteBuffer(tempfile.SpooledTemporaryFile):
         length = len(buff)
         self._wsize += length
 
-        self.recording.inc_pending_size(length)
+        if self.pending:
+            self.pending.incr(self.recording, size=length)
 
     def close(self):
         try:
@@ -412,6 +714,7 @@ class TempWriteBuffer(tempfile.SpooledTemporaryFile):
         except:
             traceback.print_exc()
 
-        self.recording.dec_pending_count_and_size(self._wsize)
+        if self.pending:
+            self.pending.incr(self.recording, count=-1, size=-self._wsize)
 
 
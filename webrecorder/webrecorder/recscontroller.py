@@ -135,13 +135,12 @@ class RecsController(BaseController):
             return {'page_id': page_id}
 
         @self.app.get('/api/v1/recording/<rec>/pages')
-        @self.api(query=['user', 'coll'],
+        @self.api(query=['user', 'coll', 'cursor', 'limit'],
                   resp='pages')
         def list_pages(rec):
             user, collection, recording = self.load_recording(rec)
 
-            pages = collection.list_rec_pages(recording)
-            return {'pages': pages}
+            return self.get_pages_range(collection, recording)
 
         @self.app.get('/api/v1/recording/<rec>/num_pages')
         @self.api(query=['user', 'coll'],
@@ -149,7 +148,7 @@ class RecsController(BaseController):
         def get_num_pages(rec):
             user, collection, recording = self.load_recording(rec)
 
-            return {'count': recording.count_pages() }
+            return {'count': collection.count_rec_pages(recording)}
 
         @self.app.delete('/api/v1/recording/<rec>/pages')
         @self.api(query=['user', 'coll'],
@@ -8,6 +8,7 @@ import logging
 import datetime
 import os
 import base64
+import zlib
 
 
 # ============================================================================
@@ -52,6 +53,12 @@ def init_props(config):
     import webrecorder.rec.storage.storagepaths as storagepaths
     storagepaths.init_props(config)
 
+    from webrecorder.rec.storage.s3 import S3Storage
+    S3Storage.init_props(config)
+
+    from webrecorder.models.cdxjcodec import CDXJCodec
+    CDXJCodec.init_props(config)
+
 
 # ============================================================================
 def get_new_id(max_len=None, size=10):
@@ -116,6 +123,74 @@ def spawn_once(*args, **kwargs):
         gevent.spawn(*args, **kwargs)
 
 
+# ============================================================================
+def get_record_host(record_hosts, rec, patch_rec=None):
+    # RECORD_HOST may list several recorder shards, comma-separated
+    # each recording is always routed to the same shard
+    # extract with a patch recording may write to either recording, and is routed
+    # by the patch recording, to the same shard as patch requests to it
+    rec = patch_rec or rec
+
+    if len(record_hosts) == 1 or not rec:
+        return record_hosts[0]
+
+    shard = zlib.crc32(rec.encode('utf-8')) % len(record_hosts)
+    return record_hosts[shard]
+
+
+# ============================================================================
+def iter_lines(stream, block_size=65536):
+    # non-empty lines from a stream, read in blocks
+    # without loading the full stream into memory
+    buff = b''
+
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+
+        lines = (buff + block).split(b'\n')
+        buff = lines.pop()
+
+        for line in lines:
+            if line:
+                yield line
+
+    if buff:
+        yield buff
+
+
+# ============================================================================
+def zadd_lines(pi, keys, lines, chunk_size):
+    # add non-empty lines to each sorted set in keys, up to chunk_size lines
+    # per ZADD, executing the pipeline after each full chunk
+    count = 0
+    zadd_args = []
+
+    for line in lines:
+        if not line:
+            continue
+
+        zadd_args.append(0)
+        zadd_args.append(line)
+
+        if len(zadd_args) >= chunk_size * 2:
+            for key in keys:
+                pi.zadd(key, *zadd_args)
+
+            pi.execute()
+            count += len(zadd_args) // 2
+            zadd_args = []
+
+    if zadd_args:
+        for key in keys:
+            pi.zadd(key, *zadd_args)
+
+        count += len(zadd_args) // 2
+
+    return count
+
+
 # ============================================================================
 @contextmanager
 def redis_pipeline(redis_obj):
@@ -118,6 +118,9 @@ class BaseWebSockHandler(object):
         self.content_app = websock_controller.content_app
         self.access = websock_controller.access
 
+        # objects kept for the life of the socket, read props from redis as needed
+        self.access.identity_map = None
+
         self.dyn_stats = websock_controller.dyn_stats
 
         self.sesh_id = sesh_id